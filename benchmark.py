@@ -0,0 +1,563 @@
+"""Benchmark the hot paths of the game engine on a fixed corpus of positions.
+
+Every benchmark runs one engine function over the same seeded mid-game
+positions for board sizes 3 to 9 and reports its speed in operations per
+second, its latency percentiles and the peak memory it allocates. Results can
+be saved as a baseline and later runs compared against it, failing when a
+benchmark gets slower than the threshold allows.
+
+Example:
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import fastcore
+import xogame
+from xogame import (BitBoard, CUTOFF_DEPTH, EndgameSolver, MoveOrdering, RootSearchPool,
+                    SearchLimits, TranspositionTable, actions, alpha_beta_search,
+                    check_draw, check_win, evaluate_board, forced_move,
+                    parallel_alpha_beta_search, player, result, terminal, to_board)
+
+# Version of the saved results: their layout and what the benchmarks measure
+BENCHMARK_VERSION = 2
+
+# Depth of the `alpha_beta_search` benchmark, by board size
+SEARCH_DEPTH = {3: 9, 4: 4, 5: 4, 6: 3, 7: 3, 8: 3, 9: 3}
+
+# Board size and depth of the parallel search benchmark
+PARALLEL_SIZE = 7
+PARALLEL_DEPTH = 5
+
+# The most rounds of measurements over the positions of a benchmark
+SAMPLES = 50
+
+# The primitives compared by the allocation benchmark
+ALLOCATION_FUNCTIONS = ('check_win', 'check_draw', 'player', 'actions', 'terminal',
+                        'evaluate_board')
+
+
+def build_corpus(sizes=range(3, 10), positions=16, seed=0):
+    """Build a reproducible corpus of mid-game positions.
+
+    Positions are reached by random moves from the empty board, for between
+    a quarter and a half of the cells, and are never finished games.
+
+    Args:
+        sizes (iterable): The board sizes of the corpus.
+        positions (int): The number of positions of every size.
+        seed (int): The seed of the random moves.
+
+    Returns:
+        dict: Maps every size to a list of `BitBoard` positions.
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for size in sizes:
+        states = []
+        while len(states) < positions:
+            state = BitBoard(size)
+            plies = rng.randint(size * size // 4, size * size // 2)
+            for _ in range(plies):
+                state.make(rng.choice(actions(state, player(state))))
+                if terminal(state):
+                    break
+            if not terminal(state):
+                states.append(state)
+        corpus[size] = states
+    return corpus
+
+
+def benchmark_functions(representation='bitboard'):
+    """Return the benchmarks, by name, as functions of one position.
+
+    Args:
+        representation (str): 'bitboard' to run the functions on `BitBoard`s
+            or 'list' to run them on 2D arrays.
+
+    Returns:
+        dict: Maps every benchmark name to a function taking a position and
+        its first legal move.
+    """
+    def search(state, move):
+        # The endgame solver keeps its results across calls, so it is left out
+        limits = SearchLimits(max_depth=SEARCH_DEPTH.get(state.size, 3))
+        return alpha_beta_search(state, TranspositionTable(1), limits, MoveOrdering(),
+                                 endgame=False)
+
+    functions = {
+        'check_win': lambda state, move: check_win(state, 'X'),
+        'check_draw': lambda state, move: check_draw(state),
+        'player': lambda state, move: player(state),
+        'actions': lambda state, move: actions(state, 'X'),
+        'result': lambda state, move: result(state, move),
+        'evaluate_board': lambda state, move: evaluate_board(state, 'X'),
+        'alpha_beta_search': search,
+    }
+    if representation == 'list':
+        # The search converts 2D arrays once at the root; its benchmark is the same
+        del functions['alpha_beta_search']
+    return functions
+
+
+def percentile(values, fraction):
+    """Return the `fraction` percentile of sorted values, by nearest rank."""
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def run_benchmark(function, positions, min_time=0.2):
+    """Time a function over positions.
+
+    Every measurement repeats the call on one position for at least 100
+    microseconds, so that even the fastest functions are timed precisely, and
+    gives one latency sample. Rounds over all the positions are run until
+    about `min_time` seconds are spent, up to `SAMPLES` rounds. Peak memory is
+    measured in a separate pass, since tracing allocations slows every call
+    down.
+
+    Args:
+        function (function): The benchmark, see `benchmark_functions`.
+        positions (list): The positions to run it on.
+        min_time (float): The approximate total time of the samples in seconds.
+
+    Returns:
+        dict: The number of calls, operations per second, the 50th, 90th and
+        99th percentile and the maximum latency of a call in microseconds,
+        and the peak memory allocated by one pass over the positions in bytes.
+    """
+    arguments = [(state, actions(state, player(state))[0]) for state in positions]
+    clock = time.perf_counter
+
+    # Calibrate the repetitions of a measurement and the number of rounds
+    start = clock()
+    for state, move in arguments:
+        function(state, move)
+    elapsed = clock() - start
+    repeat = max(1, int(1e-4 * len(arguments) / max(elapsed, 1e-9)))
+    rounds = max(1, min(SAMPLES, int(min_time / max(elapsed * repeat, 1e-9))))
+
+    latencies = []
+    calls = 0
+    total = 0.0
+    for _ in range(rounds):
+        for state, move in arguments:
+            start = clock()
+            for _ in range(repeat):
+                function(state, move)
+            elapsed = clock() - start
+            calls += repeat
+            total += elapsed
+            latencies.append(elapsed / repeat * 1e6)
+    latencies.sort()
+
+    tracemalloc.start()
+    for state, move in arguments:
+        function(state, move)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'calls': calls,
+        'ops_per_sec': calls / total if total else 0.0,
+        'p50_us': percentile(latencies, 0.50),
+        'p90_us': percentile(latencies, 0.90),
+        'p99_us': percentile(latencies, 0.99),
+        'max_us': latencies[-1],
+        'peak_bytes': peak,
+    }
+
+
+def run_suite(sizes=range(3, 10), positions=16, seed=0, names=None, representation='bitboard',
+              min_time=0.2, progress=None):
+    """Run the benchmarks over the corpus of every board size.
+
+    Args:
+        sizes (iterable): The board sizes to benchmark.
+        positions (int): The number of positions of every size.
+        seed (int): The seed of the corpus, see `build_corpus`.
+        names (list): The benchmarks to run. Defaults to all of them.
+        representation (str): 'bitboard' or 'list', see `benchmark_functions`.
+        min_time (float): The time of every benchmark, see `run_benchmark`.
+        progress (function): Optional function called with the name, the size
+            and the results of every benchmark as it finishes.
+
+    Returns:
+        dict: The settings of the run and the results, keyed by
+        '<benchmark>/<size>'.
+    """
+    corpus = build_corpus(sizes, positions, seed)
+    functions = benchmark_functions(representation)
+    names = [name for name in names or functions if name in functions]
+
+    results = {}
+    for name in names:
+        for size, states in corpus.items():
+            if representation == 'list':
+                states = [to_board(state) for state in states]
+            stats = run_benchmark(functions[name], states, min_time)
+            results[f'{name}/{size}'] = stats
+            if progress is not None:
+                progress(name, size, stats)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'positions': positions,
+        'representation': representation,
+        'results': results,
+    }
+
+
+def allocations_per_call(function, positions):
+    """Measure the memory a function allocates while it runs.
+
+    Pure-Python integers and the result the function returns are allocated
+    too, so even an allocation-free function shows a few dozen bytes.
+
+    Args:
+        function (function): A function of one position.
+        positions (list): The positions to call it on.
+
+    Returns:
+        float: The peak memory allocated by one call, above what was
+        allocated before it, in bytes, averaged over the positions.
+    """
+    function(positions[0])
+    total = 0
+    tracemalloc.start()
+    for state in positions:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(state)
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / len(positions)
+
+
+def allocation_report(sizes=range(3, 10), positions=16, seed=0):
+    """Compare the memory the primitives of `xogame` and `fastcore` allocate.
+
+    Every primitive of `ALLOCATION_FUNCTIONS` is measured on the corpus, on
+    2D arrays and on `BitBoard`s, along with 'node': the `terminal`,
+    `player`, `actions` and `evaluate_board` calls the search makes at every
+    node it visits.
+
+    Args:
+        sizes (iterable): The board sizes to measure.
+        positions (int): The number of positions of every size.
+        seed (int): The seed of the corpus, see `build_corpus`.
+
+    Returns:
+        list: For every function, representation and size, the bytes one call
+        allocates with `xogame` and with `fastcore`, as tuples.
+    """
+    def calls(module):
+        functions = {
+            'check_win': lambda state: module.check_win(state, 'X'),
+            'check_draw': lambda state: module.check_draw(state),
+            'player': lambda state: module.player(state),
+            'actions': lambda state: module.actions(state, 'X'),
+            'terminal': lambda state: module.terminal(state),
+            'evaluate_board': lambda state: module.evaluate_board(state, 'X'),
+        }
+
+        def node(state):
+            if not module.terminal(state):
+                module.actions(state, module.player(state))
+                module.evaluate_board(state, 'X')
+
+        functions['node'] = node
+        return functions
+
+    before, after = calls(xogame), calls(fastcore)
+    corpus = build_corpus(sizes, positions, seed)
+    rows = []
+    for name in ALLOCATION_FUNCTIONS + ('node',):
+        for representation in ('list', 'bitboard'):
+            for size, states in corpus.items():
+                if representation == 'list':
+                    states = [to_board(state) for state in states]
+                rows.append((name, representation, size,
+                             allocations_per_call(before[name], states),
+                             allocations_per_call(after[name], states)))
+    return rows
+
+
+def endgame_positions(size, empty, positions=8, seed=0):
+    """Build random positions with a given number of empty cells.
+
+    Positions where threats force the move are left out, since neither the
+    solver nor the search is used for them.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        empty (int): The number of empty cells of the positions.
+        positions (int): The number of positions to build.
+        seed (int): The seed of the random moves.
+
+    Returns:
+        list: Up to `positions` `BitBoard` positions; fewer if random games
+        seldom last that long.
+    """
+    rng = random.Random(seed * 1000 + empty)
+    states = []
+    for _ in range(100 * positions):
+        if len(states) == positions:
+            break
+        state = BitBoard(size)
+        while not terminal(state) and (state.full & ~state.occupied()).bit_count() > empty:
+            state.make(rng.choice(actions(state, player(state))))
+        if not terminal(state) and forced_move(state) is None:
+            states.append(state)
+    return states
+
+
+def endgame_crossover(size, positions=8, seed=0, max_empty=None, progress=None):
+    """Find the most empty cells for which solving exactly is faster than searching.
+
+    For every number of empty cells, from a few up, the 90th percentile time
+    of `EndgameSolver.solve`, starting with an empty cache, is compared with
+    that of `alpha_beta_search` cut off at `CUTOFF_DEPTH` with the heuristic,
+    on the same random positions. Most random positions are easy to solve, so
+    the slow ones decide. Measuring stops at the first number of empty cells
+    for which the solver is slower.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        positions (int): The number of positions per number of empty cells.
+        seed (int): The seed of the positions.
+        max_empty (int): The most empty cells to measure. Defaults to all of
+            the board.
+        progress (function): Optional function called with every measurement
+            as it finishes.
+
+    Returns:
+        tuple: The crossover, the largest number of empty cells up to which
+        the solver is always faster, 0 if it is slower from the start, and
+        the measurements as (empty cells, solver ms, search ms) tuples.
+    """
+    clock = time.perf_counter
+    rows = []
+    crossover = 0
+    for empty in range(2, (max_empty or size * size) + 1):
+        states = endgame_positions(size, empty, positions, seed)
+        if not states:
+            continue
+        solve_ms = []
+        search_ms = []
+        for state in states:
+            start = clock()
+            EndgameSolver(size).solve(state)
+            solve_ms.append((clock() - start) * 1000)
+            start = clock()
+            alpha_beta_search(state, TranspositionTable(1), SearchLimits(max_depth=CUTOFF_DEPTH),
+                              MoveOrdering(), endgame=False)
+            search_ms.append((clock() - start) * 1000)
+        solve_ms.sort()
+        search_ms.sort()
+        row = (empty, percentile(solve_ms, 0.9), percentile(search_ms, 0.9))
+        rows.append(row)
+        if progress is not None:
+            progress(*row)
+        if row[1] > row[2]:
+            break
+        crossover = empty
+    return crossover, rows
+
+
+def parallel_speedup(size=PARALLEL_SIZE, depth=PARALLEL_DEPTH, workers=None, seed=0,
+                     progress=None):
+    """Time `parallel_alpha_beta_search` against the serial search.
+
+    Both search the same mid-game position with no symmetry, reached by
+    `size` random moves, to the same depth.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        depth (int): The depth at which the searches are cut off.
+        workers (list): The numbers of worker processes to try. Defaults to
+            1, 2, 4, ... up to the number of CPU cores.
+        seed (int): The seed of the random opening moves of the position.
+        progress (function): Optional function called with every measurement
+            as it finishes.
+
+    Returns:
+        list: The measurements as (workers, seconds, result) tuples, the
+        serial search first with 0 workers.
+    """
+    if workers is None:
+        cores = os.cpu_count()
+        workers = [1 << i for i in range(cores.bit_length()) if 1 << i < cores] + [cores]
+
+    rng = random.Random(seed)
+    state = BitBoard(size)
+    while state.occupied().bit_count() < size:
+        state.make(rng.choice(actions(state, player(state))))
+
+    clock = time.perf_counter
+    start = clock()
+    serial = alpha_beta_search(state, limits=SearchLimits(max_depth=depth))
+    rows = [(0, clock() - start, serial)]
+    if progress is not None:
+        progress(*rows[-1])
+    for count in workers:
+        with RootSearchPool(count) as pool:
+            start = clock()
+            parallel = parallel_alpha_beta_search(state, depth, pool)
+            rows.append((count, clock() - start, parallel))
+        if progress is not None:
+            progress(*rows[-1])
+    return rows
+
+
+def compare(baseline, current, threshold=0.10):
+    """Compare a run against a baseline.
+
+    Args:
+        baseline (dict): The saved results of an earlier run.
+        current (dict): The results of this run.
+        threshold (float): The fraction of operations per second a benchmark
+            may lose before it counts as a regression.
+
+    Returns:
+        list: For every benchmark of both runs, its key, the baseline and
+        current operations per second, their ratio and whether it regressed,
+        as tuples.
+    """
+    rows = []
+    for key, stats in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        ratio = stats['ops_per_sec'] / before['ops_per_sec'] if before['ops_per_sec'] else 0.0
+        rows.append((key, before['ops_per_sec'], stats['ops_per_sec'], ratio,
+                     ratio < 1 - threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help="board sizes to benchmark (default: 3 to 9, or "
+                             f"{PARALLEL_SIZE} with --parallel)")
+    parser.add_argument('--positions', type=int, default=16,
+                        help="positions of every size in the corpus")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the corpus")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(benchmark_functions()),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument('--representation', choices=('bitboard', 'list'), default='bitboard',
+                        help="run the functions on bitboards or on 2D arrays")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="approximate seconds spent timing every benchmark")
+    parser.add_argument('--save', help="JSON file to save the results to")
+    parser.add_argument('--compare', help="JSON file of baseline results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="slowdown that fails the comparison (default: 0.10)")
+    parser.add_argument('--crossover', action='store_true',
+                        help="measure the number of empty cells below which the endgame "
+                             "solver is faster than the heuristic search, instead")
+    parser.add_argument('--allocations', action='store_true',
+                        help="compare the memory allocated by the primitives of xogame "
+                             "and fastcore, instead")
+    parser.add_argument('--parallel', action='store_true',
+                        help="measure the speedup of the parallel search over the serial "
+                             "one, instead")
+    parser.add_argument('--depth', type=int, default=PARALLEL_DEPTH,
+                        help=f"depth of the parallel search benchmark (default: {PARALLEL_DEPTH})")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help="worker counts of the parallel search benchmark "
+                             "(default: 1, 2, 4, ... up to the number of cores)")
+    args = parser.parse_args(argv)
+
+    if args.parallel:
+        for size in args.sizes or [PARALLEL_SIZE]:
+            print(f"{size}x{size} depth {args.depth}:")
+            serial = []
+
+            def progress(workers, seconds, result):
+                if not serial:
+                    serial.extend((seconds, result))
+                    print(f"{'serial':>11}: {seconds:.2f}s {result}", flush=True)
+                    return
+                move = 'same move' if result == serial[1] else 'DIFFERENT ' + str(result)
+                print(f"{workers:3d} workers: {seconds:.2f}s speedup "
+                      f"{serial[0] / seconds:.2f}x {move}", flush=True)
+
+            parallel_speedup(size, args.depth, args.workers, args.seed, progress)
+        return 0
+    args.sizes = args.sizes or list(range(3, 10))
+
+    if args.allocations:
+        print(f"{'function':>24} {'xogame B':>10} {'fastcore B':>10}")
+        for name, representation, size, before, after in allocation_report(
+                args.sizes, args.positions, args.seed):
+            key = f"{name}/{representation}/{size}"
+            print(f"{key:>24} {before:10.0f} {after:10.0f}", flush=True)
+        return 0
+
+    if args.crossover:
+        crossovers = {}
+        for size in args.sizes:
+            print(f"{size}x{size}: {'empty':>5} {'p90 solve ms':>14} {'p90 search ms':>14}")
+
+            def progress(empty, solve_ms, search_ms):
+                print(f"{'':>5} {empty:>5} {solve_ms:14.2f} {search_ms:14.2f}", flush=True)
+
+            crossover, _ = endgame_crossover(size, args.positions, args.seed, progress=progress)
+            crossovers[size] = crossover
+            print(f"  solve exactly with {crossover} empty cells or fewer")
+        print(f"ENDGAME_CELLS = {crossovers}")
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get('version') != BENCHMARK_VERSION:
+            parser.error(f"{args.compare} was saved by another version of the benchmarks")
+        if (baseline['seed'], baseline['positions'], baseline['representation']) \
+                != (args.seed, args.positions, args.representation):
+            parser.error(f"{args.compare} was run on another corpus")
+
+    print(f"{'benchmark':>24} {'ops/sec':>12} {'p50 us':>10} {'p90 us':>10} "
+          f"{'p99 us':>10} {'peak KB':>9}")
+
+    def progress(name, size, stats):
+        print(f"{name + '/' + str(size):>24} {stats['ops_per_sec']:12.0f} "
+              f"{stats['p50_us']:10.2f} {stats['p90_us']:10.2f} {stats['p99_us']:10.2f} "
+              f"{stats['peak_bytes'] / 1024:9.1f}", flush=True)
+
+    current = run_suite(args.sizes, args.positions, args.seed, args.benchmarks,
+                        args.representation, args.min_time, progress)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if baseline is not None:
+        rows = compare(baseline, current, args.threshold)
+        regressions = [row for row in rows if row[4]]
+        print(f"\nCompared with {args.compare}:")
+        for key, before, after, ratio, regressed in rows:
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{key:>24} {before:12.0f} -> {after:12.0f} ({ratio - 1:+.1%}){flag}")
+        if regressions:
+            print(f"{len(regressions)} benchmarks are more than {args.threshold:.0%} slower")
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,497 @@
+"""The game engine as a library: reusable searchers with pluggable evaluators.
+
+A `Searcher` owns everything a search needs for one board size and win
+length: its depth and budgets, its evaluator and the line score table built
+from it, its transposition table, move ordering, optional position cache and
+statistics, and its endgame solver. They are set up once and kept warm from
+one search to the next, so a service embedding the engine keeps one searcher
+per board size instead of paying the setup on every move.
+
+Positions are valued at the cut-off depth by an `Evaluator`. The default
+`LineEvaluator` scores lines as `evaluate_board` does, with weights that can
+be changed, and `OpenLineEvaluator` with a weight for every number of symbols
+on a line; any other heuristic can be plugged in by subclassing `Evaluator`.
+
+`GameState` is a game in progress, a `BitBoard` and the moves played on it,
+with `make` and `unmake` to play and take back moves.
+
+Example:
+    searcher = Searcher(size=4, time_ms=500)
+    game = searcher.new_game()
+    while not game.is_over():
+        value, move = searcher.search(game)
+        game.make(move)
+"""
+import functools
+
+from xogame import (ASPIRATION_WINDOW, CUTOFF_DEPTH, LINE_WEIGHTS, THREAT_BASE, WIN_VALUE,
+                    BitBoard, EndgameSolver, MoveOrdering, SearchLimits, SearchStats,
+                    TranspositionTable, actions, alpha_beta_search, cell_lines, cell_moves,
+                    center_weights, iterative_deepening_search, line_masks, line_scores,
+                    player, symmetric_zobrist_keys, symmetries, terminal, to_bitboard)
+
+
+# -------------------------------------------------------------------------------
+# Game state.
+# -------------------------------------------------------------------------------
+class GameState:
+    """A game in progress: its board and the moves played on it.
+
+    Attributes:
+        board (BitBoard): The current game board.
+        history (list): The moves played with `make` and not taken back, in
+            order, as (row, col).
+    """
+
+    __slots__ = ('board', 'history')
+
+    def __init__(self, size=3, win_length=None, board=None):
+        """
+        Args:
+            size (int): The dimension of the 2D game board.
+            win_length (int): The number of symbols in a row needed to win.
+                Defaults to the size of the board.
+            board (2D array or BitBoard): An optional position to start from
+                instead of the empty board. It is copied.
+        """
+        if board is None:
+            self.board = BitBoard(size, win_length=win_length)
+        else:
+            self.board = to_bitboard(board, win_length)
+        self.history = []
+
+    @property
+    def size(self):
+        """The dimension of the 2D game board."""
+        return self.board.size
+
+    @property
+    def win_length(self):
+        """The number of symbols in a row needed to win."""
+        return self.board.win_length
+
+    @property
+    def player(self):
+        """The symbol of the player to move."""
+        return player(self.board)
+
+    def moves(self):
+        """Return the legal moves as (row, col), in row-major order."""
+        if terminal(self.board):
+            return []
+        return actions(self.board, player(self.board))
+
+    def make(self, move):
+        """Play a move for the player to move.
+
+        Args:
+            move (tuple): The row and column indices of an empty cell.
+
+        Raises:
+            ValueError: If the game is over, or the cell is off the board or
+                taken.
+        """
+        board = self.board
+        r, c = move
+        if terminal(board):
+            raise ValueError("the game is over")
+        if not (0 <= r < board.size and 0 <= c < board.size) \
+                or board.occupied() >> (r * board.size + c) & 1:
+            raise ValueError(f"({r}, {c}) is not an empty cell")
+        move = cell_moves(board.size)[r * board.size + c]
+        board.make(move)
+        self.history.append(move)
+
+    def unmake(self):
+        """Take back the last move played with `make` and return it.
+
+        Raises:
+            IndexError: If no move was played.
+        """
+        move = self.history.pop()
+        self.board.unmake(move)
+        return move
+
+    def is_over(self):
+        """Tell whether the game is won or drawn."""
+        return terminal(self.board)
+
+    def winner(self):
+        """Return the symbol of the player who won, or None while nobody has."""
+        if self.board.x_lines:
+            return 'X'
+        if self.board.o_lines:
+            return 'O'
+        return None
+
+    def copy(self):
+        """Return an independent copy of the game."""
+        game = GameState.__new__(GameState)
+        game.board = self.board.copy()
+        game.history = self.history[:]
+        return game
+
+    def __repr__(self):
+        return 'GameState(size={}, win_length={}, history={})'.format(
+            self.size, self.win_length, self.history)
+
+
+# -------------------------------------------------------------------------------
+# Evaluators.
+# -------------------------------------------------------------------------------
+class Evaluator:
+    """A heuristic valuing the positions where the search is cut off.
+
+    Subclasses implement `evaluate`. Values must be zero-sum, a position being
+    worth to 'O' the opposite of what it is worth to 'X', since the search is
+    negamax, and stay strictly between -`WIN_VALUE` and `WIN_VALUE`, so that
+    no heuristic value passes for a won or lost game.
+    """
+
+    def scores(self, size, win_length):
+        """Return the line score table boards should keep their score with.
+
+        A `BitBoard` updates the sum of the scores of its lines on every move
+        (see `line_scores`); an evaluator that scores lines can read it in
+        constant time instead of summing the lines at every leaf.
+
+        Args:
+            size (int): The dimension of the 2D game board.
+            win_length (int): The number of symbols in a row needed to win.
+
+        Returns:
+            tuple: A table where `table[p][o]` is the score for 'X' of a line
+            holding `p` 'X' and `o` 'O' symbols, or None to keep the default
+            table.
+        """
+        return None
+
+    def identity(self):
+        """Return what tells the values of this evaluator apart from other evaluators'.
+
+        Search results are cached under it (see `PositionCache`), so two
+        evaluators may only have the same identity if they value every
+        position the same. By default every evaluator is its own identity.
+
+        Returns:
+            object: A hashable identity, or None for the values of
+            `evaluate_board`.
+        """
+        return self
+
+    def evaluate(self, state, player_symbol):
+        """Value a position that is not over.
+
+        Args:
+            state (BitBoard): The board, built with the table of `scores`.
+            player_symbol (str): The symbol of the player to value it for.
+
+        Returns:
+            int: The value of the position for the player.
+        """
+        raise NotImplementedError
+
+
+class LineEvaluator(Evaluator):
+    """Score every line by the symbols on it, as `evaluate_board` does.
+
+    With the default weights, values are the same as `evaluate_board`'s.
+
+    Attributes:
+        weights (tuple): The scores of a line with 3, 2 and 1 symbols of one
+            player, see `LINE_WEIGHTS`.
+        threat_base (int): The growth of a line's score with every extra
+            symbol under k-in-a-row rules, see `THREAT_BASE`.
+    """
+
+    def __init__(self, weights=LINE_WEIGHTS, threat_base=THREAT_BASE):
+        self.weights = tuple(weights)
+        self.threat_base = threat_base
+
+    def scores(self, size, win_length):
+        return line_scores(size, win_length, self.weights, self.threat_base)
+
+    def identity(self):
+        if (self.weights, self.threat_base) == (LINE_WEIGHTS, THREAT_BASE):
+            return None
+        return 'LineEvaluator', self.weights, self.threat_base
+
+    def evaluate(self, state, player_symbol):
+        return table_score(state, self.scores(state.size, state.win_length), player_symbol)
+
+    def __repr__(self):
+        return f'LineEvaluator(weights={self.weights}, threat_base={self.threat_base})'
+
+
+class OpenLineEvaluator(Evaluator):
+    """Score every line that only holds one player's symbols by how many it holds.
+
+    Lines holding the symbols of both players can no longer be completed and
+    score nothing. The scores of `evaluate_board` are a special case, see
+    `default_open_scores`; these are the weights `tuning.py` tunes.
+
+    Attributes:
+        weights (tuple): `weights[n - 1]` is the score of a line holding `n`
+            symbols of the player and no other, for `n` from 1 to one less
+            than the win length.
+    """
+
+    def __init__(self, weights):
+        self.weights = tuple(weights)
+
+    def scores(self, size, win_length):
+        if len(self.weights) != win_length - 1:
+            raise ValueError(f"{len(self.weights)} weights cannot score lines of {win_length}")
+        return open_line_table(win_length, self.weights)
+
+    def identity(self):
+        return 'OpenLineEvaluator', self.weights
+
+    def evaluate(self, state, player_symbol):
+        return table_score(state, self.scores(state.size, state.win_length), player_symbol)
+
+    def __repr__(self):
+        return f'OpenLineEvaluator(weights={self.weights})'
+
+
+def table_score(state, table, player_symbol):
+    """Score a board for a player with a line score table.
+
+    The board's own score is used when it keeps it with the same table.
+    Many lines can add up past a win, so the score is kept strictly between
+    -`WIN_VALUE` and `WIN_VALUE`.
+
+    Args:
+        state (BitBoard): The game board.
+        table (tuple): The score for 'X' of a line by its counts, see
+            `line_scores`.
+        player_symbol (str): The symbol of the player to score the board for.
+
+    Returns:
+        int: The score of the board for the player.
+    """
+    if state.table is table:
+        score = state.score
+    else:
+        score = sum(table[xs][os] for xs, os in zip(state.x_counts, state.o_counts))
+    if player_symbol == 'O':
+        score = -score
+    return max(1 - WIN_VALUE, min(WIN_VALUE - 1, score))
+
+
+@functools.lru_cache(maxsize=None)
+def open_line_table(win_length, weights):
+    """Build the line score table of `OpenLineEvaluator`.
+
+    Args:
+        win_length (int): The number of symbols in a row needed to win.
+        weights (tuple): The scores of open lines, see `OpenLineEvaluator`.
+
+    Returns:
+        tuple: A table where `table[p][o]` is the score for 'X' of a line
+        holding `p` 'X' and `o` 'O' symbols.
+    """
+    table = [[0] * (win_length + 1) for _ in range(win_length + 1)]
+    for count, weight in enumerate(weights, 1):
+        table[count][0] = weight
+        table[0][count] = -weight
+    return tuple(tuple(row) for row in table)
+
+
+def default_open_scores(size, win_length=None):
+    """Return the `OpenLineEvaluator` weights that score as `evaluate_board`.
+
+    `evaluate_board` only scores lines holding one player's symbols, by how
+    many they hold, so on boards that are not over it is the same as an
+    `OpenLineEvaluator` with these weights.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        tuple: The weights, from one symbol to one less than the win length.
+    """
+    win_length = win_length or size
+    table = line_scores(size, win_length)
+    return tuple(table[count][0] for count in range(1, win_length))
+
+
+# -------------------------------------------------------------------------------
+# Searcher.
+# -------------------------------------------------------------------------------
+class Searcher:
+    """A search engine for one board size, kept warm from one search to the next.
+
+    The transposition table, the killer moves and history scores of the move
+    ordering, the position cache and the positions the endgame solver solved
+    carry over between searches, so the moves of a game, and of many games,
+    speed each other up. A searcher is not thread-safe: use one per thread or
+    process.
+
+    Attributes:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        depth (int): The cut-off depth of searches without a budget, and the
+            deepest iteration of those with one. None for `CUTOFF_DEPTH`
+            without a budget and the end of the game with one.
+        time_ms (float): The time budget of a search in milliseconds, or None.
+        max_nodes (int): The node budget of a search, or None.
+        evaluator (Evaluator): The heuristic valuing the cut-off positions.
+        scores (tuple): The line score table of the evaluator for the board
+            size, see `Evaluator.scores`.
+        table (TranspositionTable): The transposition table.
+        ordering (MoveOrdering): The move ordering.
+        cache (PositionCache): The cache of search results, or None.
+        stats (SearchStats): The statistics of all the searches, or None.
+        endgame (bool): Whether positions in the tablebase of the board size
+            are answered from it and endgames are solved exactly.
+        solver (EndgameSolver): The solver of the endgames, or None when they
+            are not solved. It values a position as won, drawn or lost, which
+            the searches scale to WIN_VALUE, 0 or -WIN_VALUE: the values of
+            finished games, which the values of an evaluator stay strictly
+            inside. Solved values are exact whatever the evaluator, so a
+            solver can be shared by searchers of the same board.
+        aspiration (int): The half width of the aspiration window of the
+            searches with a budget, see `iterative_deepening_search`.
+    """
+
+    def __init__(self, size=3, win_length=None, depth=None, time_ms=None, max_nodes=None,
+                 evaluator=None, table_mb=16, cache=None, stats=True, endgame=True,
+                 aspiration=ASPIRATION_WINDOW, solver=None):
+        """
+        Args:
+            size (int): The dimension of the 2D game board.
+            win_length (int): The number of symbols in a row needed to win.
+                Defaults to the size of the board.
+            depth (int): The cut-off depth, see the attribute.
+            time_ms (float): The default time budget of a search, or None.
+            max_nodes (int): The default node budget of a search, or None.
+            evaluator (Evaluator): The heuristic. Defaults to `LineEvaluator()`.
+            table_mb (float): The memory budget of the transposition table.
+            cache (PositionCache): An optional cache of search results, such as
+                `position_cache()`. Results are kept apart by the identity of
+                the evaluator, so searchers with different evaluators can
+                share a cache.
+            stats (bool): Whether to record statistics. They grow by one small
+                record per search or iteration.
+            endgame (bool): Whether to answer from the tablebase and solve
+                endgames exactly.
+            aspiration (int): The half width of the aspiration window, or None.
+            solver (EndgameSolver): The solver of the endgames, see the
+                attribute. Defaults to a new one for the board.
+
+        Raises:
+            ValueError: If the solver is for another board size or win length.
+        """
+        self.size = size
+        self.win_length = win_length = win_length or size
+        self.depth = depth
+        self.time_ms = time_ms
+        self.max_nodes = max_nodes
+        self.evaluator = LineEvaluator() if evaluator is None else evaluator
+        self.scores = self.evaluator.scores(size, win_length) or line_scores(size, win_length)
+        self.table = TranspositionTable(table_mb)
+        self.ordering = MoveOrdering()
+        self.cache = cache
+        self.stats = SearchStats() if stats else None
+        self.endgame = endgame
+        self.aspiration = aspiration
+        if endgame and solver is None:
+            solver = EndgameSolver(size, win_length)
+        elif endgame and (solver.size, solver.win_length) != (size, win_length):
+            raise ValueError(f"a {size}x{size} searcher with {win_length} in a row cannot "
+                             f"use an endgame solver of a {solver.size}x{solver.size} board "
+                             f"with {solver.win_length} in a row")
+        self.solver = solver if endgame else None
+
+        # Build the tables of the board size now rather than during the first search
+        line_masks(size, win_length)
+        cell_lines(size, win_length)
+        cell_moves(size)
+        center_weights(size)
+        symmetries(size)
+        symmetric_zobrist_keys(size)
+
+    def new_game(self):
+        """Return a new game on the board of the searcher."""
+        return GameState(self.size, self.win_length)
+
+    def board(self, state):
+        """Return a `BitBoard` of a position scored with the table of the evaluator.
+
+        Args:
+            state (GameState, BitBoard or 2D array): The position.
+
+        Raises:
+            ValueError: If the board size or win length differ from the
+                searcher's.
+        """
+        if isinstance(state, GameState):
+            state = state.board
+        elif not isinstance(state, BitBoard):
+            state = to_bitboard(state, self.win_length)
+        if (state.size, state.win_length) != (self.size, self.win_length):
+            raise ValueError(f"a {self.size}x{self.size} searcher with {self.win_length} in a "
+                             f"row cannot search a {state.size}x{state.size} board with "
+                             f"{state.win_length} in a row")
+        if state.table is self.scores:
+            return state.copy()
+        return BitBoard(self.size, state.x, state.o, state.keys, self.win_length, self.scores)
+
+    def search(self, state, depth=None, time_ms=None, max_nodes=None, stop=None):
+        """Get the best move for the player to move.
+
+        Without a time or node budget, the position is searched to the cut-off
+        depth with `alpha_beta_search`; with one, it is searched deeper and
+        deeper with `iterative_deepening_search` until the budget runs out.
+
+        Args:
+            state (GameState, BitBoard or 2D array): The position to search.
+            depth (int): Overrides the depth of the searcher for this search.
+            time_ms (float): Overrides the time budget of the searcher.
+            max_nodes (int): Overrides the node budget of the searcher.
+            stop (threading.Event): Optional event that ends a search with a
+                budget when another thread sets it.
+
+        Returns:
+            tuple: The value of the best move for the player to move and the
+            move itself as (row, col).
+
+        Raises:
+            SearchTimeout: If `stop` is set before the first iteration of the
+                search completes.
+        """
+        board = self.board(state)
+        depth = self.depth if depth is None else depth
+        time_ms = self.time_ms if time_ms is None else time_ms
+        max_nodes = self.max_nodes if max_nodes is None else max_nodes
+
+        if time_ms is None and max_nodes is None and stop is None:
+            self.ordering.new_search()
+            limits = SearchLimits(max_depth=CUTOFF_DEPTH if depth is None else depth,
+                                  stats=self.stats)
+            return alpha_beta_search(board, self.table, limits, self.ordering, cache=self.cache,
+                                     endgame=self.endgame, evaluator=self.evaluator,
+                                     solver=self.solver)
+
+        return iterative_deepening_search(board, time_ms, max_nodes, depth, self.table,
+                                          self.ordering, self.stats, self.cache,
+                                          self.aspiration, self.endgame, stop, self.evaluator,
+                                          self.solver)
+
+    def evaluate(self, state):
+        """Value a position for the player to move with the evaluator, without searching."""
+        board = self.board(state)
+        return self.evaluator.evaluate(board, player(board))
+
+    def clear(self):
+        """Forget the transposition table, the move ordering and the statistics."""
+        self.table = TranspositionTable(self.table.size_mb)
+        self.ordering = MoveOrdering()
+        if self.stats is not None:
+            self.stats = SearchStats()
+
+    def __repr__(self):
+        return 'Searcher(size={}, win_length={}, depth={}, time_ms={}, evaluator={!r})'.format(
+            self.size, self.win_length, self.depth, self.time_ms, self.evaluator)
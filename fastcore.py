@@ -0,0 +1,182 @@
+"""Allocation-free versions of the game primitives.
+
+The functions of this module take the same arguments and give the same
+results as `check_win`, `check_draw`, `player`, `actions`, `terminal`,
+`utility` and `evaluate_board` in `xogame`, on 2D arrays and on `BitBoard`s.
+Instead of building row, column and diagonal lists, or lists of counts, on
+every call, they walk tables precomputed once per board size: the cells of
+every line and the (row, col) move of every cell. A call creates no lists or
+tuples, apart from the list `actions` returns; `fill_actions` writes the
+moves into a list the caller reuses.
+
+Example:
+    import fastcore as core
+    if core.terminal(board): ...
+
+    python benchmark.py --allocations
+"""
+import functools
+
+import xogame
+from xogame import WIN_VALUE, BitBoard, cell_moves, line_masks, line_scores
+
+
+@functools.lru_cache(maxsize=None)
+def board_lines(size, win_length=None):
+    """Precompute the (row, col) cells of every winning line of a board.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        tuple: For every line of `line_masks`, the tuple of its cells.
+    """
+    moves = cell_moves(size)
+    return tuple(tuple(moves[cell] for cell in range(size * size) if mask >> cell & 1)
+                 for mask in line_masks(size, win_length))
+
+
+def _has_line(board, player_symbol, lines):
+    """Tell whether the player fills one of `lines` on a 2D array."""
+    for line in lines:
+        for r, c in line:
+            if board[r][c] != player_symbol:
+                break
+        else:
+            return True
+    return False
+
+
+def _is_full(board):
+    """Tell whether a 2D array has no empty cell left."""
+    for row in board:
+        if ' ' in row:
+            return False
+    return True
+
+
+def check_win(board, player_symbol, win_length=None):
+    """Check if a player completed a line, as `xogame.check_win`.
+
+    Args:
+        board (2D array or BitBoard): The current game board.
+        player_symbol (str): The symbol of the player ('X' or 'O').
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        bool: True if the player completed a line.
+    """
+    if isinstance(board, BitBoard):
+        return (board.x_lines if player_symbol == 'X' else board.o_lines) > 0
+    return _has_line(board, player_symbol, board_lines(len(board), win_length))
+
+
+def check_draw(board, win_length=None):
+    """Check if the board is full and nobody won, as `xogame.check_draw`."""
+    if isinstance(board, BitBoard):
+        return board.occupied() == board.full and not board.x_lines and not board.o_lines
+    lines = board_lines(len(board), win_length)
+    return _is_full(board) and not _has_line(board, 'X', lines) \
+        and not _has_line(board, 'O', lines)
+
+
+def player(state):
+    """Return the symbol of the player to move, as `xogame.player`."""
+    if isinstance(state, BitBoard):
+        return 'X' if state.x.bit_count() == state.o.bit_count() else 'O'
+    xs = os = 0
+    for row in state:
+        xs += row.count('X')
+        os += row.count('O')
+    return 'X' if xs == os else 'O'
+
+
+def fill_actions(state, moves):
+    """Write the empty cells of a board into a list, in row-major order.
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+        moves (list): A list with room for every cell of the board, such as
+            `[None] * size * size`, reused from call to call.
+
+    Returns:
+        int: The number of moves written at the start of `moves`.
+    """
+    count = 0
+    if isinstance(state, BitBoard):
+        table = cell_moves(state.size)
+        empty = state.full & ~(state.x | state.o)
+        while empty:
+            low = empty & -empty
+            moves[count] = table[low.bit_length() - 1]
+            count += 1
+            empty ^= low
+        return count
+
+    table = cell_moves(len(state))
+    cell = 0
+    for row in state:
+        for symbol in row:
+            if symbol == ' ':
+                moves[count] = table[cell]
+                count += 1
+            cell += 1
+    return count
+
+
+def actions(state, player):
+    """Return the empty cells of a board as (row, col) moves, as `xogame.actions`."""
+    if isinstance(state, BitBoard):
+        return xogame.actions(state, player)
+
+    table = cell_moves(len(state))
+    moves = []
+    cell = 0
+    for row in state:
+        for symbol in row:
+            if symbol == ' ':
+                moves.append(table[cell])
+            cell += 1
+    return moves
+
+
+def terminal(state):
+    """Check if the game is over, as `xogame.terminal`."""
+    if isinstance(state, BitBoard):
+        return state.x_lines > 0 or state.o_lines > 0 or state.occupied() == state.full
+    lines = board_lines(len(state))
+    return _has_line(state, 'X', lines) or _has_line(state, 'O', lines) or _is_full(state)
+
+
+def utility(state, max_player):
+    """Value a finished game for a player, as `xogame.utility`."""
+    min_player = 'X' if max_player == 'O' else 'O'
+    if check_win(state, max_player):
+        return WIN_VALUE
+    if check_win(state, min_player):
+        return -WIN_VALUE
+    if check_draw(state):
+        return 0
+    return None
+
+
+def evaluate_board(board, player):
+    """Score a board for a player with the line heuristic, as `xogame.evaluate_board`."""
+    if isinstance(board, BitBoard):
+        return xogame.evaluate_board(board, player)
+
+    size = len(board)
+    table = line_scores(size)
+    opponent = 'X' if player == 'O' else 'O'
+    score = 0
+    for line in board_lines(size):
+        ours = theirs = 0
+        for r, c in line:
+            symbol = board[r][c]
+            if symbol == player:
+                ours += 1
+            elif symbol == opponent:
+                theirs += 1
+        score += table[ours][theirs]
+    return score
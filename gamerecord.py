@@ -0,0 +1,470 @@
+"""Record, replay and analyze games.
+
+Game records are kept in a compact binary file or as JSON lines. A record is
+a dict, the same as the ones `selfplay.py` writes:
+
+* `size` and `win_length`: the board and the number of symbols in a row
+  needed to win.
+* `moves`: the moves as [row, col] pairs, 'X' first.
+* `times_ms`: the time every move took in milliseconds.
+* `winner`: 'X', 'O', or None for a draw.
+* `stats` (optional): for every move, [nodes, depth, value] of the search
+  that chose it, or None for moves played without a search.
+
+Any other keys (the players, the seed, ...) are kept as they are.
+
+A binary file starts with a header, followed by the records one after the
+other, each prefixed by its length, so files can be appended to and read
+back as a stream. `RecordWriter` appends records from a background thread
+so the game never waits for the disk, and `read_records` replays a file as a
+generator without loading it. `analyze_records` searches every position of
+the recorded games again in parallel and flags the blunders.
+
+Example:
+    python gamerecord.py summary books/games.bin
+    python gamerecord.py analyze games.jsonl --depth 4 --workers 8
+    python gamerecord.py convert games.jsonl games.bin
+"""
+import argparse
+import collections
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from xogame import (WIN_VALUE, BitBoard, MoveOrdering, SearchLimits, TranspositionTable,
+                    negamax, player, terminal)
+
+# File header: magic and format version
+RECORD_MAGIC = b'XOGR'
+RECORD_VERSION = 1
+FILE_HEADER = struct.Struct('<4sHH')
+
+# Record header: length of the rest of the record, board size, win length,
+# winner (0 for a draw, 1 for 'X', 2 for 'O'), flags, number of moves and
+# length of the JSON of the other keys
+RECORD_HEADER = struct.Struct('<IBBBBHH')
+HAS_STATS = 1
+
+# Move: cell, time in milliseconds, and nodes, depth (-1 without a search)
+# and value of the search that chose it
+MOVE = struct.Struct('<BfIbh')
+NO_VALUE = -32768
+
+# The largest board whose cells fit in the cell field of a move
+MAX_RECORD_SIZE = 15
+
+WINNERS = (None, 'X', 'O')
+
+# The keys stored in the fixed fields of a binary record
+RECORD_KEYS = ('size', 'win_length', 'moves', 'times_ms', 'winner', 'stats')
+
+# The search depth of the analysis, and the drop in value that makes a blunder
+ANALYSIS_DEPTH = 4
+BLUNDER_THRESHOLD = 100
+
+
+def default_record_path():
+    """Return the path the game records its games in."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books', 'games.bin')
+
+
+def record_format(path):
+    """Return the format of a record file from its name: 'jsonl' or 'binary'."""
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'binary'
+
+
+# -------------------------------------------------------------------------------
+# Binary format.
+# -------------------------------------------------------------------------------
+def _check_size(size):
+    """Raise a ValueError if the cells of a board do not fit in a move."""
+    if size > MAX_RECORD_SIZE:
+        raise ValueError(f"a {size}x{size} game does not fit in a binary record; "
+                         f"the largest board is {MAX_RECORD_SIZE}x{MAX_RECORD_SIZE}")
+
+
+def encode_record(record):
+    """Encode a game record in the binary format.
+
+    Args:
+        record (dict): The game record.
+
+    Returns:
+        bytes: The record, with its length prefix.
+
+    Raises:
+        ValueError: If the board is larger than `MAX_RECORD_SIZE`.
+    """
+    size = record['size']
+    _check_size(size)
+    moves = record['moves']
+    times_ms = record.get('times_ms') or [0.0] * len(moves)
+    stats = record.get('stats')
+    meta = {key: value for key, value in record.items() if key not in RECORD_KEYS}
+    meta = json.dumps(meta, separators=(',', ':')).encode() if meta else b''
+
+    body = [meta]
+    for i, (row, col) in enumerate(moves):
+        nodes, depth, value = 0, -1, NO_VALUE
+        if stats is not None and stats[i] is not None:
+            nodes, depth, value = stats[i]
+            nodes = min(nodes, 0xFFFFFFFF)
+            value = NO_VALUE if value is None else max(NO_VALUE + 1, min(32767, int(value)))
+        body.append(MOVE.pack(row * size + col, times_ms[i], nodes, depth, value))
+    body = b''.join(body)
+
+    header = RECORD_HEADER.pack(RECORD_HEADER.size - 4 + len(body), size,
+                                record.get('win_length') or size,
+                                WINNERS.index(record['winner']),
+                                HAS_STATS if stats is not None else 0, len(moves), len(meta))
+    return header + body
+
+
+def decode_record(data, offset=0):
+    """Decode a binary game record.
+
+    Args:
+        data (bytes): The buffer holding the record.
+        offset (int): The position of the record, with its length prefix.
+
+    Returns:
+        dict: The game record.
+    """
+    _, size, win_length, winner, flags, count, meta_length = \
+        RECORD_HEADER.unpack_from(data, offset)
+    offset += RECORD_HEADER.size
+    record = {'size': size, 'win_length': win_length}
+    if meta_length:
+        record.update(json.loads(data[offset:offset + meta_length]))
+        offset += meta_length
+
+    moves = []
+    times_ms = []
+    stats = []
+    end = offset + count * MOVE.size
+    for cell, time_ms, nodes, depth, value in MOVE.iter_unpack(data[offset:end]):
+        moves.append(list(divmod(cell, size)))
+        times_ms.append(round(time_ms, 3))
+        stats.append(None if depth < 0 else
+                     [nodes, depth, None if value == NO_VALUE else value])
+
+    record['moves'] = moves
+    record['times_ms'] = times_ms
+    record['winner'] = WINNERS[winner]
+    if flags & HAS_STATS:
+        record['stats'] = stats
+    return record
+
+
+# -------------------------------------------------------------------------------
+# Writing and reading.
+# -------------------------------------------------------------------------------
+class RecordWriter:
+    """Append game records to a file from a background thread.
+
+    `write` only queues the record; a thread encodes the queued records and
+    appends them to the file in batches. Records must not be changed after
+    they are written.
+
+    Attributes:
+        path (str): The path of the record file.
+        format (str): 'binary' or 'jsonl'.
+        written (int): The number of records written to the file so far.
+        error (Exception): The error that stopped the writing, or None.
+    """
+
+    def __init__(self, path, format=None, max_pending=10000):
+        """
+        Args:
+            path (str): The path of the record file. It is created if needed
+                and appended to otherwise.
+            format (str): 'binary' or 'jsonl'. Defaults to the format of the
+                file name, see `record_format`.
+            max_pending (int): The most records waiting to be written; `write`
+                waits beyond it.
+
+        Raises:
+            ValueError: If the file holds records of another format.
+        """
+        self.path = path
+        self.format = format or record_format(path)
+        self.written = 0
+        self.error = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists and self.format == 'binary':
+            with open(path, 'rb') as file:
+                magic, version, _ = FILE_HEADER.unpack(file.read(FILE_HEADER.size).ljust(
+                    FILE_HEADER.size, b'\0'))
+            if magic != RECORD_MAGIC or version != RECORD_VERSION:
+                raise ValueError(f"{path} is not a game record file")
+
+        self.file = open(path, 'ab')
+        if not exists and self.format == 'binary':
+            self.file.write(FILE_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, 0))
+            self.file.flush()
+
+        self.queue = queue.Queue(max_pending)
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        """Queue a game record to be appended to the file.
+
+        Raises:
+            ValueError: If the writer is closed, or the board of the record is
+                too large for the binary format.
+            Exception: The error that stopped the writing of earlier records.
+        """
+        if self.closed:
+            raise ValueError("write to a closed RecordWriter")
+        if self.error is not None:
+            raise self.error
+        if self.format == 'binary':
+            _check_size(record['size'])
+        self.queue.put(record)
+
+    def close(self):
+        """Write the queued records and close the file.
+
+        Raises:
+            Exception: The error that stopped the writing of the records.
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        """Write the queued records until `close` queues None."""
+        encode = encode_record if self.format == 'binary' \
+            else lambda record: (json.dumps(record) + '\n').encode()
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                done = True
+            if not batch or self.error is not None:
+                continue
+            try:
+                self.file.write(b''.join(encode(record) for record in batch))
+                self.file.flush()
+                self.written += len(batch)
+            except Exception as error:
+                self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path):
+    """Read the game records of a file one at a time.
+
+    The format is recognized from the start of the file. A record cut short
+    at the end of a binary file, by a writer that was killed, is skipped.
+
+    Args:
+        path (str): The path of a binary or JSONL record file.
+
+    Yields:
+        dict: The game records, in the order they were written.
+
+    Raises:
+        ValueError: If a binary file is of another version.
+    """
+    with open(path, 'rb') as file:
+        header = file.read(FILE_HEADER.size)
+        if header[:4] != RECORD_MAGIC:
+            file.seek(0)
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    record.setdefault('win_length', record['size'])
+                    yield record
+            return
+
+        if FILE_HEADER.unpack(header)[1] != RECORD_VERSION:
+            raise ValueError(f"{path} was written by another version of the record format")
+        while True:
+            prefix = file.read(4)
+            if len(prefix) < 4:
+                return
+            length = struct.unpack('<I', prefix)[0]
+            body = file.read(length)
+            if len(body) < length:
+                return
+            yield decode_record(prefix + body)
+
+
+# -------------------------------------------------------------------------------
+# Analysis.
+# Every position of a game is searched again, and the value of the move that
+# was played is compared with the value of the best move.
+# -------------------------------------------------------------------------------
+def analyze_game(record, depth=ANALYSIS_DEPTH, threshold=BLUNDER_THRESHOLD):
+    """Search every position of a game again and find the blunders.
+
+    A move is a blunder when its value falls at least `threshold` below the
+    value of the best move, or when it misses a win or loses a game that was
+    not lost. Both values come from searches cut off at `depth` moves from
+    the position, sharing a transposition table.
+
+    Args:
+        record (dict): The game record.
+        depth (int): The depth of the searches.
+        threshold (int): The drop in value that makes a blunder.
+
+    Returns:
+        dict: The number of positions searched and the blunders, each with
+        its ply, player, move, value, best move, best value and drop in value.
+    """
+    state = BitBoard(record['size'], win_length=record.get('win_length'))
+    table = TranspositionTable(1)
+    ordering = MoveOrdering()
+    inf = float('inf')
+    blunders = []
+    positions = 0
+
+    for ply, move in enumerate(record['moves']):
+        move = tuple(move)
+        if terminal(state):
+            break
+        p = player(state)
+        positions += 1
+
+        limits = SearchLimits(max_depth=depth)
+        best_value = negamax(state, 0, -inf, inf, table, limits, ordering)
+        best_move = limits.best_move
+        value = best_value
+        if move != best_move:
+            # Search the played move to the same depth as the best one
+            state.make(move, p)
+            value = -negamax(state, 1, -inf, inf, table, limits, ordering)
+            state.unmake(move)
+
+        loss = best_value - value
+        if loss >= threshold or (best_value >= WIN_VALUE > value) \
+                or (value <= -WIN_VALUE < best_value):
+            blunders.append({'ply': ply, 'player': p, 'move': list(move), 'value': value,
+                             'best_move': list(best_move), 'best_value': best_value,
+                             'loss': loss})
+        state.make(move, p)
+
+    return {'positions': positions, 'blunders': blunders}
+
+
+def analyze_records(records, depth=ANALYSIS_DEPTH, threshold=BLUNDER_THRESHOLD, workers=None):
+    """Analyze a stream of game records over a pool of processes.
+
+    Only a few records per process are read ahead, so streams of any length
+    can be analyzed.
+
+    Args:
+        records (iterable): The game records, such as `read_records(path)`.
+        depth (int): The depth of the searches, see `analyze_game`.
+        threshold (int): The drop in value that makes a blunder.
+        workers (int): The number of worker processes. Defaults to the number
+            of CPU cores.
+
+    Yields:
+        tuple: Every record with its analysis (see `analyze_game`), in the
+        order of `records`.
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for record in records:
+            pending.append((record, executor.submit(analyze_game, record, depth, threshold)))
+            if len(pending) >= 4 * workers:
+                record, future = pending.popleft()
+                yield record, future.result()
+        while pending:
+            record, future = pending.popleft()
+            yield record, future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    summary = commands.add_parser('summary', help="count the games and their results")
+    summary.add_argument('path', help="record file")
+
+    convert = commands.add_parser('convert', help="convert between binary and JSONL")
+    convert.add_argument('input', help="record file to read")
+    convert.add_argument('output', help="record file to append to (.jsonl for JSON lines)")
+
+    analyze = commands.add_parser('analyze', help="search the games again and flag blunders")
+    analyze.add_argument('path', help="record file")
+    analyze.add_argument('--depth', type=int, default=ANALYSIS_DEPTH, help="search depth")
+    analyze.add_argument('--threshold', type=int, default=BLUNDER_THRESHOLD,
+                         help="drop in value that makes a blunder")
+    analyze.add_argument('--workers', type=int, help="number of worker processes")
+    analyze.add_argument('--output', help="JSONL file to write the analyses to")
+    args = parser.parse_args(argv)
+
+    if args.command == 'summary':
+        games = moves = 0
+        results = collections.Counter()
+        for record in read_records(args.path):
+            games += 1
+            moves += len(record['moves'])
+            results[record['winner'] or 'draw'] += 1
+        print(f"{games} games, {moves} moves")
+        for result in ('X', 'O', 'draw'):
+            label = 'draws' if result == 'draw' else f"{result} wins"
+            print(f"  {label:>7}: {results[result]} ({results[result] / max(1, games):.1%})")
+
+    elif args.command == 'convert':
+        with RecordWriter(args.output) as writer:
+            for record in read_records(args.input):
+                writer.write(record)
+        print(f"{writer.written} games written to {args.output}")
+
+    elif args.command == 'analyze':
+        output = open(args.output, 'w') if args.output else None
+        games = positions = blunders = 0
+        try:
+            for record, analysis in analyze_records(read_records(args.path), args.depth,
+                                                    args.threshold, args.workers):
+                games += 1
+                positions += analysis['positions']
+                blunders += len(analysis['blunders'])
+                for blunder in analysis['blunders']:
+                    row, col = blunder['move']
+                    best_row, best_col = blunder['best_move']
+                    print(f"game {games}, move {blunder['ply'] + 1}: {blunder['player']} "
+                          f"played ({row + 1}, {col + 1}) for {blunder['value']}, "
+                          f"best ({best_row + 1}, {best_col + 1}) for {blunder['best_value']}")
+                if output is not None:
+                    output.write(json.dumps(dict(analysis, game=games - 1)) + '\n')
+        finally:
+            if output is not None:
+                output.close()
+        print(f"{games} games, {positions} positions, {blunders} blunders")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
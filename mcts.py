@@ -0,0 +1,407 @@
+"""Monte Carlo tree search (UCT) player for large boards.
+
+Instead of evaluating positions with `evaluate_board`, Monte Carlo tree search
+plays many random games (playouts) from the current position and grows a
+search tree towards the moves that win the most playouts. It needs no
+heuristic and plays every move with the same time budget whatever the board
+size, which suits 8x8 and larger boards where fixed-depth alpha-beta is slow.
+
+Example:
+    python mcts.py --size 9 --time-ms 1000
+"""
+import argparse
+import functools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from xogame import (WIN_VALUE, BitBoard, actions, display_board, line_masks, nearby_moves,
+                    player, terminal, to_board, to_bitboard, utility)
+
+# Weight of the exploration term of the UCT formula
+EXPLORATION = math.sqrt(2)
+
+
+@functools.lru_cache(maxsize=None)
+def line_cells(size, win_length):
+    """Precompute the cells of every line of a board, as in `line_masks`."""
+    return tuple(tuple(cell for cell in range(size * size) if mask >> cell & 1)
+                 for mask in line_masks(size, win_length))
+
+
+def candidate_moves(state):
+    """Return the moves the tree search considers in a position.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        list: The legal moves, near the symbols already played with k-in-a-row
+        rules (see `nearby_moves`).
+    """
+    moves = actions(state, player(state))
+    if state.win_length < state.size:
+        moves = nearby_moves(state, moves)
+    return moves
+
+
+def winner(state):
+    """Return the symbol of the player who won a finished game, or None for a draw."""
+    if state.x_lines:
+        return 'X'
+    if state.o_lines:
+        return 'O'
+    return None
+
+
+def playout(state, rng):
+    """Play random moves from a position to the end of the game.
+
+    Rather than playing the moves one by one and checking for a win after
+    every move, the empty cells are shuffled and shared out between the
+    players in turn, and the winner is the owner of the line completed by the
+    earliest move. This gives the same result as playing the moves in order.
+
+    Args:
+        state (BitBoard): The position to play from. It is not changed.
+        rng (random.Random): The source of the random moves.
+
+    Returns:
+        str: The symbol of the winner, or None for a draw.
+    """
+    size = state.size
+    cells = []
+    empty = state.full & ~(state.x | state.o)
+    while empty:
+        low = empty & -empty
+        cells.append(low.bit_length() - 1)
+        empty ^= low
+    rng.shuffle(cells)
+
+    first = cells[0::2]
+    second = cells[1::2]
+    ours = 0
+    for cell in first:
+        ours |= 1 << cell
+    theirs = 0
+    for cell in second:
+        theirs |= 1 << cell
+    if player(state) == 'X':
+        x, o = state.x | ours, state.o | theirs
+    else:
+        x, o = state.x | theirs, state.o | ours
+
+    # The move number every cell was played at, or -1 if it was already taken
+    rank = [-1] * (size * size)
+    for i, cell in enumerate(cells):
+        rank[cell] = i
+
+    best, best_symbol = len(cells), None
+    for mask, line in zip(state.lines, line_cells(size, state.win_length)):
+        if x & mask == mask:
+            symbol = 'X'
+        elif o & mask == mask:
+            symbol = 'O'
+        else:
+            continue
+        completed = max(rank[cell] for cell in line)
+        if completed < best:
+            best, best_symbol = completed, symbol
+
+    return best_symbol
+
+
+class Node:
+    """A node of the search tree.
+
+    Attributes:
+        move (tuple): The move leading to the node from its parent, or None.
+        mover (str): The symbol of the player who played `move`.
+        parent (Node): The parent node, or None for the root.
+        children (list): The expanded child nodes.
+        untried (list): The moves that have no child node yet.
+        visits (int): The number of playouts through the node.
+        wins (float): The playouts through the node won by `mover`, with
+            draws counting half.
+    """
+
+    __slots__ = ('move', 'mover', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, state, move=None, mover=None, parent=None, rng=None):
+        self.move = move
+        self.mover = mover
+        self.parent = parent
+        self.children = []
+        self.untried = [] if terminal(state) else candidate_moves(state)
+        if rng is not None:
+            rng.shuffle(self.untried)
+        self.visits = 0
+        self.wins = 0.0
+
+    def select(self, exploration):
+        """Return the child with the highest upper confidence bound (UCT)."""
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits
+                   + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTS:
+    """A UCT player that keeps its search tree from one move to the next.
+
+    When the position to search follows from the last one searched by a move
+    of each player, the subtree of that position is kept, with all its
+    playouts.
+
+    Attributes:
+        exploration (float): The weight of the exploration term of UCT.
+        playouts (int): The playouts run by the last search.
+        reused (int): The playouts of the subtree kept by the last search.
+        kept (dict): The playouts and wins through every root move kept from
+            earlier searches by the last search, by move.
+    """
+
+    def __init__(self, exploration=EXPLORATION, seed=None):
+        """
+        Args:
+            exploration (float): The weight of the exploration term of UCT.
+            seed (int): Optional seed of the random playouts.
+        """
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+        self.root_state = None
+        self.playouts = 0
+        self.reused = 0
+        self.kept = {}
+
+    def search(self, state, time_ms=None, playouts=None):
+        """Get the best move for the player to move.
+
+        Args:
+            state (2D array or BitBoard): The current game board.
+            time_ms (float): The time budget of the move in milliseconds.
+            playouts (int): The playout budget of the move. Without either
+                budget, 1000 playouts are run. At least one playout is
+                always run, however short the time budget.
+
+        Returns:
+            tuple: The share of the playouts through the best move won by the
+            player to move (draws counting half), and the move itself, the one
+            with the most playouts, as (row, col). For a finished game, the
+            result of the game on the same scale (0 for a loss, 0.5 for a
+            draw) and None, and no playout is run.
+        """
+        state = to_bitboard(state)
+        if terminal(state):
+            self.playouts = 0
+            return _final_share(state), None
+        if time_ms is None and playouts is None:
+            playouts = 1000
+        deadline = None if time_ms is None else time.perf_counter() + time_ms / 1000
+
+        self._move_root(state)
+        self.kept = self.root_statistics()
+        self.playouts = 0
+        while self.playouts == 0 or (playouts is None or self.playouts < playouts) \
+                and (deadline is None or time.perf_counter() < deadline):
+            self._iterate()
+            self.playouts += 1
+
+        best = max(self.root.children, key=lambda child: child.visits)
+        return best.wins / best.visits, best.move
+
+    def root_statistics(self, new_only=False):
+        """Return the playouts and wins through every move of the root, by move.
+
+        Args:
+            new_only (bool): Whether to only count the playouts of the last
+                search, leaving out those kept from earlier searches.
+        """
+        statistics = {child.move: (child.visits, child.wins) for child in self.root.children}
+        if new_only:
+            for move, (visits, wins) in self.kept.items():
+                total_visits, total_wins = statistics[move]
+                statistics[move] = (total_visits - visits, total_wins - wins)
+        return statistics
+
+    def _move_root(self, state):
+        """Make `state` the root of the tree, keeping its subtree if there is one."""
+        root = None
+        if self.root is not None and self.root_state.size == state.size \
+                and self.root_state.win_length == state.win_length:
+            root = self._find(self.root, self.root_state, state, 2)
+
+        if root is None:
+            root = Node(state, mover='O' if player(state) == 'X' else 'X', rng=self.rng)
+        root.parent = None
+        root.move = None
+        self.root = root
+        self.root_state = state.copy()
+        self.reused = root.visits
+
+    def _find(self, node, node_state, state, plies):
+        """Find the node of `state` at most `plies` moves below `node`."""
+        if (node_state.x, node_state.o) == (state.x, state.o):
+            return node
+        if plies == 0:
+            return None
+        for child in node.children:
+            # Only descend towards positions whose symbols are all on `state`
+            cell = 1 << (child.move[0] * state.size + child.move[1])
+            if cell & (state.x if child.mover == 'X' else state.o):
+                node_state.make(child.move, child.mover)
+                found = self._find(child, node_state, state, plies - 1)
+                node_state.unmake(child.move)
+                if found is not None:
+                    return found
+        return None
+
+    def _iterate(self):
+        """Run one selection, expansion, playout and backpropagation step."""
+        node = self.root
+        state = self.root_state.copy()
+
+        # Selection: follow UCT down to a node with untried moves or a finished game
+        while not node.untried and node.children:
+            node = node.select(self.exploration)
+            state.make(node.move, node.mover)
+
+        # Expansion: add a child for one untried move
+        if node.untried:
+            move = node.untried.pop()
+            mover = player(state)
+            state.make(move, mover)
+            child = Node(state, move, mover, node, self.rng)
+            node.children.append(child)
+            node = child
+
+        # Playout from the new node, unless the game is over
+        result = winner(state) if terminal(state) else playout(state, self.rng)
+
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            if result is None:
+                node.wins += 0.5
+            elif result == node.mover:
+                node.wins += 1
+            node = node.parent
+
+
+# -------------------------------------------------------------------------------
+# Root-parallel search.
+# Every process grows its own tree from the same root with its own random
+# playouts; the playouts through every root move are added up at the end.
+# -------------------------------------------------------------------------------
+
+# The tree of a worker process, kept between the searches it runs
+_worker_mcts = None
+
+
+def _final_share(state):
+    """Return the result of a finished game for the player to move as a win share."""
+    return (utility(state, player(state)) / WIN_VALUE + 1) / 2
+
+
+def _search_in_worker(state, time_ms, playouts, seed):
+    """Run a tree search in a worker process and return its root statistics.
+
+    Only the playouts of this search are returned: when the process runs
+    several tasks of the same search, or keeps the subtree of an earlier
+    move, the playouts already in the tree were counted by an earlier task.
+    """
+    global _worker_mcts
+    if _worker_mcts is None:
+        _worker_mcts = MCTS(seed=seed)
+    _worker_mcts.search(state, time_ms, playouts)
+    return _worker_mcts.root_statistics(new_only=True), _worker_mcts.playouts
+
+
+def parallel_mcts_search(state, time_ms=None, playouts=None, executor=None, workers=None,
+                         seed=0):
+    """Get the best move by Monte Carlo tree search over several processes.
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+        time_ms (float): The time budget of the move in milliseconds.
+        playouts (int): The playout budget of every process.
+        executor (ProcessPoolExecutor): An optional pool of processes, kept
+            open across moves. A pool is started and shut down for this search
+            when it is not given.
+        workers (int): The number of searches to run, usually the number of
+            processes of `executor`. Defaults to the number of CPU cores.
+        seed (int): The seed of the playouts of the first process; process
+            `i` uses `seed + i`.
+
+    Returns:
+        tuple: The share of the playouts through the best move won by the
+        player to move and the move itself, the one with the most playouts in
+        all the processes, and the total number of playouts. For a finished
+        game, the result of the game, None and 0, as `MCTS.search` returns.
+    """
+    state = to_bitboard(state)
+    if terminal(state):
+        return _final_share(state), None, 0
+    own_executor = executor is None
+    workers = workers or os.cpu_count()
+    if own_executor:
+        executor = ProcessPoolExecutor(workers)
+    try:
+        futures = [executor.submit(_search_in_worker, state, time_ms, playouts, seed + i)
+                   for i in range(workers)]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    totals = {}
+    for statistics, _ in results:
+        for move, (visits, wins) in statistics.items():
+            total = totals.setdefault(move, [0, 0.0])
+            total[0] += visits
+            total[1] += wins
+
+    move, (visits, wins) = max(totals.items(), key=lambda item: item[1][0])
+    return wins / visits, move, sum(count for _, count in results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=9, help="board size")
+    parser.add_argument('--win-length', type=int, help="symbols in a row needed to win")
+    parser.add_argument('--time-ms', type=float, default=1000, help="time budget of a move")
+    parser.add_argument('--workers', type=int, default=1, help="number of search processes")
+    parser.add_argument('--moves', type=int, default=4, help="number of moves to play")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the playouts")
+    args = parser.parse_args(argv)
+
+    state = BitBoard(args.size, win_length=args.win_length)
+    mcts = MCTS(seed=args.seed)
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    try:
+        for _ in range(args.moves):
+            if terminal(state):
+                break
+            start = time.perf_counter()
+            if executor is not None:
+                value, move, count = parallel_mcts_search(state, args.time_ms, executor=executor,
+                                                          workers=args.workers, seed=args.seed)
+            else:
+                value, move = mcts.search(state, args.time_ms)
+                count = mcts.playouts
+            elapsed = time.perf_counter() - start
+            print(f"{player(state)} plays ({move[0] + 1}, {move[1] + 1}): {value:.1%} won, "
+                  f"{count} playouts ({count / elapsed:.0f}/sec)")
+            state.make(move)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    display_board(to_board(state))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
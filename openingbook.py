@@ -0,0 +1,245 @@
+"""Build and read opening books: precomputed best moves for early positions.
+
+An opening book file holds, for one board size, the best move of every early
+position the computer can meet when it follows the book itself. Positions are
+stored by their canonical Zobrist key, so symmetric positions share an entry,
+in an open-addressing hash table that is read through `mmap` without loading
+the file.
+
+Example:
+    python openingbook.py --size 4 --plies 4 --depth 6
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from xogame import (BitBoard, CUTOFF_DEPTH, MoveOrdering, SearchLimits,
+                    TranspositionTable, actions, alpha_beta_search,
+                    canonical_key, inverse_symmetries, player, symmetries,
+                    terminal, to_bitboard, unique_moves)
+
+# File header: magic, format version, board size, number of slots, number of entries
+BOOK_MAGIC = b'XOBK'
+BOOK_VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+
+# Table slot: canonical key, move cell on the canonical board (-1 if the slot
+# is empty), and the value of the move for the player to move
+ENTRY = struct.Struct('<Qhh')
+
+# Search depth used to pick the book moves, by board size
+DEFAULT_DEPTH = {3: 9, 4: 6}
+
+
+def default_book_path(size):
+    """Return the path the game looks for the opening book of a board size in."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books',
+                        f'opening{size}.bin')
+
+
+def generate_opening_book(size, plies=None, depth=None, progress=None):
+    """Compute the best moves of the early positions of a board size.
+
+    The book covers the positions the computer can meet in the first `plies`
+    moves when it plays the book moves itself, as 'X' or as 'O': all the
+    replies of the opponent are expanded, but only the book move of the
+    computer is.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        plies (int): The number of moves the book covers. Defaults to
+            `(size - 2) * 2`, the random moves the game used to open with, and
+            at most 4.
+        depth (int): The depth the book moves are searched to. Defaults to
+            `DEFAULT_DEPTH` for the size, or `CUTOFF_DEPTH`.
+        progress (function): Optional function called with the number of
+            positions searched so far, after every search.
+
+    Returns:
+        dict: Maps the canonical key of every position to the move cell on
+        the canonical board and the value of the move.
+    """
+    if plies is None:
+        plies = min((size - 2) * 2, 4)
+    if depth is None:
+        depth = DEFAULT_DEPTH.get(size, CUTOFF_DEPTH)
+
+    entries = {}
+    table = TranspositionTable()
+    ordering = MoveOrdering()
+    perms = symmetries(size)
+    inverses = inverse_symmetries(size)
+
+    def expand(state, ply, book_player, visited):
+        if ply >= plies or terminal(state):
+            return
+        key, index = canonical_key(state)
+        if (key, book_player) in visited:
+            return
+        visited.add((key, book_player))
+
+        p = player(state)
+        if p == book_player:
+            if key not in entries:
+                ordering.new_search()
+                value, move = alpha_beta_search(state, table, SearchLimits(max_depth=depth),
+                                                ordering)
+                entries[key] = (perms[index][move[0] * size + move[1]], value)
+                if progress is not None:
+                    progress(len(entries))
+            move = divmod(inverses[index][entries[key][0]], size)
+            state.make(move, p)
+            expand(state, ply + 1, book_player, visited)
+            state.unmake(move)
+        else:
+            for move in unique_moves(state, actions(state, p)):
+                state.make(move, p)
+                expand(state, ply + 1, book_player, visited)
+                state.unmake(move)
+
+    for book_player in ('X', 'O'):
+        expand(BitBoard(size), 0, book_player, set())
+
+    return entries
+
+
+def write_opening_book(path, size, entries):
+    """Write an opening book file.
+
+    Args:
+        path (str): The path of the file to write.
+        size (int): The dimension of the 2D game board.
+        entries (dict): The book, as returned by `generate_opening_book`.
+    """
+    # Keep the table at most half full so probe sequences stay short
+    slots = 1
+    while slots < 2 * len(entries):
+        slots *= 2
+    mask = slots - 1
+
+    table = [None] * slots
+    for key, (cell, value) in entries.items():
+        index = key & mask
+        while table[index] is not None:
+            index = (index + 1) & mask
+        table[index] = (key, cell, value)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, size, slots, len(entries)))
+        for entry in table:
+            file.write(ENTRY.pack(*entry) if entry is not None else ENTRY.pack(0, -1, 0))
+
+
+class OpeningBook:
+    """A read-only opening book, memory-mapped from its file.
+
+    Attributes:
+        size (int): The dimension of the 2D game board of the book.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the book file.
+
+        Raises:
+            ValueError: If the file is not an opening book.
+        """
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.size, self.slots, self.entries = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION \
+                or len(self.data) != HEADER.size + self.slots * ENTRY.size:
+            self.data.close()
+            raise ValueError(f"{path} is not an opening book")
+        self.mask = self.slots - 1
+        self.inverses = inverse_symmetries(self.size)
+
+    def probe(self, state):
+        """Look up a position in the book.
+
+        Args:
+            state (2D array or BitBoard): The current game board.
+
+        Returns:
+            tuple: The book move as (row, col) on `state` and its value for the
+            player to move, or None if the position is not in the book.
+        """
+        state = state if isinstance(state, BitBoard) else to_bitboard(state)
+        if state.size != self.size or state.win_length != self.size:
+            return None
+
+        key, index = canonical_key(state)
+        slot = key & self.mask
+        while True:
+            stored_key, cell, value = ENTRY.unpack_from(self.data, HEADER.size + slot * ENTRY.size)
+            if cell < 0:
+                return None
+            if stored_key == key:
+                return divmod(self.inverses[index][cell], self.size), value
+            slot = (slot + 1) & self.mask
+
+    def lookup(self, state):
+        """Return the book move of a position as (row, col), or None."""
+        entry = self.probe(state)
+        return entry[0] if entry is not None else None
+
+    def __len__(self):
+        return self.entries
+
+    def close(self):
+        """Unmap the book file."""
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_opening_book(size, path=None):
+    """Open the opening book of a board size, if there is one.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        path (str): The path of the book file. Defaults to `default_book_path`.
+
+    Returns:
+        OpeningBook: The book, or None if the file does not exist.
+    """
+    path = path or default_book_path(size)
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=3, help="board size (3 to 9)")
+    parser.add_argument('--plies', type=int, help="number of moves the book covers")
+    parser.add_argument('--depth', type=int, help="search depth of the book moves")
+    parser.add_argument('--output', help="book file to write (default: books/openingSIZE.bin)")
+    args = parser.parse_args(argv)
+
+    path = args.output or default_book_path(args.size)
+    start = time.perf_counter()
+
+    def progress(count):
+        if count % 100 == 0:
+            print(f"  {count} positions, {time.perf_counter() - start:.1f}s", flush=True)
+
+    entries = generate_opening_book(args.size, args.plies, args.depth, progress)
+    write_opening_book(path, args.size, entries)
+    print(f"{len(entries)} positions written to {path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
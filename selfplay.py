@@ -0,0 +1,256 @@
+"""Run computer vs computer tic-tac-toe games without a human in the loop.
+
+Example:
+    python selfplay.py --games 1000 --size 4 --agents random alphabeta:3 \
+        --output games.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from xogame import (BitBoard, MoveOrdering, SearchLimits, TranspositionTable,
+                    actions, alpha_beta_search, check_draw, check_win,
+                    get_random_computer_move, iterative_deepening_search,
+                    make_move, player, to_board)
+from mcts import MCTS
+
+
+def make_agent(spec):
+    """Build an agent from its description.
+
+    Agents are described by strings so they can be passed to worker processes:
+
+    * `random` plays a random empty cell (`get_random_computer_move`).
+    * `alphabeta:DEPTH` plays the move of `alpha_beta_search` cut off at DEPTH.
+    * `id:MS` plays the move of `iterative_deepening_search` with a budget of
+      MS milliseconds per move.
+    * `mcts:MS` plays the move of Monte Carlo tree search (`mcts.MCTS`) with a
+      budget of MS milliseconds per move.
+
+    Args:
+        spec (str): The description of the agent.
+
+    Returns:
+        function: A function taking a game board and returning the (row, col)
+        move of the agent. Search agents keep their transposition table and
+        move ordering from one move to the next.
+
+    Raises:
+        ValueError: If the description is not one of the above.
+    """
+    name, _, arg = spec.partition(':')
+
+    if name == 'random' and not arg:
+        return get_random_computer_move
+
+    if name == 'alphabeta':
+        depth = int(arg or 4)
+        table = TranspositionTable()
+        ordering = MoveOrdering()
+
+        def alphabeta_agent(board):
+            ordering.new_search()
+            return alpha_beta_search(board, table, SearchLimits(max_depth=depth), ordering)[1]
+        return alphabeta_agent
+
+    if name == 'id':
+        time_ms = float(arg or 100)
+        table = TranspositionTable()
+        ordering = MoveOrdering()
+
+        def iterative_deepening_agent(board):
+            return iterative_deepening_search(board, time_ms, table=table, ordering=ordering)[1]
+        return iterative_deepening_agent
+
+    if name == 'mcts':
+        time_ms = float(arg or 100)
+        tree = MCTS()
+
+        def mcts_agent(board):
+            return tree.search(board, time_ms)[1]
+        return mcts_agent
+
+    raise ValueError(f"Unknown agent: {spec}")
+
+
+def play_game(size, x_spec, o_spec, seed, opening_moves=None):
+    """Play one game between two agents.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        x_spec (str): The description of the agent playing 'X'.
+        o_spec (str): The description of the agent playing 'O'.
+        seed (int): The seed of the random moves of the game.
+        opening_moves (int): The number of random moves that open the game, so
+            that games between deterministic agents differ. Defaults to
+            `(size - 2) * 2`, as in `human_vs_computer_game_loop`.
+
+    Returns:
+        dict: The record of the game: the board size, the agents, the seed,
+        the number of random opening moves, the moves as [row, col] pairs, the
+        time of every move in milliseconds and the winning symbol ('X', 'O',
+        or None for a draw).
+    """
+    random.seed(seed)
+    if opening_moves is None:
+        opening_moves = (size - 2) * 2
+
+    agents = {'X': make_agent(x_spec), 'O': make_agent(o_spec)}
+    board = BitBoard(size)
+    moves = []
+    times_ms = []
+    winner = None
+
+    while True:
+        current_player = player(board)
+        start = time.perf_counter()
+        if len(moves) < opening_moves:
+            row, col = random.choice(actions(board, current_player))
+        else:
+            row, col = agents[current_player](to_board(board))
+        times_ms.append(round((time.perf_counter() - start) * 1000, 3))
+
+        make_move(board, row, col, current_player)
+        moves.append([row, col])
+
+        if check_win(board, current_player):
+            winner = current_player
+            break
+        elif check_draw(board):
+            break
+
+    return {
+        'size': size,
+        'x': x_spec,
+        'o': o_spec,
+        'seed': seed,
+        'opening_moves': opening_moves,
+        'moves': moves,
+        'times_ms': times_ms,
+        'winner': winner,
+    }
+
+
+def run_tournament(games, size, agent_a, agent_b, output=None, workers=None, seed=0,
+                   opening_moves=None):
+    """Play many games between two agents over a pool of processes.
+
+    The agents swap symbols every game. Game records are written to `output`
+    as JSON lines as soon as the games finish, in completion order.
+
+    Args:
+        games (int): The number of games to play.
+        size (int): The dimension of the 2D game board.
+        agent_a (str): The description of the first agent (see `make_agent`).
+        agent_b (str): The description of the second agent.
+        output (file): An optional text file to stream the game records to.
+        workers (int): The number of worker processes. Defaults to the number
+            of CPU cores.
+        seed (int): The seed of the first game; game `i` uses `seed + i`.
+        opening_moves (int): The number of random opening moves of every game
+            (see `play_game`).
+
+    Returns:
+        dict: The aggregate results: games played, wins of each agent, draws,
+        their rates, average time per move of each agent in milliseconds,
+        elapsed seconds and games per second.
+    """
+    # Reject bad agent descriptions before starting any process
+    make_agent(agent_a)
+    make_agent(agent_b)
+
+    summary = {'games': 0, 'a_wins': 0, 'b_wins': 0, 'draws': 0}
+    move_times = {agent_a: [], agent_b: []} if agent_a != agent_b else {agent_a: []}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(workers or os.cpu_count()) as executor:
+        futures = {}
+        for i in range(games):
+            x_spec, o_spec = (agent_a, agent_b) if i % 2 == 0 else (agent_b, agent_a)
+            future = executor.submit(play_game, size, x_spec, o_spec, seed + i, opening_moves)
+            futures[future] = i
+
+        for future in as_completed(futures):
+            record = future.result()
+            record['game'] = futures[future]
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+
+            summary['games'] += 1
+            a_symbol = 'X' if record['game'] % 2 == 0 else 'O'
+            if record['winner'] is None:
+                summary['draws'] += 1
+            elif record['winner'] == a_symbol:
+                summary['a_wins'] += 1
+            else:
+                summary['b_wins'] += 1
+
+            # Moves alternate between 'X' and 'O', starting with 'X'; the
+            # random opening moves are not the agents' own
+            opening = record['opening_moves']
+            move_times[record['x']].extend(record['times_ms'][opening + opening % 2::2])
+            move_times[record['o']].extend(record['times_ms'][opening + 1 - opening % 2::2])
+
+    elapsed = time.perf_counter() - start
+    played = summary['games']
+    summary.update({
+        'a_win_rate': summary['a_wins'] / played if played else 0.0,
+        'b_win_rate': summary['b_wins'] / played if played else 0.0,
+        'draw_rate': summary['draws'] / played if played else 0.0,
+        'a_ms_per_move': _mean(move_times[agent_a]),
+        'b_ms_per_move': _mean(move_times[agent_b]),
+        'seconds': elapsed,
+        'games_per_second': played / elapsed if elapsed else 0.0,
+    })
+    return summary
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100, help="number of games to play")
+    parser.add_argument('--size', type=int, default=3, help="board size (3 to 9)")
+    parser.add_argument('--agents', nargs=2, default=['random', 'alphabeta:4'],
+                        metavar=('A', 'B'),
+                        help="agents: random, alphabeta:DEPTH, id:MS or mcts:MS")
+    parser.add_argument('--output', help="JSONL file to write the game records to")
+    parser.add_argument('--workers', type=int, help="number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game")
+    parser.add_argument('--opening-moves', type=int,
+                        help="random moves at the start of every game")
+    args = parser.parse_args(argv)
+
+    for spec in args.agents:
+        try:
+            make_agent(spec)
+        except ValueError as error:
+            parser.error(str(error))
+
+    output = open(args.output, 'w') if args.output else None
+    try:
+        summary = run_tournament(args.games, args.size, args.agents[0], args.agents[1],
+                                 output, args.workers, args.seed, args.opening_moves)
+    finally:
+        if output is not None:
+            output.close()
+
+    a, b = args.agents
+    print(f"{summary['games']} games on {args.size}x{args.size}")
+    print(f"  {a:>14}: {summary['a_wins']} wins ({summary['a_win_rate']:.1%}), "
+          f"{summary['a_ms_per_move']:.2f} ms/move")
+    print(f"  {b:>14}: {summary['b_wins']} wins ({summary['b_win_rate']:.1%}), "
+          f"{summary['b_ms_per_move']:.2f} ms/move")
+    print(f"  {'draws':>14}: {summary['draws']} ({summary['draw_rate']:.1%})")
+    print(f"  {summary['games_per_second']:.1f} games/sec")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,509 @@
+"""Serve tic-tac-toe games to many players at once over TCP.
+
+Every connection plays one game at a time against the computer. Commands are
+lines of text, and every command gets one line of JSON back:
+
+    NEW <size> <X|O> [win_length] [move_ms]   start a game as X or O
+    MOVE <row> <col>                          play a move (rows and columns from 1)
+    BOARD                                     show the game
+    QUIT                                      close the connection
+
+Replies hold `ok`, the board as a list of rows, the computer's last move,
+the game `status` ('playing', 'X wins', 'O wins' or 'draw') and the time the
+computer has left on its clock, or `ok: false` and an `error`.
+
+The computer's searches run in a pool of worker processes, so a slow 9x9
+search only holds up its own game. The load generator plays many games at
+once against a server and reports the latency of the moves.
+
+Example:
+    python server.py serve --port 8765
+    python server.py load --port 8765 --games 1000 --concurrency 1000
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Searcher
+from xogame import (BitBoard, actions, check_draw, check_win, forced_move,
+                    get_random_computer_move, player, position_cache, to_board)
+
+DEFAULT_PORT = 8765
+
+# Longest command line accepted, in bytes
+MAX_LINE = 256
+
+
+# -------------------------------------------------------------------------------
+# Worker processes.
+# Every worker keeps a `Searcher` per board size and win length, sharing the
+# position cache of the process, for all the games it searches for.
+# -------------------------------------------------------------------------------
+_worker_search = {}
+
+
+def _init_worker(cache_path):
+    """Warm the position cache of a worker process up from a snapshot, if there is one."""
+    if cache_path is not None and os.path.exists(cache_path):
+        position_cache().load(cache_path)
+
+
+def search_move(size, x, o, win_length, time_ms):
+    """Pick the computer's move in a worker process.
+
+    The move is chosen as in `human_vs_computer_game_loop`: from the opening
+    book when there is one for the board size, or else by the worker's
+    `Searcher` within `time_ms` milliseconds, which answers from the
+    tablebase when there is one, after a few random opening moves.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        x (int): Bit mask of the cells occupied by 'X'.
+        o (int): Bit mask of the cells occupied by 'O'.
+        win_length (int): The number of symbols in a row needed to win.
+        time_ms (float): The time budget of the move in milliseconds.
+
+    Returns:
+        tuple: The move as (row, col) and the time it took in milliseconds.
+    """
+    start = time.perf_counter()
+    state = BitBoard(size, x, o, win_length=win_length)
+
+    if (size, win_length) not in _worker_search:
+        # Imported here since the opening book and tablebase modules build on xogame
+        from openingbook import load_opening_book
+        from tablebase import load_tablebase
+
+        # The searcher answers from the tablebase, which makes the book unneeded
+        book = None
+        solved = win_length == size and load_tablebase(size) is not None
+        if win_length == size and not solved:
+            book = load_opening_book(size)
+        searcher = Searcher(size, win_length, table_mb=4, cache=position_cache(), stats=False)
+        _worker_search[size, win_length] = (searcher, book, solved)
+    searcher, book, solved = _worker_search[size, win_length]
+
+    move = book.lookup(state) if book is not None else None
+    if move is None:
+        if book is None and not solved and win_length == size \
+                and (x | o).bit_count() < (size - 2) * 2:
+            move = get_random_computer_move(to_board(state))
+        else:
+            move = searcher.search(state, time_ms=time_ms)[1]
+
+    return move, (time.perf_counter() - start) * 1000
+
+
+# -------------------------------------------------------------------------------
+# Server.
+# -------------------------------------------------------------------------------
+class Session:
+    """The game of one connection.
+
+    Attributes:
+        state (BitBoard): The game board.
+        human (str): The symbol of the human player ('X' or 'O').
+        move_ms (float): The most time the computer spends on one move.
+        clock_ms (float): The time the computer has left for the rest of the game.
+        last_move (tuple): The computer's last move as (row, col), or None.
+        status (str): 'playing', 'X wins', 'O wins' or 'draw'.
+    """
+
+    def __init__(self, size, human, win_length, move_ms, clock_ms):
+        self.state = BitBoard(size, win_length=win_length)
+        self.human = human
+        self.move_ms = move_ms
+        self.clock_ms = clock_ms
+        self.last_move = None
+        self.status = 'playing'
+
+    def budget_ms(self):
+        """Return the time budget of the computer's next move.
+
+        The clock is shared out over the moves the computer may still have
+        to play, and no move gets more than `move_ms`.
+        """
+        empty = (self.state.full & ~self.state.occupied()).bit_count()
+        return max(1.0, min(self.move_ms, self.clock_ms / max(1, (empty + 1) // 2)))
+
+    def play(self, move):
+        """Play a move for the player to move and update the status."""
+        p = player(self.state)
+        self.state.make(move, p)
+        if check_win(self.state, p):
+            self.status = f'{p} wins'
+        elif check_draw(self.state):
+            self.status = 'draw'
+
+    def reply(self):
+        """Return the reply describing the game."""
+        return {
+            'ok': True,
+            'board': [''.join(row) for row in to_board(self.state)],
+            'human': self.human,
+            'win_length': self.state.win_length,
+            'computer_move': [self.last_move[0] + 1, self.last_move[1] + 1]
+            if self.last_move is not None else None,
+            'status': self.status,
+            'clock_ms': round(self.clock_ms, 1),
+        }
+
+
+class GameServer:
+    """An asyncio TCP server running one game per connection.
+
+    Backpressure is applied at every stage: connections beyond `max_sessions`
+    are turned away, a connection's next command is only read once the reply
+    to the previous one has been sent (and drained to the socket), and at
+    most `max_searches` searches wait in the worker pool at a time; other
+    games wait for a free slot.
+    """
+
+    def __init__(self, workers=None, max_sessions=2048, max_searches=None, move_ms=1000,
+                 clock_ms=60000, idle_timeout=300, cache_path=None):
+        """
+        Args:
+            workers (int): The number of search processes. Defaults to the
+                number of CPU cores.
+            max_sessions (int): The most connections served at a time.
+            max_searches (int): The most searches queued in the worker pool.
+                Defaults to twice the number of workers.
+            move_ms (float): The default most time the computer spends on a move.
+            clock_ms (float): The time the computer has for a whole game.
+            idle_timeout (float): Seconds a player may take to send a command
+                before the connection is closed.
+            cache_path (str): Optional position cache snapshot (see
+                `PositionCache.save`) every search process warms up from.
+        """
+        self.workers = workers or os.cpu_count()
+        self.max_sessions = max_sessions
+        self.move_ms = move_ms
+        self.clock_ms = clock_ms
+        self.idle_timeout = idle_timeout
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                            initargs=(cache_path,))
+        self.searches = asyncio.Semaphore(max_searches or 2 * self.workers)
+        self.sessions = 0
+        self.games = 0
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, ready=None):
+        """Accept connections until cancelled.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on; 0 picks a free one.
+            ready (asyncio.Future): Optional future set to the bound port once
+                the server listens.
+        """
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE,
+                                            backlog=self.max_sessions)
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        """Serve one connection."""
+        if self.sessions >= self.max_sessions:
+            try:
+                await self.send(writer, {'ok': False, 'error': "server busy"})
+            except ConnectionError:
+                pass
+            finally:
+                await self.close(writer)
+            return
+
+        self.sessions += 1
+        session = None
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self.send(writer, {'ok': False, 'error': "idle timeout"})
+                    break
+                except ValueError:
+                    await self.send(writer, {'ok': False, 'error': "line too long"})
+                    break
+                if not line:
+                    break
+
+                command, *args = line.decode(errors='replace').split() or ['']
+                command = command.upper()
+                if command == 'QUIT':
+                    break
+                try:
+                    session, reply = await self.dispatch(session, command, args)
+                except ValueError as error:
+                    reply = {'ok': False, 'error': str(error)}
+                await self.send(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            await self.close(writer)
+
+    async def dispatch(self, session, command, args):
+        """Run one command.
+
+        Returns:
+            tuple: The session after the command and the reply.
+
+        Raises:
+            ValueError: If the command or its arguments are not valid.
+        """
+        if command == 'NEW':
+            if not 2 <= len(args) <= 4:
+                raise ValueError("usage: NEW <size> <X|O> [win_length] [move_ms]")
+            size, human = int(args[0]), args[1].upper()
+            win_length = int(args[2]) if len(args) > 2 else size
+            move_ms = min(float(args[3]), self.move_ms) if len(args) > 3 else self.move_ms
+            if not 3 <= size <= 15 or human not in ('X', 'O') \
+                    or not 3 <= win_length <= size or not math.isfinite(move_ms) \
+                    or move_ms <= 0:
+                raise ValueError("invalid game settings")
+            session = Session(size, human, win_length, move_ms, self.clock_ms)
+            self.games += 1
+            if human == 'O':
+                await self.computer_move(session)
+            return session, session.reply()
+
+        if session is None:
+            raise ValueError("no game; start one with NEW")
+
+        if command == 'MOVE':
+            if session.status != 'playing':
+                raise ValueError("the game is over")
+            if len(args) != 2:
+                raise ValueError("usage: MOVE <row> <col>")
+            row, col = int(args[0]) - 1, int(args[1]) - 1
+            size = session.state.size
+            if not (0 <= row < size and 0 <= col < size) \
+                    or session.state.occupied() >> (row * size + col) & 1:
+                raise ValueError("invalid move; choose an empty cell within the board")
+            session.play((row, col))
+            session.last_move = None
+            if session.status == 'playing':
+                await self.computer_move(session)
+            return session, session.reply()
+
+        if command == 'BOARD':
+            return session, session.reply()
+
+        raise ValueError(f"unknown command: {command}")
+
+    async def computer_move(self, session):
+        """Search and play the computer's move in a worker process.
+
+        Moves forced by threats (see `forced_move`) take microseconds to find,
+        so they are played at once without waiting for a worker.
+        """
+        state = session.state
+        start = time.perf_counter()
+        forced = forced_move(state)
+        if forced is not None:
+            move, elapsed_ms = forced[1], (time.perf_counter() - start) * 1000
+        else:
+            async with self.searches:
+                move, elapsed_ms = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, search_move, state.size, state.x, state.o,
+                    state.win_length, session.budget_ms())
+        session.clock_ms = max(0.0, session.clock_ms - elapsed_ms)
+        session.last_move = move
+        session.play(move)
+
+    @staticmethod
+    async def send(writer, reply):
+        writer.write(json.dumps(reply).encode() + b'\n')
+        await writer.drain()
+
+    @staticmethod
+    async def close(writer):
+        """Close a connection and wait until it is closed, even if the client left."""
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+# -------------------------------------------------------------------------------
+# Load generator.
+# -------------------------------------------------------------------------------
+async def play_random_game(host, port, size, win_length, move_ms, rng, latencies):
+    """Play one game against a server with random moves.
+
+    Args:
+        host (str): The address of the server.
+        port (int): The port of the server.
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        move_ms (float): The most time the computer may spend on a move.
+        rng (random.Random): The source of the random moves and symbol.
+        latencies (list): The list the latency of every command, in
+            milliseconds, is appended to.
+
+    Returns:
+        str: The status of the finished game.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        async def request(line):
+            start = time.perf_counter()
+            writer.write(line.encode() + b'\n')
+            await writer.drain()
+            reply = json.loads(await reader.readline())
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not reply['ok']:
+                raise RuntimeError(reply['error'])
+            return reply
+
+        reply = await request(f"NEW {size} {rng.choice('XO')} {win_length} {move_ms}")
+        while reply['status'] == 'playing':
+            empty = [(r, c) for r, row in enumerate(reply['board'])
+                     for c, cell in enumerate(row) if cell == ' ']
+            row, col = rng.choice(empty)
+            reply = await request(f"MOVE {row + 1} {col + 1}")
+        writer.write(b'QUIT\n')
+        await writer.drain()
+        return reply['status']
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, games, concurrency, size=3, win_length=None, move_ms=50,
+                   seed=0):
+    """Play many random games against a server at once.
+
+    Args:
+        host (str): The address of the server.
+        port (int): The port of the server.
+        games (int): The number of games to play.
+        concurrency (int): The most games played at a time.
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to `size`.
+        move_ms (float): The most time the computer may spend on a move.
+        seed (int): The seed of the random moves.
+
+    Returns:
+        dict: The games played and failed, games per second, and the number
+        of requests and their 50th, 99th percentile and maximum latency in
+        milliseconds.
+    """
+    rng = random.Random(seed)
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def one_game(i):
+        async with slots:
+            try:
+                await play_random_game(host, port, size, win_length or size, move_ms,
+                                       random.Random(rng.random() + i), latencies)
+            except (OSError, RuntimeError, ValueError) as error:
+                failures.append(str(error))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_game(i) for i in range(games)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, max(0, round(fraction * len(latencies)) - 1))]
+
+    return {
+        'games': games - len(failures),
+        'failed': len(failures),
+        'errors': sorted(set(failures))[:5],
+        'seconds': elapsed,
+        'games_per_second': (games - len(failures)) / elapsed if elapsed else 0.0,
+        'requests': len(latencies),
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+    }
+
+
+def _raise_file_limit(connections):
+    """Allow enough open files for `connections` sockets, where supported."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = connections + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the game server")
+    serve.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on")
+    serve.add_argument('--workers', type=int, help="number of search processes")
+    serve.add_argument('--max-sessions', type=int, default=2048,
+                       help="most connections at a time")
+    serve.add_argument('--move-ms', type=float, default=1000,
+                       help="most time the computer spends on a move")
+    serve.add_argument('--clock-ms', type=float, default=60000,
+                       help="time the computer has for a whole game")
+    serve.add_argument('--idle-timeout', type=float, default=300,
+                       help="seconds a player may take to send a command")
+    serve.add_argument('--cache', help="position cache snapshot to warm the searches up from")
+
+    load = commands.add_parser('load', help="play random games against a server")
+    load.add_argument('--host', default='127.0.0.1', help="address of the server")
+    load.add_argument('--port', type=int, default=DEFAULT_PORT, help="port of the server")
+    load.add_argument('--games', type=int, default=1000, help="number of games to play")
+    load.add_argument('--concurrency', type=int, default=1000,
+                      help="most games played at a time")
+    load.add_argument('--size', type=int, default=3, help="board size")
+    load.add_argument('--win-length', type=int, help="symbols in a row needed to win")
+    load.add_argument('--move-ms', type=float, default=50,
+                      help="most time the computer may spend on a move")
+    load.add_argument('--seed', type=int, default=0, help="seed of the random moves")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        _raise_file_limit(args.max_sessions)
+        server = GameServer(args.workers, args.max_sessions, move_ms=args.move_ms,
+                            clock_ms=args.clock_ms, idle_timeout=args.idle_timeout,
+                            cache_path=args.cache)
+        print(f"Serving on {args.host}:{args.port} with {server.workers} search processes")
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    _raise_file_limit(args.concurrency)
+    summary = asyncio.run(run_load(args.host, args.port, args.games, args.concurrency,
+                                   args.size, args.win_length, args.move_ms, args.seed))
+    print(f"{summary['games']} games on {args.size}x{args.size} in {summary['seconds']:.1f}s "
+          f"({summary['games_per_second']:.1f} games/sec), {summary['failed']} failed")
+    for error in summary['errors']:
+        print(f"  error: {error}")
+    print(f"  {summary['requests']} requests: p50 {summary['p50_ms']:.1f} ms, "
+          f"p99 {summary['p99_ms']:.1f} ms, max {summary['max_ms']:.1f} ms")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
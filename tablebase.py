@@ -0,0 +1,294 @@
+"""Build and read tablebases: the solved value and best move of every position.
+
+A tablebase file holds one byte for every way of filling the board with
+' ', 'X' and 'O', at the base-3 index of the board (cell `i` counts
+`3 ** i` times 0, 1 or 2). Reachable positions store their value for the
+player to move and their best move; the others are zero. The file is read
+through `mmap`, so only the pages that are used get loaded.
+
+Positions are solved backwards: all reachable positions are enumerated by
+number of symbols on the board, then valued from the full boards down to
+the empty one, every position from the values of its children.
+
+Example:
+    python tablebase.py --size 3
+"""
+import argparse
+import functools
+import mmap
+import os
+import sys
+import time
+
+from xogame import (WIN_VALUE, BitBoard, actions, canonical_key, player, symmetries,
+                    to_bitboard, transform_mask)
+
+# File header: magic, format version and board size
+TABLEBASE_MAGIC = b'XOTB'
+TABLEBASE_VERSION = 1
+HEADER_SIZE = 8
+
+# Entry byte: bits 0-1 hold the value for the player to move, bits 2-7 the
+# best move cell plus one (0 for no move)
+UNKNOWN, LOSS, DRAW, WIN = 0, 1, 2, 3
+VALUES = {LOSS: -WIN_VALUE, DRAW: 0, WIN: WIN_VALUE}
+
+
+def default_tablebase_path(size):
+    """Return the path the game looks for the tablebase of a board size in."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books',
+                        f'tablebase{size}.bin')
+
+
+@functools.lru_cache(maxsize=None)
+def base3_tables(size):
+    """Precompute the base-3 weights of the cells, eight cells at a time.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: For every byte of a cell mask, a table mapping the byte to the
+        sum of `3 ** cell` over its set bits.
+    """
+    cells = size * size
+    tables = []
+    for shift in range(0, cells, 8):
+        table = []
+        for byte in range(256):
+            table.append(sum(3 ** (shift + bit) for bit in range(8)
+                             if byte >> bit & 1 and shift + bit < cells))
+        tables.append(tuple(table))
+
+    return tuple(tables)
+
+
+def board_index(size, x, o):
+    """Compute the base-3 index of a board from its 'X' and 'O' masks.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        x (int): Bit mask of the cells occupied by 'X'.
+        o (int): Bit mask of the cells occupied by 'O'.
+
+    Returns:
+        int: The index of the board, with 'X' counting 1 and 'O' counting 2.
+    """
+    index = 0
+    for table in base3_tables(size):
+        index += table[x & 255] + 2 * table[o & 255]
+        x >>= 8
+        o >>= 8
+
+    return index
+
+
+def solve(size, progress=None):
+    """Solve every reachable position of a board size.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        progress (function): Optional function called with a message after
+            every layer of positions.
+
+    Returns:
+        bytearray: The tablebase entries, one byte per base-3 board index.
+    """
+    cells = size * size
+    full = (1 << cells) - 1
+    perms = symmetries(size)
+
+    # Enumerate the reachable positions, one representative per symmetry class,
+    # by number of symbols on the board
+    layers = [{canonical_key(BitBoard(size))[0]: 0}]
+    for count in range(cells):
+        layer = {}
+        for packed in layers[count].values():
+            state = BitBoard(size, packed & full, packed >> cells)
+            if state.x_lines or state.o_lines:
+                continue
+            p = player(state)
+            for move in actions(state, p):
+                state.make(move, p)
+                key = canonical_key(state)[0]
+                if key not in layer:
+                    layer[key] = state.x | state.o << cells
+                state.unmake(move)
+        layers.append(layer)
+        if progress is not None:
+            progress(f"{count + 1} symbols: {len(layer)} positions")
+
+    # Value them from the full boards back to the empty one. Values are kept
+    # as (outcome, plies to the end) for the player to move.
+    entries = bytearray(3 ** cells)
+    below = {}
+    for count in range(cells, -1, -1):
+        solved = {}
+        for key, packed in layers[count].items():
+            state = BitBoard(size, packed & full, packed >> cells)
+            move = None
+            if state.x_lines or state.o_lines:
+                value = (LOSS, 0)
+            elif count == cells:
+                value = (DRAW, 0)
+            else:
+                p = player(state)
+                value = None
+                for a in actions(state, p):
+                    state.make(a, p)
+                    outcome, plies = below[canonical_key(state)[0]]
+                    state.unmake(a)
+                    candidate = (WIN + LOSS - outcome, plies + 1)
+                    if value is None or _better(candidate, value):
+                        value, move = candidate, a
+            solved[key] = value
+
+            # Store the entry under every symmetric image of the position
+            for perm in perms:
+                x, o = transform_mask(state.x, perm), transform_mask(state.o, perm)
+                cell = perm[move[0] * size + move[1]] + 1 if move is not None else 0
+                entries[board_index(size, x, o)] = value[0] | cell << 2
+
+        below = solved
+        layers[count] = None
+        if progress is not None:
+            progress(f"solved {count} symbols")
+
+    return entries
+
+
+def _better(candidate, value):
+    """Tell whether an (outcome, plies) pair is better for the player to move.
+
+    Wins are better than draws, and draws better than losses; quick wins and
+    slow losses are preferred.
+    """
+    if candidate[0] != value[0]:
+        return candidate[0] > value[0]
+    if candidate[0] == WIN:
+        return candidate[1] < value[1]
+    if candidate[0] == LOSS:
+        return candidate[1] > value[1]
+    return False
+
+
+def write_tablebase(path, size, entries):
+    """Write a tablebase file.
+
+    Args:
+        path (str): The path of the file to write.
+        size (int): The dimension of the 2D game board.
+        entries (bytearray): The entries, as returned by `solve`.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as file:
+        header = TABLEBASE_MAGIC + bytes([TABLEBASE_VERSION, size, 0, 0])
+        file.write(header)
+        file.write(entries)
+
+
+class Tablebase:
+    """A read-only tablebase, memory-mapped from its file.
+
+    Attributes:
+        size (int): The dimension of the 2D game board of the tablebase.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the tablebase file.
+
+        Raises:
+            ValueError: If the file is not a tablebase.
+        """
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.size = self.data[5]
+        if self.data[:4] != TABLEBASE_MAGIC or self.data[4] != TABLEBASE_VERSION \
+                or len(self.data) != HEADER_SIZE + 3 ** (self.size * self.size):
+            self.data.close()
+            raise ValueError(f"{path} is not a tablebase")
+
+    def probe(self, state):
+        """Look up the solved value and best move of a position.
+
+        Args:
+            state (2D array or BitBoard): The current game board.
+
+        Returns:
+            tuple: The best move as (row, col), or None for a finished game,
+            and the value of the position for the player to move (WIN_VALUE
+            for a win, 0 for a draw, -WIN_VALUE for a loss). None if the
+            position is not in the tablebase.
+        """
+        state = state if isinstance(state, BitBoard) else to_bitboard(state)
+        if state.size != self.size or state.win_length != self.size:
+            return None
+
+        entry = self.data[HEADER_SIZE + board_index(self.size, state.x, state.o)]
+        if entry & 3 == UNKNOWN:
+            return None
+        cell = (entry >> 2) - 1
+        move = divmod(cell, self.size) if cell >= 0 else None
+        return move, VALUES[entry & 3]
+
+    def lookup(self, state):
+        """Return the best move of a position as (row, col), or None."""
+        entry = self.probe(state)
+        return entry[0] if entry is not None else None
+
+    def close(self):
+        """Unmap the tablebase file."""
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@functools.lru_cache(maxsize=None)
+def load_tablebase(size, path=None):
+    """Open the tablebase of a board size, if there is one.
+
+    The tablebase is opened once and shared by later calls.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        path (str): The path of the tablebase file. Defaults to
+            `default_tablebase_path`.
+
+    Returns:
+        Tablebase: The tablebase, or None if the file does not exist.
+    """
+    path = path or default_tablebase_path(size)
+    if not os.path.exists(path):
+        return None
+    return Tablebase(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=3, choices=(3, 4), help="board size")
+    parser.add_argument('--output',
+                        help="tablebase file to write (default: books/tablebaseSIZE.bin)")
+    args = parser.parse_args(argv)
+
+    path = args.output or default_tablebase_path(args.size)
+    start = time.perf_counter()
+
+    def progress(message):
+        print(f"  {message} ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    entries = solve(args.size, progress)
+    write_tablebase(path, args.size, entries)
+    print(f"Tablebase written to {path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""Tune the weights of the evaluator by self-play.
+
+The weights of `engine.OpenLineEvaluator`, the score of a line by the number
+of symbols of one player on it, are tuned for every board size with SPSA
+(simultaneous perturbation stochastic approximation). Every iteration moves
+all the weights up or down at random, plays the weights moved one way
+against the weights moved the other way, and steps the weights towards the
+side that won. Only the result of the games is needed, so the weights are
+tuned for playing strength at the search depth they are meant for, with no
+labelled positions.
+
+The games of an iteration run in parallel over all the cores. Every game is
+deterministic given its weights and seed, and its result is cached in a file,
+so rerunning an interrupted iteration replays no game. The state of the
+tuning is checkpointed after every iteration, and a rerun resumes from it.
+At the end, the tuned weights play the default ones, and the best of the two
+are saved for the board size in `books/weights.json`.
+
+Example:
+    python tuning.py --sizes 7 8 9 --iterations 100 --pairs 8
+    python tuning.py --sizes 4 --win-length 4 --depth 3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import OpenLineEvaluator, Searcher, default_open_scores
+from xogame import BitBoard, actions, player, terminal
+
+# Search depth of the tuning games, by board size: the depth the weights are for
+TUNING_DEPTH = {3: 2, 4: 2, 5: 2, 6: 2, 7: 2, 8: 1, 9: 1}
+
+# SPSA gains: the size of the perturbations, relative to every weight and at
+# least 1, the step size in perturbations per unit of match score, the
+# iterations over which steps stay large, and the decay exponents of both
+# (see Spall, "Implementation of the simultaneous perturbation algorithm")
+PERTURBATION = 0.2
+LEARNING_RATE = 2.0
+STABILITY = 10
+STEP_DECAY = 0.602
+PERTURBATION_DECAY = 0.101
+
+# Opening pairs of the final match between the tuned and the default weights
+VALIDATION_PAIRS = 64
+
+
+def default_tuning_dir():
+    """Return the directory checkpoints and cached game results are kept in."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books', 'tuning')
+
+
+def default_weights_path():
+    """Return the path the tuned weights of every board size are saved to."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books', 'weights.json')
+
+
+def weights_key(size, win_length):
+    """Return the key of a board size in the weights file, such as '9x9/5'."""
+    return f'{size}x{size}/{win_length}'
+
+
+# -------------------------------------------------------------------------------
+# Games.
+# -------------------------------------------------------------------------------
+def play_game(size, win_length, depth, x_weights, o_weights, seed, opening_plies):
+    """Play one game between two sets of weights.
+
+    The game opens with random moves, so that games between the same
+    weights differ, and both players then search to the same depth with
+    fresh searchers, so the result only depends on the arguments.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        depth (int): The search depth of both players.
+        x_weights (tuple): The `OpenLineEvaluator` weights of 'X'.
+        o_weights (tuple): The `OpenLineEvaluator` weights of 'O'.
+        seed (int): The seed of the random opening moves.
+        opening_plies (int): The number of random opening moves.
+
+    Returns:
+        str: The symbol of the winner, or None for a draw.
+    """
+    rng = random.Random(seed)
+    searchers = {
+        symbol: Searcher(size, win_length, depth=depth, evaluator=OpenLineEvaluator(weights),
+                         table_mb=1, stats=False)
+        for symbol, weights in (('X', x_weights), ('O', o_weights))
+    }
+    state = BitBoard(size, win_length=win_length)
+    plies = 0
+    while not terminal(state):
+        p = player(state)
+        if plies < opening_plies:
+            move = rng.choice(actions(state, p))
+        else:
+            move = searchers[p].search(state)[1]
+        state.make(move, p)
+        plies += 1
+
+    if state.x_lines:
+        return 'X'
+    if state.o_lines:
+        return 'O'
+    return None
+
+
+def opening_plies(size):
+    """Return the number of random opening moves of the games of a board size."""
+    return max(2, (size - 2) * 2)
+
+
+class GameCache:
+    """The results of the games played so far, kept in a JSON lines file.
+
+    Every line holds the arguments of `play_game` as a key and the winner.
+    Results are appended as games finish, so a crash loses none of them.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): The file to read and append the results to, or None
+                to keep them in memory only.
+        """
+        self.path = path
+        self.results = {}
+        self.file = None
+        if path is not None:
+            if os.path.exists(path):
+                with open(path) as file:
+                    for line in file:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # A line cut short by a crash
+                            continue
+                        self.results[entry['game']] = entry['winner']
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, 'a')
+
+    @staticmethod
+    def key(*game):
+        """Return the key of a game from the arguments of `play_game`."""
+        return json.dumps(game)
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key):
+        """Return the winner of a cached game: 'X', 'O', or None for a draw."""
+        return self.results[key]
+
+    def put(self, key, winner):
+        """Record the winner of a game."""
+        self.results[key] = winner
+        if self.file is not None:
+            self.file.write(json.dumps({'game': key, 'winner': winner}) + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return len(self.results)
+
+
+def play_match(executor, cache, size, win_length, depth, weights_a, weights_b, seeds):
+    """Play a match between two sets of weights, in parallel.
+
+    Every seed opens two games with the same random moves, one with `a`
+    playing 'X' and one with `b` playing 'X', so that neither side gains
+    from the opening.
+
+    Args:
+        executor (ProcessPoolExecutor): The pool the games are played in.
+        cache (GameCache): The results of the games already played.
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        depth (int): The search depth of both players.
+        weights_a (tuple): The weights of the first player.
+        weights_b (tuple): The weights of the second player.
+        seeds (iterable): The seeds of the openings.
+
+    Returns:
+        tuple: The score of `a`, counting a win as 1 and a draw as half, and
+        the number of games.
+    """
+    plies = opening_plies(size)
+    games = []
+    for seed in seeds:
+        games.append((weights_a, weights_b, seed, 'X'))
+        games.append((weights_b, weights_a, seed, 'O'))
+
+    pending = {}
+    winners = []
+    for x_weights, o_weights, seed, a_symbol in games:
+        game = (size, win_length, depth, list(x_weights), list(o_weights), seed, plies)
+        key = cache.key(*game)
+        if key in cache:
+            winners.append((cache.get(key), a_symbol))
+        else:
+            pending[executor.submit(play_game, *game)] = key, a_symbol
+
+    for future, (key, a_symbol) in pending.items():
+        winner = future.result()
+        cache.put(key, winner)
+        winners.append((winner, a_symbol))
+
+    score = sum(1.0 if winner == a_symbol else 0.5 if winner is None else 0.0
+                for winner, a_symbol in winners)
+    return score, len(winners)
+
+
+# -------------------------------------------------------------------------------
+# SPSA.
+# -------------------------------------------------------------------------------
+def load_checkpoint(path):
+    """Return the tuning state saved in a checkpoint file, or None if there is none."""
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_json(path, data):
+    """Write a JSON file, replacing the old one only once the new one is written."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(data, file, indent=1)
+    os.replace(temporary, path)
+
+
+def candidate(theta):
+    """Round tuned weights to the integer weights games are played with."""
+    return tuple(max(0, round(weight)) for weight in theta)
+
+
+def tune(executor, size, win_length=None, depth=None, iterations=100, pairs=8, cache=None,
+         checkpoint_path=None, seed=0, progress=None):
+    """Tune the weights of a board size with SPSA.
+
+    Iteration `i` perturbs every weight by plus or minus its perturbation
+    size at random, plays `pairs` pairs of games between the weights
+    perturbed up and the weights perturbed down, and moves every weight in
+    the direction of its perturbation in the winning weights, by a step
+    proportional to the score difference. Perturbations and steps shrink
+    over the iterations.
+
+    Args:
+        executor (ProcessPoolExecutor): The pool the games are played in.
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to the size of the board.
+        depth (int): The search depth of the games. Defaults to `TUNING_DEPTH`.
+        iterations (int): The number of iterations to reach, including those
+            of the checkpoint.
+        pairs (int): The number of opening pairs played per iteration.
+        cache (GameCache): The results of the games already played.
+        checkpoint_path (str): Optional file to resume from and to save the
+            state of the tuning to after every iteration.
+        seed (int): The seed of the perturbations and of the openings.
+        progress (function): Optional function called with the iteration,
+            the weights and the score of the weights perturbed up after
+            every iteration.
+
+    Returns:
+        dict: The checkpoint: the board size, win length, depth, seed,
+        iterations run, tuned weights (`theta`, unrounded) and, for every
+        iteration, its weights and score.
+    """
+    win_length = win_length or size
+    depth = depth or TUNING_DEPTH.get(size, 1)
+    cache = cache if cache is not None else GameCache()
+    start = default_open_scores(size, win_length)
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is None or (checkpoint['size'], checkpoint['win_length'], checkpoint['depth'],
+                              checkpoint['seed']) != (size, win_length, depth, seed):
+        checkpoint = {'size': size, 'win_length': win_length, 'depth': depth, 'seed': seed,
+                      'iteration': 0, 'theta': [float(weight) for weight in start],
+                      'history': []}
+
+    # The perturbation of every weight, relative to its starting value
+    scale = [max(1.0, PERTURBATION * abs(weight)) for weight in start]
+
+    while checkpoint['iteration'] < iterations:
+        i = checkpoint['iteration']
+        theta = checkpoint['theta']
+        rng = random.Random(f'{seed}/{size}/{win_length}/{i}')
+        signs = [rng.choice((-1, 1)) for _ in theta]
+        c = 1 / (i + 1) ** PERTURBATION_DECAY
+        a = LEARNING_RATE / (i + 1 + STABILITY) ** STEP_DECAY
+
+        plus = candidate(t + c * s * d for t, s, d in zip(theta, scale, signs))
+        minus = candidate(t - c * s * d for t, s, d in zip(theta, scale, signs))
+        seeds = range(seed * 1000003 + i * pairs, seed * 1000003 + (i + 1) * pairs)
+        score, games = play_match(executor, cache, size, win_length, depth, plus, minus, seeds)
+
+        # The score difference between the two sides, from -1 to 1
+        result = 2 * score / games - 1
+        theta = [max(0.0, t + a * c * s * d * result)
+                 for t, s, d in zip(theta, scale, signs)]
+
+        checkpoint['theta'] = theta
+        checkpoint['iteration'] = i + 1
+        checkpoint['history'].append({'weights': list(candidate(theta)),
+                                      'score': score / games})
+        if checkpoint_path is not None:
+            write_json(checkpoint_path, checkpoint)
+        if progress is not None:
+            progress(i + 1, candidate(theta), score / games)
+
+    return checkpoint
+
+
+# -------------------------------------------------------------------------------
+# Tuned weights.
+# -------------------------------------------------------------------------------
+def save_weights(size, win_length, entry, path=None):
+    """Save the weights of a board size, keeping those of the other sizes.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        entry (dict): The weights and how they were found, see `main`.
+        path (str): The weights file. Defaults to `default_weights_path()`.
+    """
+    path = path or default_weights_path()
+    weights = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            weights = json.load(file)
+    weights[weights_key(size, win_length)] = entry
+    write_json(path, dict(sorted(weights.items())))
+
+
+def load_weights(size, win_length=None, path=None):
+    """Return the tuned weights of a board size, or None if there are none.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to the size of the board.
+        path (str): The weights file. Defaults to `default_weights_path()`.
+    """
+    path = path or default_weights_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        entry = json.load(file).get(weights_key(size, win_length or size))
+    return None if entry is None else tuple(entry['weights'])
+
+
+def load_evaluator(size, win_length=None, path=None):
+    """Return an `OpenLineEvaluator` with the tuned weights of a board size, or None.
+
+    Example:
+        searcher = Searcher(9, 5, evaluator=load_evaluator(9, 5))
+    """
+    weights = load_weights(size, win_length, path)
+    return None if weights is None else OpenLineEvaluator(weights)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[6, 7, 8, 9],
+                        help="board sizes to tune (default: 6 to 9)")
+    parser.add_argument('--win-length', type=int, default=5,
+                        help="symbols in a row needed to win, at most the board size "
+                             "(default: 5; whole lines are nearly always drawn)")
+    parser.add_argument('--depth', type=int, help="search depth of the games "
+                                                  "(default: 2 up to 7x7, then 1)")
+    parser.add_argument('--iterations', type=int, default=100, help="SPSA iterations")
+    parser.add_argument('--pairs', type=int, default=8, help="opening pairs per iteration")
+    parser.add_argument('--validation-pairs', type=int, default=VALIDATION_PAIRS,
+                        help="opening pairs of the final match against the default weights")
+    parser.add_argument('--workers', type=int, help="number of game processes")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the tuning")
+    parser.add_argument('--tuning-dir', default=default_tuning_dir(),
+                        help="directory of the checkpoints and cached game results")
+    parser.add_argument('--output', default=default_weights_path(),
+                        help="weights file to save the best weights to")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.tuning_dir, exist_ok=True)
+    cache = GameCache(os.path.join(args.tuning_dir, 'games.jsonl'))
+    print(f"{len(cache)} game results cached in {args.tuning_dir}")
+    try:
+        with ProcessPoolExecutor(args.workers or os.cpu_count()) as executor:
+            for size in args.sizes:
+                win_length = min(args.win_length, size)
+                depth = args.depth or TUNING_DEPTH.get(size, 1)
+                default = default_open_scores(size, win_length)
+                checkpoint_path = os.path.join(
+                    args.tuning_dir, f'{size}x{size}-{win_length}-d{depth}-s{args.seed}.json')
+                print(f"{size}x{size}, {win_length} in a row, depth {depth}, "
+                      f"default weights {list(default)}:")
+
+                def progress(iteration, weights, score):
+                    print(f"  {iteration:>5} {list(weights)} {score:.0%}", flush=True)
+
+                start = time.perf_counter()
+                checkpoint = tune(executor, size, win_length, depth, args.iterations, args.pairs,
+                                  cache, checkpoint_path, args.seed, progress)
+                tuned = candidate(checkpoint['theta'])
+
+                # Keep the tuned weights only if they beat the default ones
+                seeds = range(-args.validation_pairs, 0)
+                score, games = play_match(executor, cache, size, win_length, depth, tuned,
+                                          default, seeds)
+                best = tuned if score * 2 > games else default
+                print(f"  {list(tuned)} scored {score / games:.1%} in {games} games against "
+                      f"{list(default)}, keeping {list(best)} "
+                      f"({time.perf_counter() - start:.0f}s)")
+                save_weights(size, win_length, {
+                    'weights': list(best),
+                    'depth': depth,
+                    'iterations': checkpoint['iteration'],
+                    'score_vs_default': score / games,
+                    'games_vs_default': games,
+                }, args.output)
+    finally:
+        cache.close()
+    print(f"Weights saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,21 @@
 import random
+import collections
+import contextlib
 import copy
+import functools
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for batch evaluation
+    np = None
 
 def intialize_board(size=3):
     """
@@ -76,12 +92,37 @@ def get_user_move(board):
             print("Invalid input. Please enter a valid number.\n")
 
 
+def get_win_length(board_size):
+    """
+    Get the number of symbols in a row needed to win from the user
+
+    Args:
+        board_size (int): The dimension of the 2D game board.
+
+    Returns:
+        int: The win length, from 3 to `board_size`. A whole row, column or
+        diagonal, `board_size`, if the user just presses Enter.
+    """
+    while True:
+        answer = input("Enter the number of symbols in a row needed to win "
+                       "(3 to {}, Enter for {}): ".format(board_size, board_size)).strip()
+        if not answer:
+            return board_size
+        try:
+            win_length = int(answer)
+            if 3 <= win_length <= board_size:
+                return win_length
+            print("Invalid input. Please choose a number within the board's size.\n")
+        except ValueError:
+            print("Invalid input. Please enter a valid number.\n")
+
+
 def make_move(board, row, col, player_symbol):
     """
     Update the game board with the player's move at the specified position.
 
     Args:
-        board (2D array): The current game board.
+        board (2D array or BitBoard): The current game board.
         row (int): The row where the player wants to make a move.
         col (int): The column where the player wants to make a move.
         player_symbol (str): The symbol of the player making the 
@@ -90,21 +131,33 @@ def make_move(board, row, col, player_symbol):
     Returns:
         None
     """
+    if isinstance(board, BitBoard):
+        board.make((row, col), player_symbol)
+        return
+
     board[row][col] = player_symbol
 
-def check_win(board, player_symbol):
+def check_win(board, player_symbol, win_length=None):
 
     """
     Check for horizontal, vertical, and diagonal wins.
 
     Args:
-        board (2D array): The current game board.
+        board (2D array or BitBoard): The current game board.
         player_symbol (str): The symbol of the player ('X' or 'O').
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to the size of the board, or to the win length of a
+            `BitBoard`.
 
     Returns:
         True if the player of the given symbol complted a row, a column
         of a diaginal. False otherwise.
     """
+    if not isinstance(board, BitBoard) and win_length not in (None, len(board)):
+        board = to_bitboard(board, win_length)
+
+    if isinstance(board, BitBoard):
+        return (board.x_lines if player_symbol == 'X' else board.o_lines) > 0
 
     # Check the diagonals wins
     size = len(board)
@@ -132,15 +185,25 @@ def check_win(board, player_symbol):
     # could not find any wins
     return False
 
-def check_draw(board):
+def check_draw(board, win_length=None):
     """
     Check if all cells on the board are filled and non has won
 
     Args:
-        board (2D array): The current game board.
+        board (2D array or BitBoard): The current game board.
+        win_length (int): The number of symbols in a row needed to win, see
+            `check_win`.
     Returns:
         True if it's a draw, otherwise, return False
     """
+    if not isinstance(board, BitBoard) and win_length not in (None, len(board)):
+        board = to_bitboard(board, win_length)
+
+    if isinstance(board, BitBoard):
+        return board.occupied() == board.full \
+            and not check_win(board, 'X') \
+            and not check_win(board, 'O')
+
     return all(' ' not in row for row in board) \
         and not check_win(board, 'X') \
         and not check_win(board, 'O')
@@ -164,6 +227,1252 @@ def get_random_computer_move(board):
     
     return r, c
 
+# -------------------------------------------------------------------------------
+# Bitboard representation of the game board.
+# A board of `size X size` cells is stored as two integers, one bit per cell
+# (bit `r * size + c` for the cell at row `r` and column `c`). The search
+# functions below accept either a 2D array or a `BitBoard`.
+# -------------------------------------------------------------------------------
+class BitBoard:
+    """A compact game board made of two bit masks, one for 'X' and one for 'O'.
+
+    Moves are applied in place with `make` and taken back with `unmake`, so the
+    search does not have to copy the board at every node.
+
+    A player wins by filling a line of `win_length` cells in a row, column or
+    diagonal. By default `win_length` is the size of the board, i.e. a whole
+    row, column or main diagonal; a shorter length plays k-in-a-row, for
+    example 5 in a row on a 9x9 board.
+
+    The board also keeps the number of 'X' and 'O' symbols on every line, and
+    updates them, the `evaluate_board` score and the number of completed lines
+    for the cell's lines only on every move. Evaluating the board and checking
+    for a win or a draw then take constant time.
+
+    Attributes:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        x (int): Bit mask of the cells occupied by 'X'.
+        o (int): Bit mask of the cells occupied by 'O'.
+        full (int): Bit mask with a bit set for every cell of the board.
+        lines (tuple): Bit masks of all the winning lines of the board.
+        through (tuple): The indices of the lines through every cell.
+        table (tuple): The score of a line by its counts, see `line_scores`.
+            Boards scored with other weights (see `engine.LineEvaluator`)
+            keep another table.
+        keys (int): Zobrist hashes of the position and of its seven symmetric
+            images, packed 64 bits each, updated by `make`/`unmake`.
+        x_counts (list): The number of 'X' symbols on every line.
+        o_counts (list): The number of 'O' symbols on every line.
+        score (int): The `evaluate_board` score of the board for 'X', by `table`.
+        x_lines (int): The number of lines completed by 'X'.
+        o_lines (int): The number of lines completed by 'O'.
+    """
+    __slots__ = ('size', 'win_length', 'x', 'o', 'full', 'lines', 'through', 'table', 'keys',
+                 'x_counts', 'o_counts', 'score', 'x_lines', 'o_lines')
+
+    def __init__(self, size=3, x=0, o=0, keys=None, win_length=None, table=None):
+        self.size = size
+        self.win_length = win_length = win_length or size
+        self.x = x
+        self.o = o
+        self.full = (1 << (size * size)) - 1
+        self.lines = line_masks(size, win_length)
+        self.through = cell_lines(size, win_length)
+        self.table = table = line_scores(size, win_length) if table is None else table
+        self.keys = zobrist_hashes(size, x, o) if keys is None else keys
+
+        self.x_counts = [(x & mask).bit_count() for mask in self.lines]
+        self.o_counts = [(o & mask).bit_count() for mask in self.lines]
+        self.score = sum(table[xs][os] for xs, os in zip(self.x_counts, self.o_counts))
+        self.x_lines = self.x_counts.count(win_length)
+        self.o_lines = self.o_counts.count(win_length)
+
+    @property
+    def key(self):
+        """The Zobrist hash of the position."""
+        return self.keys & KEY_MASK
+
+    def copy(self):
+        """Return an independent copy of the board."""
+        board = BitBoard.__new__(BitBoard)
+        board.size = self.size
+        board.win_length = self.win_length
+        board.x = self.x
+        board.o = self.o
+        board.full = self.full
+        board.lines = self.lines
+        board.through = self.through
+        board.table = self.table
+        board.keys = self.keys
+        board.x_counts = self.x_counts[:]
+        board.o_counts = self.o_counts[:]
+        board.score = self.score
+        board.x_lines = self.x_lines
+        board.o_lines = self.o_lines
+        return board
+
+    def occupied(self):
+        """Return the bit mask of all non-empty cells."""
+        return self.x | self.o
+
+    def make(self, action, player_symbol=None):
+        """Place a symbol at the given (row, col) cell.
+
+        Args:
+            action (tuple): The row and column indices of an empty cell.
+            player_symbol (str): The symbol to place. Defaults to the player
+                whose turn it is.
+        """
+        cell = action[0] * self.size + action[1]
+        x_keys, o_keys = symmetric_zobrist_keys(self.size)
+        win_length = self.win_length
+        table = self.table
+        score = self.score
+        if player_symbol is None:
+            player_symbol = player(self)
+
+        if player_symbol == 'X':
+            self.x |= 1 << cell
+            self.keys ^= x_keys[cell]
+            x_counts, o_counts = self.x_counts, self.o_counts
+            for line in self.through[cell]:
+                xs, os = x_counts[line], o_counts[line]
+                score += table[xs + 1][os] - table[xs][os]
+                x_counts[line] = xs + 1
+                if xs + 1 == win_length:
+                    self.x_lines += 1
+        else:
+            self.o |= 1 << cell
+            self.keys ^= o_keys[cell]
+            x_counts, o_counts = self.x_counts, self.o_counts
+            for line in self.through[cell]:
+                xs, os = x_counts[line], o_counts[line]
+                score += table[xs][os + 1] - table[xs][os]
+                o_counts[line] = os + 1
+                if os + 1 == win_length:
+                    self.o_lines += 1
+
+        self.score = score
+
+    def unmake(self, action):
+        """Clear the given (row, col) cell, taking back a move made with `make`."""
+        cell = action[0] * self.size + action[1]
+        x_keys, o_keys = symmetric_zobrist_keys(self.size)
+        win_length = self.win_length
+        table = self.table
+        score = self.score
+        bit = 1 << cell
+
+        if self.x & bit:
+            self.x ^= bit
+            self.keys ^= x_keys[cell]
+            x_counts, o_counts = self.x_counts, self.o_counts
+            for line in self.through[cell]:
+                xs, os = x_counts[line], o_counts[line]
+                score += table[xs - 1][os] - table[xs][os]
+                x_counts[line] = xs - 1
+                if xs == win_length:
+                    self.x_lines -= 1
+        elif self.o & bit:
+            self.o ^= bit
+            self.keys ^= o_keys[cell]
+            x_counts, o_counts = self.x_counts, self.o_counts
+            for line in self.through[cell]:
+                xs, os = x_counts[line], o_counts[line]
+                score += table[xs][os - 1] - table[xs][os]
+                o_counts[line] = os - 1
+                if os == win_length:
+                    self.o_lines -= 1
+
+        self.score = score
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.size == other.size \
+            and self.win_length == other.win_length \
+            and self.x == other.x and self.o == other.o
+
+    def __repr__(self):
+        return 'BitBoard(size={}, x={:#x}, o={:#x}, win_length={})'.format(
+            self.size, self.x, self.o, self.win_length)
+
+
+@functools.lru_cache(maxsize=None)
+def line_masks(size, win_length=None):
+    """Precompute the bit masks of every winning line of a board.
+
+    A winning line is a window of `win_length` consecutive cells in a row, a
+    column or a diagonal. With the default `win_length`, the size of the
+    board, these are the rows, the columns and the two main diagonals.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        tuple: The bit masks of all lines: the windows of the rows, then of
+        the columns, of the diagonals and of the anti diagonals. With the
+        default `win_length`, this is the order of `get_all_lines`.
+    """
+    k = win_length or size
+    starts = range(size - k + 1)
+
+    def window(r, c, dr, dc):
+        return sum(1 << ((r + i * dr) * size + c + i * dc) for i in range(k))
+
+    rows = [window(r, c, 0, 1) for r in range(size) for c in starts]
+    cols = [window(r, c, 1, 0) for c in range(size) for r in starts]
+    diags = [window(r, c, 1, 1) for r in starts for c in starts]
+    anti_diags = [window(r, c, 1, -1) for r in starts for c in range(k - 1, size)]
+
+    return tuple(rows + cols + diags + anti_diags)
+
+
+@functools.lru_cache(maxsize=None)
+def cell_lines(size, win_length=None):
+    """Precompute, for every cell, the lines that go through it.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        tuple: `table[cell]` is a tuple of the indices in `line_masks` of the
+        lines that contain `cell`.
+    """
+    lines = line_masks(size, win_length)
+    return tuple(tuple(i for i, mask in enumerate(lines) if mask >> cell & 1)
+                 for cell in range(size * size))
+
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(size, seed=20240101):
+    """Generate the random Zobrist keys used to hash positions of a board.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        seed (int): Seed of the random generator, so hashes are reproducible.
+
+    Returns:
+        tuple: A list of 64-bit keys for 'X' on every cell, a list of keys for
+        'O' on every cell, and a key that is mixed in when 'O' is the
+        maximizing player of a search.
+    """
+    rng = random.Random(seed * 100 + size)
+    x_keys = [rng.getrandbits(64) for _ in range(size * size)]
+    o_keys = [rng.getrandbits(64) for _ in range(size * size)]
+
+    return x_keys, o_keys, rng.getrandbits(64)
+
+
+# Mask of one 64-bit Zobrist key
+KEY_MASK = (1 << 64) - 1
+
+
+@functools.lru_cache(maxsize=None)
+def symmetric_zobrist_keys(size):
+    """Pack the Zobrist keys of every cell under the eight board symmetries.
+
+    Bits `64 * t` to `64 * t + 63` of a packed key hold the key of the cell
+    that symmetry `t` moves the cell to, so XOR-ing packed keys hashes the
+    position and all its symmetric images at once.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: The packed keys for 'X' and for 'O' on every cell.
+    """
+    x_keys, o_keys, _ = zobrist_keys(size)
+    perms = symmetries(size)
+    x_packed = [sum(x_keys[perm[cell]] << (64 * t) for t, perm in enumerate(perms))
+                for cell in range(size * size)]
+    o_packed = [sum(o_keys[perm[cell]] << (64 * t) for t, perm in enumerate(perms))
+                for cell in range(size * size)]
+
+    return x_packed, o_packed
+
+
+def zobrist_hashes(size, x, o):
+    """Compute the packed Zobrist hashes of a position from scratch.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        x (int): Bit mask of the cells occupied by 'X'.
+        o (int): Bit mask of the cells occupied by 'O'.
+
+    Returns:
+        int: The 64-bit hashes of the position and of its seven symmetric
+        images, packed as in `symmetric_zobrist_keys`.
+    """
+    x_keys, o_keys = symmetric_zobrist_keys(size)
+    keys = 0
+    for cell in range(size * size):
+        if x >> cell & 1:
+            keys ^= x_keys[cell]
+        elif o >> cell & 1:
+            keys ^= o_keys[cell]
+
+    return keys
+
+
+@functools.lru_cache(maxsize=None)
+def symmetries(size):
+    """Precompute the eight symmetries (rotations and reflections) of a board.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: Eight permutations of the cell indices, starting with the
+        identity. `perms[t][cell]` is the cell that symmetry `t` moves `cell` to.
+    """
+    n = size - 1
+    maps = [
+        lambda r, c: (r, c),          # identity
+        lambda r, c: (c, n - r),      # rotate 90 degrees
+        lambda r, c: (n - r, n - c),  # rotate 180 degrees
+        lambda r, c: (n - c, r),      # rotate 270 degrees
+        lambda r, c: (r, n - c),      # mirror left-right
+        lambda r, c: (n - r, c),      # mirror top-bottom
+        lambda r, c: (c, r),          # mirror on the main diagonal
+        lambda r, c: (n - c, n - r),  # mirror on the anti diagonal
+    ]
+    perms = []
+    for transform in maps:
+        perm = [0] * (size * size)
+        for r in range(size):
+            for c in range(size):
+                tr, tc = transform(r, c)
+                perm[r * size + c] = tr * size + tc
+        perms.append(tuple(perm))
+
+    return tuple(perms)
+
+
+@functools.lru_cache(maxsize=None)
+def inverse_symmetries(size):
+    """Precompute the inverse of every permutation returned by `symmetries`.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: Eight permutations; `inverse[t]` undoes `symmetries(size)[t]`.
+    """
+    inverses = []
+    for perm in symmetries(size):
+        inverse = [0] * len(perm)
+        for cell, image in enumerate(perm):
+            inverse[image] = cell
+        inverses.append(tuple(inverse))
+
+    return tuple(inverses)
+
+
+def transform_mask(mask, perm):
+    """Apply a symmetry permutation to a bit mask of cells.
+
+    Args:
+        mask (int): The bit mask to transform.
+        perm (tuple): A permutation of the cell indices from `symmetries`.
+
+    Returns:
+        int: The bit mask with every bit `cell` moved to bit `perm[cell]`.
+    """
+    image = 0
+    while mask:
+        low = mask & -mask
+        image |= 1 << perm[low.bit_length() - 1]
+        mask ^= low
+
+    return image
+
+
+def transform_move(move, perm, size):
+    """Apply a symmetry permutation to a (row, col) move.
+
+    Args:
+        move (tuple): The row and column indices of a cell.
+        perm (tuple): A permutation of the cell indices from `symmetries`.
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: The row and column indices of the image of the cell.
+    """
+    return divmod(perm[move[0] * size + move[1]], size)
+
+
+def canonical_form(state):
+    """Map a board to the canonical representative of its symmetry class.
+
+    The canonical form is the symmetric image with the smallest `(x, o)`
+    masks, so boards that are rotations or reflections of each other share it.
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+
+    Returns:
+        tuple: The canonical `BitBoard` and the index of the symmetry that maps
+        `state` onto it. Moves found on the canonical board are mapped back
+        with `inverse_symmetries(size)[index]`.
+    """
+    state = to_bitboard(state)
+    best, best_index = (state.x, state.o), 0
+    for index, perm in enumerate(symmetries(state.size)):
+        image = (transform_mask(state.x, perm), transform_mask(state.o, perm))
+        if image < best:
+            best, best_index = image, index
+
+    return BitBoard(state.size, best[0], best[1], win_length=state.win_length), best_index
+
+
+def canonical_key(state):
+    """Find the smallest of the Zobrist hashes of a board's symmetric images.
+
+    This is a cheap stand-in for `canonical_form` when only a hash is needed,
+    since the hashes of all eight images are kept up to date by the board.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        tuple: The canonical 64-bit key and the index of the symmetry whose
+        image has that key.
+    """
+    keys = state.keys
+    best, best_index = keys & KEY_MASK, 0
+    for index in range(1, 8):
+        keys >>= 64
+        key = keys & KEY_MASK
+        if key < best:
+            best, best_index = key, index
+
+    return best, best_index
+
+
+def symmetry_group(state):
+    """List the symmetries that leave a board unchanged.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        list: The indices of the symmetries mapping the board onto itself;
+        always contains 0, the identity.
+    """
+    group = [0]
+    keys = state.keys
+    key = keys & KEY_MASK
+    for index, perm in enumerate(symmetries(state.size)[1:], 1):
+        # Compare the hashes first, then confirm on the masks
+        if (keys >> (64 * index)) & KEY_MASK == key \
+                and transform_mask(state.x, perm) == state.x \
+                and transform_mask(state.o, perm) == state.o:
+            group.append(index)
+
+    return group
+
+
+def unique_moves(state, moves):
+    """Drop moves that are symmetric duplicates of an earlier move.
+
+    Two moves are duplicates when a symmetry that leaves the board unchanged
+    maps one onto the other; both lead to equivalent positions with the same
+    value, so only the first of them needs to be searched.
+
+    Args:
+        state (BitBoard): The current game board.
+        moves (list): The moves to filter, in search order.
+
+    Returns:
+        list: The moves with duplicates removed, keeping the original order.
+    """
+    group = symmetry_group(state)
+    if len(group) == 1:
+        return moves
+
+    size = state.size
+    perms = symmetries(size)
+    seen = set()
+    unique = []
+    for move in moves:
+        if move in seen:
+            continue
+        unique.append(move)
+        seen.update(transform_move(move, perms[index], size) for index in group)
+
+    return unique
+
+
+def nearby_moves(state, moves, radius=2):
+    """Keep the moves within `radius` cells of a symbol already on the board.
+
+    On large boards with a short win length, moves far from all the symbols
+    played so far cannot take part in a threat within the search horizon.
+    Keeping the nearby moves only lets the search go deep on a 15x15 board.
+
+    Args:
+        state (BitBoard): The current game board.
+        moves (list): The moves to filter, as (row, col) tuples.
+        radius (int): The distance, in rows and columns, a move can be from
+            the nearest symbol.
+
+    Returns:
+        list: The nearby moves, in the order of `moves`. On an empty board,
+        the center cell only.
+    """
+    size = state.size
+    occupied = state.occupied()
+    if not occupied:
+        center = (size // 2, size // 2)
+        return [center] if center in moves else moves
+
+    # Grow the occupied cells by one cell in all 8 directions, `radius` times
+    not_first_col, not_last_col = column_masks(size)
+    area = occupied
+    for _ in range(radius):
+        area |= (area << 1) & not_first_col | (area >> 1) & not_last_col
+        area |= (area << size) | (area >> size)
+    area &= state.full
+
+    return [move for move in moves if area >> (move[0] * size + move[1]) & 1]
+
+
+@functools.lru_cache(maxsize=None)
+def cell_moves(size):
+    """Precompute the (row, col) move of every cell, so moves are not built on every call."""
+    return tuple(divmod(cell, size) for cell in range(size * size))
+
+
+@functools.lru_cache(maxsize=None)
+def column_masks(size):
+    """Return the bit masks of all the cells but the first, and but the last, column."""
+    first_col = sum(1 << (r * size) for r in range(size))
+    full = (1 << (size * size)) - 1
+    return full & ~first_col, full & ~(first_col << (size - 1))
+
+
+# The scores of a line holding 3, 2 or 1 symbols of one player and nothing
+# else, when a whole row, column or diagonal is needed to win
+LINE_WEIGHTS = (30, 10, 1)
+
+# With k-in-a-row rules, the factor a line's score grows by with every extra symbol
+THREAT_BASE = 4
+
+
+@functools.lru_cache(maxsize=None)
+def line_scores(size, win_length=None, weights=LINE_WEIGHTS, threat_base=THREAT_BASE):
+    """Precompute the `evaluate_board` score of a line from its contents.
+
+    When a whole row, column or diagonal is needed to win, lines score as in
+    `evaluate_board`. With a shorter `win_length`, a line that only holds the
+    symbols of one player scores 4 times more for every extra symbol, so
+    lines that are one or two symbols short of a win, the threats, weigh the
+    most.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        weights (tuple): The scores of a line with 3, 2 and 1 symbols of one
+            player, see `LINE_WEIGHTS`.
+        threat_base (int): The growth of a line's score with every extra
+            symbol under k-in-a-row rules, see `THREAT_BASE`.
+
+    Returns:
+        tuple: A table where `table[p][o]` is the score of a line holding `p`
+        symbols of the evaluated player and `o` symbols of the opponent.
+    """
+    k = win_length or size
+    table = [[0] * (k + 1) for _ in range(k + 1)]
+
+    for count_player in range(k + 1):
+        for count_opponent in range(k + 1 - count_player):
+            count_empty = k - count_player - count_opponent
+            score = 0
+            if k < size:
+                if count_opponent == 0 and 0 < count_player < k:
+                    score = threat_base ** (count_player - 1)
+                elif count_player == 0 and 0 < count_opponent < k:
+                    score = -threat_base ** (count_opponent - 1)
+            elif count_opponent == 0:
+                if count_player == 3:
+                    score = weights[0]
+                elif count_player == 2 and count_empty == 1:
+                    score = weights[1]
+                elif count_player == 1 and count_empty == 2:
+                    score = weights[2]
+            elif count_player == 0:
+                if count_opponent == 3:
+                    score = -weights[0]
+                elif count_opponent == 2 and count_empty == 1:
+                    score = -weights[1]
+                elif count_opponent == 1 and count_empty == 2:
+                    score = -weights[2]
+            table[count_player][count_opponent] = score
+
+    return tuple(tuple(row) for row in table)
+
+
+def to_bitboard(board, win_length=None):
+    """Convert a 2D array game board to a `BitBoard`.
+
+    Args:
+        board (2D array): The game board to convert.
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to the size of the board, or to the win length of
+            `board` if it is already a `BitBoard`.
+
+    Returns:
+        BitBoard: A bitboard holding the same symbols as `board`.
+    """
+    if isinstance(board, BitBoard):
+        if win_length is None or win_length == board.win_length:
+            return board.copy()
+        return BitBoard(board.size, board.x, board.o, board.keys, win_length)
+
+    size = len(board)
+    x = o = 0
+    for r in range(size):
+        for c in range(size):
+            if board[r][c] == 'X':
+                x |= 1 << (r * size + c)
+            elif board[r][c] == 'O':
+                o |= 1 << (r * size + c)
+
+    return BitBoard(size, x, o, win_length=win_length)
+
+
+def to_board(bitboard):
+    """Convert a `BitBoard` back to a 2D array game board.
+
+    Args:
+        bitboard (BitBoard): The bitboard to convert.
+
+    Returns:
+        2D array: A `size X size` game board holding the same symbols.
+    """
+    size = bitboard.size
+    board = intialize_board(size)
+    for r in range(size):
+        for c in range(size):
+            bit = 1 << (r * size + c)
+            if bitboard.x & bit:
+                board[r][c] = 'X'
+            elif bitboard.o & bit:
+                board[r][c] = 'O'
+
+    return board
+
+
+# -------------------------------------------------------------------------------
+# Transposition table.
+# Positions reached through different move orders are searched only once: the
+# result of a search is stored under the Zobrist hash of the position and
+# reused when the same position comes up again.
+# -------------------------------------------------------------------------------
+
+# Bound types of a stored value
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Approximate memory used by one stored entry (tuple, key and move objects)
+TT_ENTRY_BYTES = 200
+
+
+class TranspositionTable:
+    """A fixed-size hash table of search results keyed by Zobrist hash.
+
+    Every slot holds at most one entry `(key, depth, flag, value, move)`, where
+    `depth` is the remaining search depth below the position and `flag` tells
+    whether `value` is the EXACT value, a LOWER bound or an UPPER bound.
+
+    When two positions map to the same slot, the entry searched to the greater
+    depth is kept, unless the stored entry is left over from an earlier search,
+    in which case it is always replaced.
+
+    Attributes:
+        size (int): The number of slots, a power of two.
+        hits (int): Probes that found an entry for the position.
+        misses (int): Probes that found an empty slot.
+        collisions (int): Probes that found an entry for another position.
+        stores (int): Entries written to the table.
+        overwrites (int): Stores that replaced an entry of another position.
+    """
+
+    def __init__(self, size_mb=16):
+        """
+        Args:
+            size_mb (float): The memory budget of the table in megabytes.
+        """
+        self.size_mb = size_mb
+        entries = max(1, int(size_mb * 1024 * 1024) // TT_ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.slots = [None] * self.size
+        self.generations = [0] * self.size
+        self.generation = 0
+        self.hits = self.misses = self.collisions = 0
+        self.stores = self.overwrites = 0
+
+    def new_search(self):
+        """Mark the entries stored so far as belonging to an earlier search."""
+        self.generation += 1
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self.__init__(self.size_mb)
+
+    def probe(self, key):
+        """Look up the entry stored for a position.
+
+        Args:
+            key (int): The Zobrist hash of the position.
+
+        Returns:
+            tuple: The `(key, depth, flag, value, move)` entry, or None when the
+            position is not in the table.
+        """
+        entry = self.slots[key & self.mask]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def peek(self, key):
+        """Look up the entry stored for a position without counting the probe."""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, flag, value, move):
+        """Store the result of a search, subject to the replacement policy.
+
+        Args:
+            key (int): The Zobrist hash of the position.
+            depth (int): The remaining depth the position was searched to.
+            flag (int): EXACT, LOWER or UPPER.
+            value (int): The value found by the search.
+            move (tuple): The best move found by the search, or None.
+        """
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None and entry[0] != key:
+            if self.generations[index] == self.generation and entry[1] > depth:
+                return
+            self.overwrites += 1
+        self.slots[index] = (key, depth, flag, value, move)
+        self.generations[index] = self.generation
+        self.stores += 1
+
+    def stats(self):
+        """Return the table counters as a dictionary.
+
+        Returns:
+            dict: The size, estimated memory, fill rate, hit rate and the
+            hit/miss/collision/store/overwrite counters.
+        """
+        probes = self.hits + self.misses + self.collisions
+        used = self.size - self.slots.count(None)
+        return {
+            'size': self.size,
+            'memory_bytes': self.size * TT_ENTRY_BYTES,
+            'used': used,
+            'fill_rate': used / self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'hit_rate': self.hits / probes if probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+        }
+
+
+# -------------------------------------------------------------------------------
+# Position cache.
+# The results of whole searches are kept across moves and games in one cache
+# per process, so a position searched before, in any game, to the same depth
+# is answered at once. The cache can be saved to disk and loaded back.
+# -------------------------------------------------------------------------------
+
+# Approximate memory used by one cached result (key and value tuples, dict slot)
+CACHE_ENTRY_BYTES = 320
+
+# Snapshot file header (magic, format version, number of entries) and entry
+# (key, size, win length, depth, side to move, value, move cell on the
+# canonical board or -1)
+CACHE_MAGIC = b'XOPC'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<4sHI')
+CACHE_ENTRY = struct.Struct('<QBBBBih')
+
+
+class PositionCache:
+    """A size-bounded cache of search results with least recently used eviction.
+
+    Results are keyed by the canonical key of the position (so symmetric
+    positions share one entry), the board size and win length, the search
+    depth, the side to move and the evaluator, and hold the value of the
+    position for the side to move and its best move.
+
+    Results of searches with `evaluate_board` have None as their evaluator;
+    others have the `identity()` of their `engine.Evaluator`. Only the
+    results of `evaluate_board` are saved in snapshots.
+
+    Attributes:
+        max_entries (int): The most results kept.
+        hits (int): Lookups that found a result.
+        misses (int): Lookups that did not.
+        evictions (int): Results dropped to make room for newer ones.
+    """
+
+    def __init__(self, size_mb=64):
+        """
+        Args:
+            size_mb (float): The memory budget of the cache in megabytes.
+        """
+        self.size_mb = size_mb
+        self.max_entries = max(1, int(size_mb * 1024 * 1024) // CACHE_ENTRY_BYTES)
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def cache_key(state, depth, evaluator=None):
+        """Return the cache key of a position and the symmetry of its canonical image."""
+        key, index = canonical_key(state)
+        identity = None if evaluator is None else evaluator.identity()
+        return (key, state.size, state.win_length, depth, player(state) == 'O', identity), index
+
+    def get(self, state, depth, evaluator=None):
+        """Look up the result of searching a position to a depth.
+
+        Args:
+            state (BitBoard): The current game board.
+            depth (int): The depth of the search.
+            evaluator (engine.Evaluator): The heuristic of the search, or None
+                for `evaluate_board`.
+
+        Returns:
+            tuple: The value for the side to move and the best move mapped
+            onto `state`, as returned by `alpha_beta_search`, or None.
+        """
+        key, index = self.cache_key(state, depth, evaluator)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        value, cell = entry
+        move = None
+        if cell >= 0:
+            move = divmod(inverse_symmetries(state.size)[index][cell], state.size)
+        return value, move
+
+    def put(self, state, depth, value, move, evaluator=None):
+        """Store the result of searching a position to a depth.
+
+        Args:
+            state (BitBoard): The searched game board.
+            depth (int): The depth of the search.
+            value (int): The value of the position for the side to move.
+            move (tuple): The best move as (row, col), or None.
+            evaluator (engine.Evaluator): The heuristic of the search, or None
+                for `evaluate_board`.
+        """
+        key, index = self.cache_key(state, depth, evaluator)
+        cell = -1
+        if move is not None:
+            cell = symmetries(state.size)[index][move[0] * state.size + move[1]]
+        self.entries[key] = (int(value), cell)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all the results and reset the counters."""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def save(self, path):
+        """Write a snapshot of the cache, from the least to the most recently used result.
+
+        The file is written next to `path` first and then moved over it, so a
+        crash never leaves a partial snapshot behind. Only the results of
+        `evaluate_board` are saved; those of other evaluators are left out.
+
+        Args:
+            path (str): The path of the snapshot file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        entries = [(key, result) for key, result in self.entries.items() if key[5] is None]
+        with open(temp_path, 'wb') as file:
+            file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(entries)))
+            for (key, size, win_length, depth, side, _), (value, cell) in entries:
+                file.write(CACHE_ENTRY.pack(key, size, win_length, depth, side, value, cell))
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        """Warm the cache up from a snapshot written by `save`.
+
+        Loaded results count as less recently used than the results already
+        in the cache. Only the most recent results are kept if the snapshot
+        is larger than the cache.
+
+        Args:
+            path (str): The path of the snapshot file.
+
+        Returns:
+            int: The number of results loaded.
+
+        Raises:
+            ValueError: If the file is not a cache snapshot.
+        """
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < CACHE_HEADER.size:
+            raise ValueError(f"{path} is not a position cache snapshot")
+        magic, version, count = CACHE_HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION \
+                or len(data) != CACHE_HEADER.size + count * CACHE_ENTRY.size:
+            raise ValueError(f"{path} is not a position cache snapshot")
+
+        loaded = collections.OrderedDict()
+        for key, size, win_length, depth, side, value, cell in \
+                CACHE_ENTRY.iter_unpack(memoryview(data)[CACHE_HEADER.size:]):
+            loaded[key, size, win_length, depth, bool(side), None] = (value, cell)
+        loaded.update(self.entries)
+        while len(loaded) > self.max_entries:
+            loaded.popitem(last=False)
+        self.entries = loaded
+        return count
+
+    def stats(self):
+        """Return the cache counters as a dictionary.
+
+        Returns:
+            dict: The number of results and the most kept, the estimated
+            memory, the hit ratio and the hit/miss/eviction counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'memory_bytes': len(self.entries) * CACHE_ENTRY_BYTES,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+# The cache shared by all the searches of this process, see `position_cache`
+_position_cache = None
+
+
+def default_cache_path():
+    """Return the path the game saves its position cache to between runs."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books', 'positions.bin')
+
+
+def position_cache(size_mb=None):
+    """Return the position cache shared by all the searches of this process.
+
+    Args:
+        size_mb (float): The memory budget of the cache, used when it is
+            created by the first call. Defaults to 64 megabytes.
+
+    Returns:
+        PositionCache: The process-wide cache.
+    """
+    global _position_cache
+    if _position_cache is None:
+        _position_cache = PositionCache(size_mb or 64)
+    return _position_cache
+
+
+# -------------------------------------------------------------------------------
+# Move ordering.
+# Alpha-beta prunes the most when the best move is searched first. The move
+# ordering sits between `actions` and the loops of `negamax`.
+# -------------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def center_weights(size):
+    """Precompute how close every cell is to the center of the board.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+
+    Returns:
+        tuple: `weights[cell]` is 0 for the corner cells and grows by one per
+        step towards the center.
+    """
+    n = size - 1
+    return tuple(n - (abs(2 * r - n) + abs(2 * c - n)) // 2
+                 for r in range(size) for c in range(size))
+
+
+class MoveOrdering:
+    """Order moves with static, killer move and history heuristics.
+
+    * Static ordering puts moves that complete a line first, then moves that
+      block a line the opponent is about to complete, and favors the center
+      of the board.
+    * Killer moves are the last moves that caused a cutoff at the same ply;
+      they are likely to cut off again in sibling positions.
+    * The history heuristic scores every move of each player by how often and
+      how deep it caused cutoffs anywhere in the tree.
+
+    The ordering also counts cutoffs, and how many of them came from the
+    first move searched, to show how good the ordering is.
+
+    Attributes:
+        cutoffs (int): Nodes where a move caused a beta cutoff.
+        first_move_cutoffs (int): Cutoffs caused by the first move searched.
+    """
+
+    def __init__(self, static=True, killers=2, history=True):
+        """
+        Args:
+            static (bool): Whether to use the static center/threat ordering.
+            killers (int): The number of killer moves kept per ply, 0 for none.
+            history (bool): Whether to use the history heuristic.
+        """
+        self.static = static
+        self.killers = killers
+        self.history = history
+        self.killer_moves = []
+        self.history_scores = {}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """Forget the killer moves and age the history scores of earlier searches."""
+        self.killer_moves = []
+        for key in self.history_scores:
+            self.history_scores[key] //= 2
+
+    def threat_cells(self, state, player_symbol):
+        """Find the cells that complete a line for either player.
+
+        Args:
+            state (BitBoard): The current game board.
+            player_symbol (str): The symbol of the player to move.
+
+        Returns:
+            tuple: The bit mask of the cells where the player to move completes
+            a line, and the bit mask of the cells where the opponent would.
+        """
+        return threat_cells(state, player_symbol)
+
+    def order(self, state, moves, depth):
+        """Sort the moves of a position, best first.
+
+        Moves that complete a line come first, then moves that block a line
+        the opponent is about to complete, then killer moves, then moves by
+        history score and finally by closeness to the center.
+
+        Args:
+            state (BitBoard): The current game board.
+            moves (list): The moves to sort.
+            depth (int): The current depth (ply) of the search.
+
+        Returns:
+            list: The sorted moves.
+        """
+        p = player(state)
+        size = state.size
+        killers = self.killer_moves[depth] if depth < len(self.killer_moves) else ()
+        wins = blocks = 0
+        if self.static:
+            wins, blocks = self.threat_cells(state, p)
+            center = center_weights(size)
+        history = self.history_scores if self.history else {}
+
+        scores = {}
+        for move in moves:
+            cell = move[0] * size + move[1]
+            scores[move] = (
+                2 if wins >> cell & 1 else 1 if blocks >> cell & 1 else 0,
+                move in killers,
+                history.get((p, move), 0),
+                center[cell] if self.static else 0,
+            )
+
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def record_cutoff(self, player_symbol, move, depth, draft, first):
+        """Update the heuristics after a move caused a beta cutoff.
+
+        Args:
+            player_symbol (str): The symbol of the player who made the move.
+            move (tuple): The move that caused the cutoff.
+            depth (int): The depth (ply) of the position the move was made in.
+            draft (int): The remaining depth searched below that position.
+            first (bool): Whether the move was the first one searched.
+        """
+        self.cutoffs += 1
+        if first:
+            self.first_move_cutoffs += 1
+
+        if self.killers:
+            while len(self.killer_moves) <= depth:
+                self.killer_moves.append([])
+            killers = self.killer_moves[depth]
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[self.killers:]
+
+        if self.history:
+            key = (player_symbol, move)
+            self.history_scores[key] = self.history_scores.get(key, 0) + draft * draft
+
+    def first_move_cutoff_rate(self):
+        """Return the share of cutoffs caused by the first move searched."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+
+# -------------------------------------------------------------------------------
+# Threats.
+# The line counts of the board show at once where a player completes a line
+# with one move. Late in the game these threats force the next move, which
+# needs no search.
+# -------------------------------------------------------------------------------
+
+def threat_cells(state, player_symbol):
+    """Find the cells that complete a line for either player.
+
+    Args:
+        state (BitBoard): The current game board.
+        player_symbol (str): The symbol of the player to move.
+
+    Returns:
+        tuple: The bit mask of the cells where the player to move completes
+        a line, and the bit mask of the cells where the opponent would.
+    """
+    threat = state.win_length - 1
+    ours, theirs = (state.x_counts, state.o_counts) if player_symbol == 'X' \
+        else (state.o_counts, state.x_counts)
+
+    # Most positions have no threat at all, which the count lists show quickly
+    wins = blocks = 0
+    if threat not in ours and threat not in theirs:
+        return wins, blocks
+
+    lines = state.lines
+    empty = state.full & ~state.occupied()
+    for line, count in enumerate(ours):
+        if count == threat and theirs[line] == 0:
+            wins |= lines[line] & empty
+    for line, count in enumerate(theirs):
+        if count == threat and ours[line] == 0:
+            blocks |= lines[line] & empty
+    return wins, blocks
+
+
+def fork_cells(state, player_symbol):
+    """Find the cells that create two threats at once for the player to move.
+
+    After such a move (a fork), the player threatens to complete a line at two
+    different cells, and the opponent can only block one of them.
+
+    Args:
+        state (BitBoard): The current game board.
+        player_symbol (str): The symbol of the player to move.
+
+    Returns:
+        int: The bit mask of the fork cells.
+    """
+    threat = state.win_length - 2
+    ours, theirs = (state.x_counts, state.o_counts) if player_symbol == 'X' \
+        else (state.o_counts, state.x_counts)
+    lines = state.lines
+    empty = state.full & ~state.occupied()
+
+    # The cells each move would threaten to complete, by move
+    completions = {}
+    for line, count in enumerate(ours):
+        if count == threat and theirs[line] == 0:
+            cells = lines[line] & empty
+            while cells:
+                low = cells & -cells
+                completions[low] = completions.get(low, 0) | cells & ~low
+                cells ^= low
+
+    forks = 0
+    for cell, threatened in completions.items():
+        # Two threats completed by the same cell are only one threat
+        if threatened & (threatened - 1):
+            forks |= cell
+    return forks
+
+
+def mask_moves(mask, size):
+    """Return the cells of a bit mask as (row, col) moves, in row-major order."""
+    table = cell_moves(size)
+    moves = []
+    while mask:
+        low = mask & -mask
+        moves.append(table[low.bit_length() - 1])
+        mask ^= low
+    return moves
+
+
+def forced_move(state):
+    """Find the move of the player to move when threats decide it.
+
+    In order, the player completes a line if they can, blocks the line the
+    opponent is about to complete if there is one, or plays a fork, which
+    wins in three moves. Finding the move takes one pass over the line counts
+    of the board instead of a search.
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+
+    Returns:
+        tuple: The value of the move for the player to move and the move
+        itself as (row, col), or None when no move is forced. The value is
+        WIN_VALUE for a won game and -WIN_VALUE for a lost one (the opponent
+        threatens two lines). After a single forced block the game goes on,
+        and the value is None: only a search of the position after the block
+        tells it, which `negamax` runs on the block alone.
+    """
+    state = to_bitboard(state)
+    if terminal(state):
+        return None
+    p = player(state)
+    size = state.size
+
+    wins, blocks = threat_cells(state, p)
+    if wins:
+        return WIN_VALUE, mask_moves(wins & -wins, size)[0]
+    if blocks:
+        move = mask_moves(blocks & -blocks, size)[0]
+        if blocks & (blocks - 1):
+            return -WIN_VALUE, move
+        return None, move
+
+    forks = fork_cells(state, p)
+    if forks:
+        return WIN_VALUE, mask_moves(forks & -forks, size)[0]
+    return None
+
+
 # -------------------------------------------------------------------------------
 # The following functions are the constituent elements of a game.
 # Using these functions, we can build an agent that "thinks" about
@@ -176,12 +1485,15 @@ def player(state):
     board to determine whose turn it is.
 
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
 
     Returns:
         str: The symbol ('X' or 'O') of the player whose turn it is based on
         the number of 'X's and 'O's on the board.
     """
+    if isinstance(state, BitBoard):
+        return 'X' if state.x.bit_count() == state.o.bit_count() else 'O'
+
     size = len(state)
 
     # Count the number of 'X' and 'O' symbols on the board
@@ -200,7 +1512,7 @@ def actions(state, player):
     The `actions` function scans the provided game board and identifies all the
     empty cells where a player can make a valid move.
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
         player (str): The symbol ('X' or 'O') of the player for whom valid moves
                       are being generated.
     Returns:
@@ -208,6 +1520,19 @@ def actions(state, player):
                      the specified player. Each tuple contains the row and column
                      indices (starting from 1) of an empty cell on the board.
     """
+    if isinstance(state, BitBoard):
+        table = cell_moves(state.size)
+        empty = state.full & ~(state.x | state.o)
+        moves = []
+
+        # Walk the empty cells from the lowest bit, i.e. in row-major order
+        while empty:
+            low = empty & -empty
+            moves.append(table[low.bit_length() - 1])
+            empty ^= low
+
+        return moves
+
     size = len(state)
 
     # Generate a list of valid moves as tuples (row, column)
@@ -223,13 +1548,18 @@ def result(state, action):
     the specified row and column according to the player's symbol.
 
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
         action (tuple): A tuple containing the row and column indices (starting from 1)
                         where the player wants to make a move.
 
     Returns:
         2D array: The new game board after applying the specified action.
     """
+    if isinstance(state, BitBoard):
+        state = state.copy()
+        state.make(action)
+        return state
+
     r, c = action[0], action[1]
 
     state = copy.deepcopy(state)
@@ -248,11 +1578,15 @@ def terminal(state):
     i.e., if either player 'X' or 'O' has won, or if the game has ended in a draw.
 
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
 
     Returns:
         bool: True if the game is in a terminal state (win or draw), False otherwise.
     """
+    if isinstance(state, BitBoard):
+        return state.x_lines > 0 or state.o_lines > 0 \
+            or state.occupied() == state.full
+
     return check_win(state, 'X') \
         or check_win(state, 'O') \
         or check_draw(state)
@@ -268,7 +1602,7 @@ def utility(state, max_player):
     minimizing player wins, and 0 if the game is a draw.
 
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
         max_player (str): The symbol of the maximizing player.
 
     Returns:
@@ -277,16 +1611,27 @@ def utility(state, max_player):
 
     
     if check_win(state, max_player):
-        return 1000
+        return WIN_VALUE
     elif check_win(state, 'X' if max_player == 'O' else 'O'):
-        return -1000
+        return -WIN_VALUE
     elif check_draw(state):
         return 0
     else:
         return None
 
 
-def is_cutoff(depth):
+# The depth at which the search is cut off and positions are evaluated
+CUTOFF_DEPTH = 4
+
+# The value of a won game for the winner; heuristic scores stay below it
+WIN_VALUE = 1000
+
+
+# The time the computer player thinks about a move, in milliseconds
+MOVE_TIME_MS = 1000
+
+
+def is_cutoff(depth, max_depth=CUTOFF_DEPTH):
     """Check if the search should be cut off at the specified depth.
 
     The `is_cutoff` function determines whether the search should be terminated
@@ -295,132 +1640,841 @@ def is_cutoff(depth):
 
     Args:
         depth (int): The current depth of the search.
+        max_depth (int): The depth at which the search is cut off.
 
     Returns:
         bool: True if the search should be cut off at the specified depth, False otherwise.
     """
-    return depth == 4
+    return depth >= max_depth
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when its time or node budget runs out."""
+
+
+class SearchLimits:
+    """The depth, time and node limits of a search.
+
+    Attributes:
+        max_depth (int): The depth at which the search is cut off.
+        deadline (float): The `time.perf_counter()` value at which the search
+            stops, or None for no time limit.
+        max_nodes (int): The number of nodes after which the search stops, or
+            None for no node limit.
+        nodes (int): The number of nodes visited so far.
+        pv (dict): Moves to search first, keyed by the Zobrist hash of the
+            position they are played in (the principal variation of the
+            previous iteration of `iterative_deepening_search`).
+        stats (SearchStats): Optional statistics the search records into.
+        stop (threading.Event): Optional event that stops the search when set,
+            from another thread.
+        best_move (tuple): The best move found at the root by the last search.
+    """
+
+    # Check the clock once every this many nodes
+    CLOCK_INTERVAL = 256
+
+    def __init__(self, max_depth=CUTOFF_DEPTH, time_ms=None, max_nodes=None, stats=None,
+                 stop=None):
+        """
+        Args:
+            max_depth (int): The depth at which the search is cut off.
+            time_ms (float): The time budget in milliseconds, or None.
+            max_nodes (int): The node budget, or None.
+            stats (SearchStats): Optional statistics to record, or None.
+            stop (threading.Event): Optional event stopping the search, or None.
+        """
+        self.max_depth = max_depth
+        self.deadline = None if time_ms is None else time.perf_counter() + time_ms / 1000
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.pv = {}
+        self.stats = stats
+        self.stop = stop
+        self.best_move = None
+
+    def count_node(self, depth=0):
+        """Count a visited node and stop the search when a budget runs out.
+
+        Args:
+            depth (int): The depth of the node, recorded in `stats`.
+
+        Raises:
+            SearchTimeout: If the node or time budget is exhausted, or the
+                search was stopped.
+        """
+        self.nodes += 1
+        if self.stats is not None:
+            self.stats.count_node(depth)
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchTimeout()
+        if self.nodes % self.CLOCK_INTERVAL == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+
+
+# Held while `SearchStats.profile` has replaced the functions of the search
+_profile_lock = threading.Lock()
+
+
+class SearchStats:
+    """Statistics of one or more searches, recorded when passed in `SearchLimits`.
+
+    Counting nodes and cutoffs costs a few attribute updates per node, and
+    nothing when no statistics are passed. Phase timing is heavier and only
+    runs inside `profile()`.
+
+    Attributes:
+        nodes_by_depth (list): The number of nodes visited at every depth.
+        terminals (int): Nodes where the game was over.
+        leaves (int): Nodes valued by `evaluate_board` at the cut-off depth.
+        table_hits (int): Nodes answered by the transposition table.
+        expanded (int): Nodes whose moves were searched.
+        children (int): Moves searched from the expanded nodes.
+        cutoffs (int): Expanded nodes where a move caused a cutoff.
+        first_move_cutoffs (int): Cutoffs caused by the first move searched.
+        cutoffs_by_depth (list): The number of cutoffs at every depth.
+        phase_seconds (dict): Time spent in every phase of the search, see
+            `PROFILE_PHASES`.
+        searches (list): One dict per search or iteration, with its depth,
+            nodes, seconds and whether it completed.
+    """
+
+    # The functions timed for every phase by `profile()`: (owner, attribute name),
+    # where None stands for this module
+    PROFILE_PHASES = {
+        'terminal': ((None, 'terminal'), (None, 'utility')),
+        'evaluate': ((None, 'evaluate_board'), (None, 'batch_leaf_values')),
+        'moves': ((None, 'actions'), (None, 'nearby_moves'), (None, 'unique_moves'),
+                  ('MoveOrdering', 'order')),
+        'table': ((None, 'probe_table'), (None, 'store_table')),
+        'make': (('BitBoard', 'make'), ('BitBoard', 'unmake')),
+    }
+
+    def __init__(self):
+        self.nodes_by_depth = []
+        self.terminals = 0
+        self.leaves = 0
+        self.table_hits = 0
+        self.expanded = 0
+        self.children = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.cutoffs_by_depth = []
+        self.phase_seconds = {phase: 0.0 for phase in self.PROFILE_PHASES}
+        self.searches = []
+        self._recorded_nodes = 0
+
+    @property
+    def nodes(self):
+        """The number of nodes visited in all the searches."""
+        return sum(self.nodes_by_depth)
+
+    @property
+    def seconds(self):
+        """The time spent in all the searches."""
+        return sum(search['seconds'] for search in self.searches)
+
+    def count_node(self, depth, count=1):
+        """Count nodes visited at a depth."""
+        while len(self.nodes_by_depth) <= depth:
+            self.nodes_by_depth.append(0)
+            self.cutoffs_by_depth.append(0)
+        self.nodes_by_depth[depth] += count
+
+    def record_expansion(self, depth, searched, cutoff_index=None):
+        """Record the moves searched from a node.
+
+        Args:
+            depth (int): The depth of the node.
+            searched (int): The number of moves searched.
+            cutoff_index (int): The index of the move that caused a cutoff, or
+                None if all the moves were searched.
+        """
+        self.expanded += 1
+        self.children += searched
+        if cutoff_index is not None:
+            self.cutoffs += 1
+            self.cutoffs_by_depth[depth] += 1
+            if cutoff_index == 0:
+                self.first_move_cutoffs += 1
+
+    def record_search(self, depth, seconds, completed=True):
+        """Record the end of a search, or of an iteration of a search.
+
+        Args:
+            depth (int): The depth the search was cut off at.
+            seconds (float): The time the search took.
+            completed (bool): False if a budget ran out before the end.
+        """
+        nodes = self.nodes
+        self.searches.append({'depth': depth, 'nodes': nodes - self._recorded_nodes,
+                              'seconds': seconds, 'completed': completed})
+        self._recorded_nodes = nodes
+
+    def branching_factor(self):
+        """Return the average number of moves searched from an expanded node."""
+        return self.children / self.expanded if self.expanded else 0.0
+
+    def effective_branching_factor(self):
+        """Return the effective branching factor of the deepest completed search.
+
+        It is the `b` for which a uniform tree of the search depth `d` holds as
+        many nodes as the search visited, `nodes = b ** d`.
+        """
+        completed = [search for search in self.searches
+                     if search['completed'] and search['depth'] > 0]
+        if not completed:
+            return 0.0
+        search = max(completed, key=lambda search: search['depth'])
+        return search['nodes'] ** (1 / search['depth'])
+
+    def cutoff_rate(self):
+        """Return the fraction of expanded nodes that were cut off."""
+        return self.cutoffs / self.expanded if self.expanded else 0.0
+
+    def first_move_cutoff_rate(self):
+        """Return the fraction of cutoffs caused by the first move searched."""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def nodes_per_second(self):
+        """Return the number of nodes visited per second of search."""
+        seconds = self.seconds
+        return self.nodes / seconds if seconds else 0.0
+
+    @contextlib.contextmanager
+    def profile(self):
+        """Time the phases of the searches run inside the `with` block.
+
+        The functions of every phase in `PROFILE_PHASES` are replaced with
+        timed versions for the duration of the block, so the search code runs
+        unchanged, and at full speed outside of it. The timing itself slows the
+        search down; the time of the rest of the search is reported as the
+        'search' phase by `to_dict`. Searches in worker processes are not
+        timed.
+
+        Only the calls of the thread that entered the block are timed. Other
+        threads, such as a `Ponderer`, go through the timed versions too, but
+        untimed. One block at a time may run in a process.
+
+        Raises:
+            RuntimeError: If searches are already being profiled.
+        """
+        if not _profile_lock.acquire(blocking=False):
+            raise RuntimeError("searches are already being profiled")
+        module = sys.modules[__name__]
+        originals = []
+        try:
+            thread = threading.get_ident()
+            for phase, functions in self.PROFILE_PHASES.items():
+                for owner_name, name in functions:
+                    owner = module if owner_name is None else getattr(module, owner_name)
+                    function = getattr(owner, name)
+                    originals.append((owner, name, function))
+                    setattr(owner, name, self._timed(function, phase, thread))
+            yield self
+        finally:
+            for owner, name, function in reversed(originals):
+                setattr(owner, name, function)
+            _profile_lock.release()
+
+    def _timed(self, function, phase, thread):
+        seconds = self.phase_seconds
+        clock = time.perf_counter
+        get_ident = threading.get_ident
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if get_ident() != thread:
+                return function(*args, **kwargs)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[phase] += clock() - start
+        return timed
+
+    def to_dict(self):
+        """Return the statistics and the measures derived from them as a dict."""
+        phases = dict(self.phase_seconds)
+        if any(phases.values()):
+            phases['search'] = max(0.0, self.seconds - sum(phases.values()))
+        return {
+            'nodes': self.nodes,
+            'nodes_by_depth': list(self.nodes_by_depth),
+            'terminals': self.terminals,
+            'leaves': self.leaves,
+            'table_hits': self.table_hits,
+            'expanded': self.expanded,
+            'cutoffs': self.cutoffs,
+            'cutoffs_by_depth': list(self.cutoffs_by_depth),
+            'cutoff_rate': self.cutoff_rate(),
+            'first_move_cutoff_rate': self.first_move_cutoff_rate(),
+            'branching_factor': self.branching_factor(),
+            'effective_branching_factor': self.effective_branching_factor(),
+            'seconds': self.seconds,
+            'nodes_per_second': self.nodes_per_second(),
+            'phase_seconds': phases,
+            'searches': list(self.searches),
+        }
+
+    def to_json(self, **kwargs):
+        """Return the statistics as a JSON string; `kwargs` go to `json.dumps`."""
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix='xogame_search'):
+        """Return the statistics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): The prefix of the metric names.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        stats = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name} {value}")
+
+        metric('nodes_total', 'counter', "Nodes visited, by depth.",
+               [({'depth': depth}, count) for depth, count in enumerate(stats['nodes_by_depth'])])
+        metric('cutoffs_total', 'counter', "Nodes cut off, by depth.",
+               [({'depth': depth}, count)
+                for depth, count in enumerate(stats['cutoffs_by_depth'])])
+        for name in ('terminals', 'leaves', 'table_hits', 'expanded'):
+            metric(f'{name}_total', 'counter', f"Nodes counted as {name.replace('_', ' ')}.",
+                   [({}, stats[name])])
+        for name in ('cutoff_rate', 'first_move_cutoff_rate', 'branching_factor',
+                     'effective_branching_factor', 'nodes_per_second'):
+            metric(name, 'gauge', f"The {name.replace('_', ' ')} of the search.",
+                   [({}, stats[name])])
+        metric('seconds_total', 'counter', "Time spent searching.", [({}, stats['seconds'])])
+        metric('phase_seconds_total', 'counter', "Time spent searching, by phase.",
+               [({'phase': phase}, seconds) for phase, seconds in stats['phase_seconds'].items()])
+
+        return '\n'.join(lines) + '\n'
+
+
+# Symmetric duplicate moves are removed at this depth and above
+SYMMETRY_DEPTH = 2
+
+# The bounds of the alpha-beta window, created once rather than at every node
+INF = float('inf')
+NEG_INF = float('-inf')
+
+# Half width of the window `iterative_deepening_search` first searches around
+# the value of the previous iteration
+ASPIRATION_WINDOW = 40
+
+
+def table_key(state):
+    """Compute the transposition table key of a position.
+
+    Symmetric positions have the same value, so they share the key of their
+    canonical image (see `canonical_key`). Values in the search are seen from
+    the player to move, who is known from the position itself.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        tuple: The 64-bit key of the position and the index of the symmetry
+        mapping the board onto the canonical image the table entry refers to.
+    """
+    return canonical_key(state)
+
+
+def probe_table(table, state, position, depth, alpha, beta):
+    """Look up a position in the transposition table.
+
+    Args:
+        table (TranspositionTable): The transposition table.
+        state (BitBoard): The current game board.
+        position (tuple): The key and symmetry index from `table_key`.
+        depth (int): The remaining depth the position is about to be searched to.
+        alpha (float): The alpha value for alpha-beta pruning.
+        beta (float): The beta value for alpha-beta pruning.
+
+    Returns:
+        tuple: The stored value, or None when it cannot replace the search
+        (the entry is missing, too shallow, or its bound does not fall outside
+        the alpha-beta window), and the stored best move mapped back onto
+        `state`, or None.
+    """
+    key, index = position
+    entry = table.probe(key)
+    if entry is None:
+        return None, None
+
+    _, stored_depth, flag, value, move = entry
+    if move is not None:
+        move = transform_move(move, inverse_symmetries(state.size)[index], state.size)
+    if stored_depth >= depth and (flag == EXACT
+                                  or (flag == LOWER and value >= beta)
+                                  or (flag == UPPER and value <= alpha)):
+        return value, move
+    return None, move
+
+
+def store_table(table, state, position, depth, value, move, alpha, beta):
+    """Store the result of searching a position in the transposition table.
+
+    Args:
+        table (TranspositionTable): The transposition table.
+        state (BitBoard): The current game board.
+        position (tuple): The key and symmetry index from `table_key`.
+        depth (int): The remaining depth the position was searched to.
+        value (int): The value found by the search.
+        move (tuple): The best move found by the search.
+        alpha (float): The alpha value the search of the position started with.
+        beta (float): The beta value the search of the position started with.
+    """
+    key, index = position
+    if value <= alpha:
+        flag = UPPER
+    elif value >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    if move is not None:
+        # Entries hold moves on the canonical image of the board
+        move = transform_move(move, symmetries(state.size)[index], state.size)
+    table.store(key, depth, flag, value, move)
+
+
+def order_first(moves, move):
+    """Move `move` to the front of `moves` if it is one of them.
+
+    Args:
+        moves (list): The moves to reorder in place.
+        move (tuple): The move to search first, or None.
+
+    Returns:
+        list: The reordered `moves`.
+    """
+    if move is not None and move in moves:
+        moves.remove(move)
+        moves.insert(0, move)
+    return moves
+
+
+def principal_variation(state, table, depth):
+    """Follow the best moves stored in the transposition table from a position.
+
+    Args:
+        state (BitBoard): The current game board.
+        table (TranspositionTable): The table filled by the search.
+        depth (int): The maximum number of moves to follow.
+
+    Returns:
+        list: Pairs of (Zobrist hash of a position, best move played in it).
+    """
+    state = state.copy()
+    line = []
+    for _ in range(depth):
+        if terminal(state):
+            break
+        key, index = table_key(state)
+        entry = table.peek(key)
+        if entry is None or entry[4] is None:
+            break
+        move = transform_move(entry[4], inverse_symmetries(state.size)[index], state.size)
+        line.append((state.key, move))
+        state.make(move)
+
+    return line
+
+
+def iterative_deepening_search(state, time_ms=None, max_nodes=None, max_depth=None, table=None,
+                               ordering=None, stats=None, cache=None,
+                               aspiration=ASPIRATION_WINDOW, endgame=True, stop=None,
+                               evaluator=None, solver=None):
+    """Get the best move for the computer player within a time and/or node budget.
 
+    The `iterative_deepening_search` function runs `alpha_beta_search` to depth 1,
+    2, 3, ... until the budget runs out, and returns the result of the deepest
+    search that completed. Each iteration searches the principal variation of
+    the previous one first, and the transposition table carries the best moves
+    of the other positions over between iterations.
 
-def alpha_beta_search(state):
-    """Get the optimal move for the computer player using the Minimax algorithm with alpha-beta search.
+    The value of an iteration is usually close to the value of the previous
+    one, so every iteration first searches a narrow aspiration window around
+    it, which prunes more, and searches again with an open window on the side
+    the value falls outside of, if it does.
+
+    Positions in the tablebase and games won or lost by threats (see
+    `forced_move`) are returned at once, and endgames are solved exactly (see
+    `alpha_beta_search`).
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+        time_ms (float): The time budget of the move in milliseconds, or None.
+        max_nodes (int): The node budget of the move, or None.
+        max_depth (int): The deepest iteration to run. Defaults to the number of
+            empty cells, i.e. searching the game to the end.
+        table (TranspositionTable): An optional transposition table, reused
+            across calls. A new one is used when it is not given.
+        ordering (MoveOrdering): An optional move ordering, reused across
+            calls. A new one is used when it is not given.
+        stats (SearchStats): Optional statistics to record every iteration in.
+        cache (PositionCache): An optional cache of search results. Iterations
+            with a cached result are not searched, and completed iterations
+            are cached.
+        aspiration (int): The half width of the aspiration window, or None to
+            search every iteration with a full window.
+        endgame (bool): Whether to answer from the tablebase and solve
+            endgames exactly.
+        stop (threading.Event): Optional event that ends the search, like a
+            budget running out, when another thread sets it.
+        evaluator (engine.Evaluator): Optional heuristic, see `negamax`.
+        solver (EndgameSolver): Optional solver of endgames, see
+            `alpha_beta_search`.
+
+    Returns:
+        tuple: A tuple containing the value of the best move and the move itself,
+               as returned by `alpha_beta_search`.
+
+    Raises:
+        SearchTimeout: If `stop` is set before the first iteration completes,
+            which leaves no move to return.
+    """
+    state = to_bitboard(state)
+    if table is None:
+        table = TranspositionTable()
+    if ordering is None:
+        ordering = MoveOrdering()
+    ordering.new_search()
+    if max_depth is None:
+        max_depth = (state.full & ~state.occupied()).bit_count()
+
+    # Solved positions need no search
+    solved = tablebase_move(state) if endgame else None
+    if solved is not None:
+        return solved
+
+    # Deeper searches cannot change a game the threats decide. A single
+    # forced block is searched, but only the block is (see `negamax`).
+    forced = forced_move(state)
+    if forced is not None and forced[0] is not None:
+        return forced
+
+    # The first iteration is always completed, unless stopped, so there is a
+    # move to return. It solves an endgame exactly, which deeper iterations
+    # cannot improve on.
+    value, move = alpha_beta_search(state, table,
+                                    SearchLimits(max_depth=1, stats=stats, stop=stop), ordering,
+                                    cache=cache, endgame=endgame, evaluator=evaluator,
+                                    solver=solver)
+    if endgame and is_endgame(state):
+        return value, move
+
+    limits = SearchLimits(time_ms=time_ms, max_nodes=max_nodes, stats=stats, stop=stop)
+    for depth in range(2, max_depth + 1):
+        # A won or lost game will not change with deeper searches
+        if abs(value) >= WIN_VALUE:
+            break
+
+        cached = cache.get(state, depth, evaluator) if cache is not None else None
+        if cached is not None:
+            value, move = cached
+            continue
+
+        limits.max_depth = depth
+        limits.pv = dict(principal_variation(state, table, depth - 1))
+        start = time.perf_counter()
+        try:
+            value, move = aspiration_search(state.copy(), value, aspiration, table, limits,
+                                            ordering, evaluator)
+        except SearchTimeout:
+            if stats is not None:
+                stats.record_search(depth, time.perf_counter() - start, completed=False)
+            break
+        if stats is not None:
+            stats.record_search(depth, time.perf_counter() - start)
+        if cache is not None:
+            cache.put(state, depth, value, move, evaluator)
+
+    return value, move
+
+
+def alpha_beta_search(state, table=None, limits=None, ordering=None, batch_leaves=False,
+                      cache=None, endgame=True, evaluator=None, solver=None):
+    """Get the optimal move for the computer player using Minimax with alpha-beta search.
 
     The `get_computer_move` function determines the best move for the computer player
     by applying the Minimax algorithm. It evaluates the possible moves based on the current
     game state, and returns the value and corresponding move that maximizes the utility
     for the computer player.
 
+    Positions in the tablebase of the board size are answered from it (see
+    `tablebase_move`), and when threats win or lose the game (see
+    `forced_move`), the move is returned without searching. Positions with
+    few empty cells left are solved exactly by the endgame solver (see
+    `is_endgame`) instead.
+
     Args:
-        state (2D array): The current game board.
+        state (2D array or BitBoard): The current game board.
+        table (TranspositionTable): An optional transposition table, reused
+            across calls to skip positions that were already searched.
+        limits (SearchLimits): Optional search limits. Defaults to cutting the
+            search off at `CUTOFF_DEPTH`. Pass `SearchLimits(stats=SearchStats())`
+            to record statistics of the search.
+        ordering (MoveOrdering): Optional move ordering, see `negamax`.
+        batch_leaves (bool): Whether to value leaves in batches, see `negamax`.
+        cache (PositionCache): An optional cache of search results, such as
+            `position_cache()`. A result cached for the position and depth is
+            returned without searching, and completed searches are cached.
+        endgame (bool): Whether to answer from the tablebase and solve
+            endgames exactly.
+        evaluator (engine.Evaluator): Optional heuristic, see `negamax`.
+        solver (EndgameSolver): The solver of endgames for the board, with the
+            positions it has solved. Defaults to the one the process shares,
+            `endgame_solver()`.
 
     Returns:
         tuple: A tuple containing the utility value of the best move and the corresponding
                move itself. The move is represented as a tuple containing the row and
                column indices (starting from 1) on the board.
     """
-    max_player = player(state)
-    value, move = max_value(state, max_player, 0 , float('-inf'), float('inf'))
+    state = to_bitboard(state)
+    if limits is None:
+        limits = SearchLimits()
+    max_depth = limits.max_depth
+    solved = tablebase_move(state) if endgame else None
+    if solved is not None:
+        limits.best_move = solved[1]
+        return solved
+    forced = forced_move(state)
+    if forced is not None and forced[0] is None:
+        # A single forced block is valued by searching it alone, see `negamax`
+        forced = None
+    if forced is None and endgame and is_endgame(state) and not terminal(state):
+        if solver is None:
+            solver = endgame_solver(state.size, state.win_length)
+        value, move = solver.solve(state, limits.stop)
+        forced = value * WIN_VALUE, move
+    if forced is not None:
+        limits.best_move = forced[1]
+        return forced
+    if cache is not None:
+        cached = cache.get(state, max_depth, evaluator)
+        if cached is not None:
+            return cached
+    if table is not None:
+        table.new_search()
+    stats = limits.stats
+    start = time.perf_counter()
+    value = negamax(state, 0, NEG_INF, INF, table, limits, ordering, batch_leaves, evaluator)
+    move = limits.best_move
+    if stats is not None:
+        stats.record_search(max_depth, time.perf_counter() - start)
+    if cache is not None:
+        cache.put(state, max_depth, value, move, evaluator)
     return value, move
 
 
-def max_value(state, max_player, depth, alpha, beta):
-    """Evaluate the maximum value for the current state in the Minimax algorithm.
-
-    The `max_value` function represents the maximizing player's perspective in the
-    Minimax algorithm. It recursively explores the game tree to find the move that
-    maximizes the utility value for the maximizing player.
+def aspiration_search(state, guess, window, table=None, limits=None, ordering=None,
+                      evaluator=None):
+    """Search the root of the game tree in an aspiration window around a guess.
 
     Args:
-        state (2D array): The current game board.
-        max_player (str): The symbol ('X' or 'O') of the maximizing player.
-        alpha (float): The alpha value for alpha-beta pruning.
-        beta (float): The beta value for alpha-beta pruning.
+        state (BitBoard): The current game board.
+        guess (int): The expected value of the position, usually the value of
+            the previous iteration of `iterative_deepening_search`.
+        window (int): The half width of the window around `guess`, or None for
+            a full window.
+        table (TranspositionTable): An optional transposition table.
+        limits (SearchLimits): The search limits.
+        ordering (MoveOrdering): Optional move ordering.
+        evaluator (engine.Evaluator): Optional heuristic, see `negamax`.
 
     Returns:
-        tuple: A tuple containing the maximum utility value and the corresponding move.
-               The move is represented as a tuple containing the row and column indices
-               (starting from 1) on the board.
+        tuple: The value of the position for the player to move and the best
+        move, as returned by `alpha_beta_search`.
     """
-    p = player(state)  # Get the current player
+    alpha, beta = NEG_INF, INF
+    if window:
+        alpha, beta = guess - window, guess + window
 
-    # Check if the current state is terminal
-    if terminal(state):
-        # If terminal, return the utility value and no specific move
-        return utility(state, max_player), None
-
-    # Check if the search should be cut off at the specified depth
-    if is_cutoff(depth):
-        # If cut off, return the evaluated board score and no specific move
-        return evaluate_board(state, max_player), None
-
-    v = float('-inf')
-    move = None
-
-    for a in actions(state, p):
-
-        # Recursively call the min_value function to explore the opponent's moves
-        # and obtain the minimum utility value and corresponding move
-        v2, a2 = min_value(result(state, a), max_player, depth+1, alpha, beta)
+    while True:
+        value = negamax(state, 0, alpha, beta, table, limits, ordering, evaluator=evaluator)
 
+        # Outside the window the value is only a bound: open the window on that side
+        if value <= alpha != NEG_INF:
+            alpha = NEG_INF
+        elif value >= beta != INF:
+            beta = INF
+        else:
+            return value, limits.best_move
 
-        if v2 > v:
-            v, move = v2, a
-            alpha = max(alpha, v)
 
-        if v >= beta:
-            return v, move  # Prune
+def negamax(state, depth, alpha, beta, table=None, limits=None, ordering=None,
+            batch_leaves=False, evaluator=None):
+    """Evaluate a position for the player to move with Principal Variation Search.
 
-    return v, move
+    The `negamax` function explores the game tree from the point of view of the
+    player to move in every position: the value of a position is the greatest
+    of the values of its children for the opponent, negated. Values are
+    zero-sum, since `evaluate_board` and `utility` score a board for 'O' the
+    opposite of what they score it for 'X'.
 
+    When the player to move can complete a line, only that move is searched,
+    and when the opponent is about to complete one, only the moves that block
+    it (see `threat_cells`).
 
-def min_value(state, max_player, depth, alpha, beta):
-    """Evaluate the minimum value for the current state in the Minimax algorithm.
+    The first move of a position is searched with the whole alpha-beta window.
+    The other moves are first searched with a null window, which only tells
+    whether they are better than the best move so far, and searched again with
+    the whole window if they are. With good move ordering they seldom are, and
+    null window searches prune much more.
 
-    The `min_value` function represents the minimizing player's perspective in the
-    Minimax algorithm. It recursively explores the game tree to find the move that
-    minimizes the utility value for the minimizing player.
+    Values are fail-soft: a value at or below `alpha` is an upper bound of the
+    value of the position, a value at or above `beta` a lower bound, and a
+    value in between is exact.
 
     Args:
-        state (2D array): The current game board.
-        max_player (str): The symbol ('X' or 'O') of the maximizing player.
-        alpha (float): The alpha value for alpha-beta pruning.
-        beta (float): The beta value for alpha-beta pruning.
+        state (BitBoard): The current game board.
+        depth (int): The number of moves played from the root of the search.
+        alpha (float): The value the player to move can already reach elsewhere.
+        beta (float): The value the opponent can already hold the player to
+            move to elsewhere.
+        table (TranspositionTable): An optional transposition table.
+        limits (SearchLimits): Optional search limits. Defaults to cutting the
+            search off at `CUTOFF_DEPTH`. Required to get the best move back.
+        ordering (MoveOrdering): Optional move ordering. Moves are searched in
+            row-major order without it.
+        batch_leaves (bool): Whether to value the children of the positions
+            just above the cut-off depth together with `batch_leaf_values`
+            instead of one by one. Requires NumPy, and values the leaves with
+            `evaluate_board`.
+        evaluator (engine.Evaluator): Optional heuristic to value the
+            positions at the cut-off depth with, instead of `evaluate_board`.
 
     Returns:
-        tuple: A tuple containing the minimum utility value and the corresponding move.
-               The move is represented as a tuple containing the row and column indices
-               (starting from 1) on the board.
+        int: The value of the position for the player to move. At the root
+        (depth 0), the best move is left in `limits.best_move`.
     """
     p = player(state)  # Get the current player
 
+    max_depth = CUTOFF_DEPTH
+    stats = None
+    if limits is not None:
+        limits.count_node(depth)
+        max_depth = limits.max_depth
+        stats = limits.stats
+
     # Check if the current state is terminal
     if terminal(state):
-        # If terminal, return the utility value and no specific move
-        return utility(state, max_player), None
-    
+        if stats is not None:
+            stats.terminals += 1
+        return utility(state, p)
+
     # Check if the search should be cut off at the specified depth
-    if is_cutoff(depth):
-        # If cut off, return the evaluated board score and no specific move
-        return evaluate_board(state, max_player), None
+    if is_cutoff(depth, max_depth):
+        if stats is not None:
+            stats.leaves += 1
+        if evaluator is not None:
+            return evaluator.evaluate(state, p)
+        return evaluate_board(state, p)
+
+    # Reuse the stored result of the position, or at least search its best move first
+    best = None
+    if table is not None:
+        position = table_key(state)
+        stored, best = probe_table(table, state, position, max_depth - depth, alpha, beta)
+        if stored is not None:
+            if stats is not None:
+                stats.table_hits += 1
+            if depth == 0 and limits is not None:
+                limits.best_move = best
+            return stored
+        alpha_start = alpha
+
+    wins, blocks = threat_cells(state, p)
+    if wins:
+        # Completing a line is the best move there is
+        moves = mask_moves(wins & -wins, state.size)
+    elif blocks:
+        # Any move but a block loses at once
+        moves = mask_moves(blocks, state.size)
+    else:
+        moves = actions(state, p)
 
-    v = float('inf')
-    move = None
+        # With k-in-a-row rules, only search the cells near the symbols played so far
+        if state.win_length < state.size:
+            moves = nearby_moves(state, moves)
 
-    for a in actions(state, p):
+        # Near the root, skip moves that mirror an earlier move on a symmetric board
+        if depth <= SYMMETRY_DEPTH:
+            moves = unique_moves(state, moves)
 
-        # Recursively call the max_value function to explore the computer player's moves
-        # and obtain the maximum utility value and corresponding move
-        v2, a2 = max_value(result(state, a), max_player, depth + 1, alpha, beta)
+        if ordering is not None:
+            moves = ordering.order(state, moves, depth)
 
+    # Search the principal variation of the previous iteration first, then
+    # the best move stored in the transposition table
+    order_first(moves, best)
+    if limits is not None:
+        order_first(moves, limits.pv.get(state.key))
+
+    v = NEG_INF
+    move = None
 
-        if v2 < v:
-            v, move = v2, a
-            beta = min(beta, v)
+    if batch_leaves and depth + 1 == max_depth:
+        # Value all the leaves below this position at once
+        if limits is not None:
+            limits.nodes += len(moves)
+        if stats is not None:
+            stats.count_node(depth + 1, len(moves))
+            stats.leaves += len(moves)
+            stats.record_expansion(depth, len(moves))
+        values = batch_leaf_values(state, moves, p)
+        v = max(values)
+        move = moves[values.index(v)]
+    else:
+        for i, a in enumerate(moves):
+            state.make(a, p)
+            if i == 0:
+                v2 = -negamax(state, depth + 1, -beta, -alpha, table, limits, ordering,
+                              batch_leaves, evaluator)
+            else:
+                # Prove the move is no better than alpha with a null window
+                v2 = -negamax(state, depth + 1, -alpha - 1, -alpha, table, limits, ordering,
+                              batch_leaves, evaluator)
+                if alpha < v2 < beta:
+                    # It is better: search it again for its value
+                    v2 = -negamax(state, depth + 1, -beta, -alpha, table, limits, ordering,
+                                  batch_leaves, evaluator)
+            state.unmake(a)
+
+            if v2 > v:
+                v, move = v2, a
+            alpha = max(alpha, v2)
+
+            if alpha >= beta:
+                if ordering is not None:
+                    ordering.record_cutoff(p, a, depth, max_depth - depth, i == 0)
+                if stats is not None:
+                    stats.record_expansion(depth, i + 1, i)
+                break  # Prune
+        else:
+            if stats is not None:
+                stats.record_expansion(depth, len(moves))
 
-        if v <= alpha:
-            return v, move  # Prune
+    if table is not None:
+        store_table(table, state, position, max_depth - depth, v, move, alpha_start, beta)
+    if depth == 0 and limits is not None:
+        limits.best_move = move
 
-    return v, move
+    return v
 
 
 def evaluate_board(board, player):
@@ -428,12 +2482,20 @@ def evaluate_board(board, player):
     Evaluate the Tic-Tac-Toe board based on the specified heuristic.
 
     Args:
-        board (2D array): The current game board.
+        board (2D array or BitBoard): The current game board.
         player (str): The symbol of the player ('X' or 'O') for whom the evaluation is done.
 
     Returns:
         int: The heuristic score for the current board position.
     """
+    if isinstance(board, BitBoard):
+        # Scores are symmetric: a line is worth to 'O' the opposite of its worth to 'X'
+        score = board.score if player == 'X' else -board.score
+        if board.win_length < board.size:
+            # Threats add up over many windows; keep them below a win
+            score = max(1 - WIN_VALUE, min(WIN_VALUE - 1, score))
+        return score
+
     opponent = 'X' if player == 'O' else 'O'
     score = 0
 
@@ -488,6 +2550,659 @@ def get_all_lines(board):
     return lines
 
 
+# -------------------------------------------------------------------------------
+# Endgame solver.
+# With few empty cells left, searching to the end of the game is faster than
+# the heuristic search to its cut-off depth, and exact. The solver only tells
+# won, drawn and lost positions apart, proves them with null-window searches
+# and keeps what it proved in a cache of its own.
+# -------------------------------------------------------------------------------
+
+# The most empty cells the engine solves exactly instead of searching with
+# the heuristic, by board size (see `python benchmark.py --crossover`)
+ENDGAME_CELLS = {3: 7, 4: 9, 5: 9, 6: 10, 7: 11, 8: 12, 9: 12}
+
+# The most positions the cache of an `EndgameSolver` holds before it is cleared
+ENDGAME_CACHE_ENTRIES = 1 << 20
+
+
+def is_endgame(state):
+    """Check if few enough cells are left to solve a position exactly.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        bool: True if the number of empty cells is at most the threshold of
+        `ENDGAME_CELLS` for the board size.
+    """
+    return (state.full & ~state.occupied()).bit_count() <= ENDGAME_CELLS.get(state.size, 0)
+
+
+@functools.lru_cache(maxsize=None)
+def cell_line_masks(size, win_length=None):
+    """Precompute the bit masks of the lines through every cell of a board."""
+    lines = line_masks(size, win_length)
+    return tuple(tuple(lines[line] for line in through)
+                 for through in cell_lines(size, win_length))
+
+
+class EndgameSolver:
+    """Solve positions to the end of the game as won, drawn or lost.
+
+    Positions are searched as a pair of bit masks, the cells of the player to
+    move and those of the opponent, so neither the board nor its line counts
+    are updated on every move. A position is worth 1, 0 or -1 for the player
+    to move. Rather than searching for that value with a full window, the
+    solver first proves or refutes a win with a null window, and then a draw,
+    as MTD(f) does; null windows prune much more.
+
+    Positions are cached with the bounds proved on their value. The value of
+    a position does not depend on which symbol is to move, so 'X' and 'O'
+    positions share entries.
+
+    Attributes:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+        cache (dict): The (lower, upper) bounds proved on the value of the
+            positions, by (cells of the player to move, cells of the opponent).
+        max_entries (int): The most positions cached before the cache is cleared.
+        nodes (int): The number of positions searched so far.
+        stop (threading.Event): The event that ends the current solve when
+            another thread sets it, or None.
+    """
+
+    def __init__(self, size, win_length=None, max_entries=ENDGAME_CACHE_ENTRIES):
+        """
+        Args:
+            size (int): The dimension of the 2D game board.
+            win_length (int): The number of symbols in a row needed to win.
+                Defaults to the size of the board.
+            max_entries (int): The most positions to cache.
+        """
+        self.size = size
+        self.win_length = win_length or size
+        self.full = (1 << (size * size)) - 1
+        self.lines = line_masks(size, self.win_length)
+        self.masks = cell_line_masks(size, self.win_length)
+        self.cache = {}
+        self.max_entries = max_entries
+        self.nodes = 0
+        self.stop = None
+
+    def solve(self, state, stop=None):
+        """Solve a position.
+
+        Args:
+            state (2D array or BitBoard): The current game board.
+            stop (threading.Event): Optional event that ends the solve when
+                another thread sets it. Only the bounds of the positions that
+                were solved in full are kept in the cache.
+
+        Returns:
+            tuple: The value of the position for the player to move (1 for a
+            win, 0 for a draw, -1 for a loss) and a move keeping that value as
+            (row, col), or None for a finished game.
+
+        Raises:
+            SearchTimeout: If `stop` is set before the position is solved.
+        """
+        state = state if isinstance(state, BitBoard) else to_bitboard(state, self.win_length)
+        if terminal(state):
+            return utility(state, player(state)) // WIN_VALUE, None
+
+        self.stop = stop
+        try:
+            mine, theirs = (state.x, state.o) if player(state) == 'X' else (state.o, state.x)
+            value = self.value(mine, theirs)
+            win, moves = self._moves(mine, theirs)
+            if win:
+                return 1, divmod(win.bit_length() - 1, self.size)
+            for move in moves:
+                if -self.value(theirs, mine | move) == value:
+                    return value, divmod(move.bit_length() - 1, self.size)
+        finally:
+            self.stop = None
+
+    def value(self, mine, theirs):
+        """Return the value of a position for the player to move: 1, 0 or -1.
+
+        Args:
+            mine (int): Bit mask of the cells of the player to move.
+            theirs (int): Bit mask of the cells of the opponent.
+        """
+        if self._search(mine, theirs, 0, 1) >= 1:
+            return 1
+        return 0 if self._search(mine, theirs, -1, 0) >= 0 else -1
+
+    def _moves(self, mine, theirs):
+        """Find the moves worth searching in a position.
+
+        Returns:
+            tuple: The bit of a cell where the player to move completes a line,
+            or 0, and the bits of the cells to search otherwise: the cell
+            blocking the opponent's line if there is one, both cells if the
+            opponent threatens two, or else every empty cell.
+        """
+        masks = self.masks
+        empty = self.full & ~(mine | theirs)
+        moves = []
+        blocks = []
+        while empty:
+            low = empty & -empty
+            empty ^= low
+            ours, others = mine | low, theirs | low
+            block = False
+            for mask in masks[low.bit_length() - 1]:
+                if ours & mask == mask:
+                    return low, ()
+                if others & mask == mask:
+                    block = True
+            if block:
+                blocks.append(low)
+            moves.append(low)
+        return 0, blocks[:2] if blocks else moves
+
+    def _search(self, mine, theirs, alpha, beta):
+        """Search a position to the end of the game within an alpha-beta window.
+
+        Returns:
+            int: The fail-soft value of the position for the player to move.
+        """
+        self.nodes += 1
+        if self.stop is not None and self.nodes % SearchLimits.CLOCK_INTERVAL == 0 \
+                and self.stop.is_set():
+            raise SearchTimeout()
+        key = (mine, theirs)
+        entry = self.cache.get(key)
+        if entry is not None:
+            lower, upper = entry
+            if lower >= beta or lower == upper:
+                return lower
+            if upper <= alpha:
+                return upper
+            alpha, beta = max(alpha, lower), min(beta, upper)
+
+        win, moves = self._moves(mine, theirs)
+        if win:
+            return 1
+        if not moves:
+            return 0
+
+        # Once every line holds symbols of both players, nobody can win any more
+        for mask in self.lines:
+            if not (mine & mask and theirs & mask):
+                break
+        else:
+            return 0
+
+        alpha_start = alpha
+        best = -1
+        for move in moves:
+            value = -self._search(theirs, mine | move, -beta, -alpha)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        lower, upper = entry if entry is not None else (-1, 1)
+        if best <= alpha_start:
+            upper = min(upper, best)
+        elif best >= beta:
+            lower = max(lower, best)
+        else:
+            lower = upper = best
+        if len(self.cache) >= self.max_entries:
+            self.cache.clear()
+        self.cache[key] = (lower, upper)
+        return best
+
+
+# Solvers of this process, by board size and win length
+_endgame_solvers = {}
+
+
+def endgame_solver(size, win_length=None):
+    """Return the endgame solver shared by all the searches of this process.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        EndgameSolver: The solver of the board size and win length, with the
+        positions it solved before.
+    """
+    key = (size, win_length or size)
+    if key not in _endgame_solvers:
+        _endgame_solvers[key] = EndgameSolver(size, win_length)
+    return _endgame_solvers[key]
+
+
+def tablebase_move(state):
+    """Look a position up in the tablebase of its board size, if there is one.
+
+    Tablebases are built for 3x3 and 4x4 boards with whole-line rules (see
+    `tablebase.py`); the file of a board size is opened on first use.
+
+    Args:
+        state (BitBoard): The current game board.
+
+    Returns:
+        tuple: The value of the position for the player to move (WIN_VALUE,
+        0 or -WIN_VALUE) and its best move as (row, col), or None if there is
+        no tablebase for the board or the game is over.
+    """
+    if state.win_length != state.size:
+        return None
+
+    # Imported here since the tablebase module builds on this one
+    from tablebase import load_tablebase
+    tablebase = load_tablebase(state.size)
+    entry = tablebase.probe(state) if tablebase is not None else None
+    if entry is None or entry[0] is None:
+        return None
+    move, value = entry
+    return value, move
+
+
+# -------------------------------------------------------------------------------
+# Batch evaluation.
+# Many boards are scored at once with NumPy. Boards are stacked in an int8
+# array of shape (N, size, size) holding 1 for 'X', -1 for 'O' and 0 for an
+# empty cell.
+# -------------------------------------------------------------------------------
+def boards_to_array(boards):
+    """Stack game boards into an int8 array for `evaluate_boards`.
+
+    Args:
+        boards (list): Game boards, as 2D arrays or `BitBoard`s, all of the
+            same size.
+
+    Returns:
+        numpy.ndarray: An int8 array of shape (N, size, size).
+    """
+    boards = [to_board(board) if isinstance(board, BitBoard) else board for board in boards]
+    codes = {'X': 1, 'O': -1}
+    return np.array([[[codes.get(cell, 0) for cell in row] for row in board] for board in boards],
+                    dtype=np.int8)
+
+
+def bitboard_array(state):
+    """Return the cells of a `BitBoard` as a flat int8 array of 1, -1 and 0."""
+    cells = state.size * state.size
+    length = (cells + 7) // 8
+
+    def unpack(mask):
+        return np.unpackbits(np.frombuffer(mask.to_bytes(length, 'little'), dtype=np.uint8),
+                             bitorder='little')[:cells]
+
+    return unpack(state.x).astype(np.int8) - unpack(state.o).astype(np.int8)
+
+
+@functools.lru_cache(maxsize=None)
+def line_index_matrix(size, win_length=None):
+    """Precompute the flat cell indices of every line of a board.
+
+    Args:
+        size (int): The dimension of the 2D game board.
+        win_length (int): The number of symbols in a row needed to win.
+
+    Returns:
+        numpy.ndarray: An array of shape (lines, win_length); row `i` holds the
+        cells of line `i` of `line_masks`.
+    """
+    return np.array([[cell for cell in range(size * size) if mask >> cell & 1]
+                     for mask in line_masks(size, win_length)], dtype=np.intp)
+
+
+def evaluate_boards(boards, player, win_length=None):
+    """Evaluate a stack of boards at once.
+
+    The results are the same as calling `evaluate_board`, `check_win` and
+    `check_draw` on every board.
+
+    Args:
+        boards (numpy.ndarray): An int8 array of shape (N, size, size), see
+            `boards_to_array`.
+        player (str): The symbol of the player ('X' or 'O') for whom the
+            evaluation is done.
+        win_length (int): The number of symbols in a row needed to win.
+            Defaults to the size of the boards.
+
+    Returns:
+        tuple: Four arrays of length N: the heuristic scores, whether 'X' has
+        won, whether 'O' has won and whether the board is a draw.
+    """
+    count, size = boards.shape[0], boards.shape[1]
+    win_length = win_length or size
+    flat = boards.reshape(count, size * size)
+    lines = flat[:, line_index_matrix(size, win_length)]
+
+    x_counts = (lines == 1).sum(axis=2)
+    o_counts = (lines == -1).sum(axis=2)
+    table = np.asarray(line_scores(size, win_length), dtype=np.int64)
+    scores = table[x_counts, o_counts].sum(axis=1)
+    if player == 'O':
+        scores = -scores
+    if win_length < size:
+        scores = np.clip(scores, 1 - WIN_VALUE, WIN_VALUE - 1)
+
+    x_wins = (x_counts == win_length).any(axis=1)
+    o_wins = (o_counts == win_length).any(axis=1)
+    draws = (flat != 0).all(axis=1) & ~x_wins & ~o_wins
+
+    return scores, x_wins, o_wins, draws
+
+
+def batch_leaf_values(state, moves, max_player):
+    """Value all the children of a position just above the cut-off depth at once.
+
+    Every child is valued as `negamax` would value it: by its utility if the
+    game is over, or else by `evaluate_board`.
+
+    Args:
+        state (BitBoard): The current game board.
+        moves (list): The moves leading to the children.
+        max_player (str): The symbol ('X' or 'O') of the maximizing player.
+
+    Returns:
+        list: The values of the children, in the order of `moves`.
+    """
+    size = state.size
+    count = len(moves)
+    children = np.repeat(bitboard_array(state)[None, :], count, axis=0)
+    cells = np.array([r * size + c for r, c in moves], dtype=np.intp)
+    children[np.arange(count), cells] = 1 if player(state) == 'X' else -1
+
+    scores, x_wins, o_wins, draws = evaluate_boards(children.reshape(count, size, size),
+                                                    max_player, state.win_length)
+    wins, losses = (x_wins, o_wins) if max_player == 'X' else (o_wins, x_wins)
+    values = np.where(wins, WIN_VALUE, np.where(losses, -WIN_VALUE, np.where(draws, 0, scores)))
+
+    return values.tolist()
+
+
+# -------------------------------------------------------------------------------
+# Parallel root search.
+# The moves at the root are searched in separate processes. The best value
+# found so far is shared between the processes and used as the alpha bound of
+# the root moves that start after it was found.
+# -------------------------------------------------------------------------------
+
+# Shared `[value, move index]` of the best root move, set in every worker process
+_root_bound = None
+
+
+def _init_root_worker(bound):
+    """Install the shared root bound in a worker process."""
+    global _root_bound
+    _root_bound = bound
+
+
+def _search_root_move(state, index, move, depth):
+    """Search one root move in a worker process.
+
+    Returns:
+        tuple: The index of the move, its value and whether the value is exact
+        (otherwise it is an upper bound at or below the best value of an
+        earlier or equally good root move).
+    """
+    with _root_bound.get_lock():
+        best_value, best_index = _root_bound[0], _root_bound[1]
+
+    # Ties go to the earlier move, as in the serial search, so an earlier
+    # move has to prove it is at least as good as the best one, not better
+    alpha = best_value - 1 if index < best_index else best_value
+
+    state.make(move)
+    value = -negamax(state, 1, float('-inf'), -alpha, limits=SearchLimits(max_depth=depth))
+
+    exact = value > alpha
+    if exact:
+        with _root_bound.get_lock():
+            if value > _root_bound[0] or (value == _root_bound[0] and index < _root_bound[1]):
+                _root_bound[0], _root_bound[1] = value, index
+
+    return index, value, exact
+
+
+class RootSearchPool:
+    """A pool of worker processes for `parallel_alpha_beta_search`.
+
+    Starting processes is slow, so a pool can be kept open across searches:
+
+        with RootSearchPool() as pool:
+            value, move = parallel_alpha_beta_search(board, pool=pool)
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers (int): The number of worker processes. Defaults to the
+                number of CPU cores.
+        """
+        self.workers = workers or os.cpu_count()
+        self.bound = multiprocessing.Array('d', 2)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_root_worker,
+                                            initargs=(self.bound,))
+
+    def close(self):
+        """Shut the worker processes down."""
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parallel_alpha_beta_search(state, depth=CUTOFF_DEPTH, pool=None, workers=None):
+    """Get the optimal move for the computer player, searching the root moves in parallel.
+
+    The `parallel_alpha_beta_search` function returns exactly the same value and
+    move as `alpha_beta_search` searching to the same depth without a
+    transposition table or move ordering.
+
+    Args:
+        state (2D array or BitBoard): The current game board.
+        depth (int): The depth at which the search is cut off.
+        pool (RootSearchPool): An optional pool of worker processes. A pool is
+            started and shut down for this search when it is not given.
+        workers (int): The number of worker processes of that pool.
+
+    Returns:
+        tuple: A tuple containing the utility value of the best move and the
+               corresponding move itself, as returned by `alpha_beta_search`.
+    """
+    state = to_bitboard(state)
+    max_player = player(state)
+
+    if terminal(state) or depth == 0 or is_endgame(state) or tablebase_move(state) is not None:
+        return alpha_beta_search(state, limits=SearchLimits(max_depth=depth))
+    forced = forced_move(state)
+    if forced is not None:
+        if forced[0] is None:
+            # Only the block is searched, which leaves nothing to share out
+            return alpha_beta_search(state, limits=SearchLimits(max_depth=depth))
+        return forced
+
+    moves = actions(state, max_player)
+    if state.win_length < state.size:
+        moves = nearby_moves(state, moves)
+    moves = unique_moves(state, moves)
+
+    own_pool = pool is None
+    if own_pool:
+        pool = RootSearchPool(workers)
+    try:
+        with pool.bound.get_lock():
+            pool.bound[0], pool.bound[1] = float('-inf'), float('inf')
+        futures = [pool.executor.submit(_search_root_move, state, index, move, depth)
+                   for index, move in enumerate(moves)]
+        results = [future.result() for future in futures]
+    finally:
+        if own_pool:
+            pool.close()
+
+    # The best exact value wins; ties go to the earliest move
+    value, index = max((value, -index) for index, value, exact in results if exact)
+    return value, moves[-index]
+
+
+# -------------------------------------------------------------------------------
+# Pondering.
+# While the human thinks about a move, a background thread searches the
+# positions after the replies the computer expects. These searches share the
+# transposition table, move ordering and position cache of the game, so a
+# reply that was only partly pondered is still searched faster afterwards.
+# -------------------------------------------------------------------------------
+
+# The most replies pondered on, most likely first
+PONDER_REPLIES = 4
+
+
+class Ponderer:
+    """Search the likely replies of the opponent on the opponent's time.
+
+    Call `start` with the position the opponent is to move in, and `search`
+    once they moved: it stops pondering and returns the pondered result when
+    the position was searched for the whole move budget, or searches for the
+    rest of the budget when it was searched for part of it.
+
+    Attributes:
+        time_ms (float): The time budget of a move in milliseconds.
+        replies (int): The most replies pondered on.
+        results (dict): The pondered searches, by canonical key of the
+            position: value, best move on the canonical board, time pondered
+            in milliseconds and whether the search completed.
+        moves (int): Moves searched with `search`.
+        hits (int): Moves answered by a completed pondered search.
+        partial_hits (int): Moves whose position was pondered for part of
+            the budget.
+        saved_ms (float): Search time saved by pondering, in milliseconds.
+    """
+
+    def __init__(self, time_ms=MOVE_TIME_MS, table=None, ordering=None, cache=None,
+                 replies=PONDER_REPLIES):
+        """
+        Args:
+            time_ms (float): The time budget of a move in milliseconds.
+            table (TranspositionTable): The transposition table of the game.
+            ordering (MoveOrdering): The move ordering of the game.
+            cache (PositionCache): An optional cache of search results.
+            replies (int): The most replies to ponder on.
+        """
+        self.time_ms = time_ms
+        self.table = table if table is not None else TranspositionTable()
+        self.ordering = ordering if ordering is not None else MoveOrdering()
+        self.cache = cache
+        self.replies = replies
+        self.results = {}
+        self.thread = None
+        self.stop_event = None
+        self.moves = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.saved_ms = 0.0
+
+    def start(self, state):
+        """Start pondering in the background.
+
+        Args:
+            state (BitBoard): The current game board, with the opponent to move.
+        """
+        self.stop()
+        self.results = {}
+        if terminal(state):
+            return
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(state.copy(), self.stop_event),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop pondering and wait for the background search to end."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def search(self, state, stats=None):
+        """Get the best move of a position, using what was pondered.
+
+        Args:
+            state (BitBoard): The current game board, after the opponent's move.
+            stats (SearchStats): Optional statistics to record the search in.
+
+        Returns:
+            tuple: The value of the best move and the move, as returned by
+            `iterative_deepening_search`.
+        """
+        self.stop()
+        self.moves += 1
+        time_ms = self.time_ms
+
+        key, index = canonical_key(state)
+        entry = self.results.get(key)
+        if entry is not None:
+            value, move, pondered_ms, completed = entry
+            if completed:
+                self.hits += 1
+                self.saved_ms += min(pondered_ms, time_ms)
+                return value, transform_move(move, inverse_symmetries(state.size)[index],
+                                             state.size)
+            self.partial_hits += 1
+            self.saved_ms += pondered_ms
+            time_ms = max(1.0, time_ms - pondered_ms)
+
+        return iterative_deepening_search(state, time_ms, table=self.table, ordering=self.ordering,
+                                          stats=stats, cache=self.cache)
+
+    def hit_rate(self):
+        """Return the share of moves whose position was pondered on, even partly."""
+        return (self.hits + self.partial_hits) / self.moves if self.moves else 0.0
+
+    def _run(self, state, stop):
+        """Ponder on the likely replies in turn until stopped."""
+        p = player(state)
+        forced = forced_move(state)
+        if forced is not None:
+            replies = [forced[1]]
+        else:
+            replies = actions(state, p)
+            if state.win_length < state.size:
+                replies = nearby_moves(state, replies)
+            replies = self.ordering.order(state, unique_moves(state, replies), 0)
+
+            # The reply the last search expected comes first
+            for _, move in principal_variation(state, self.table, 1):
+                order_first(replies, move)
+
+        for reply in replies[:self.replies]:
+            state.make(reply, p)
+            if not terminal(state):
+                start = time.perf_counter()
+                try:
+                    value, move = iterative_deepening_search(state, self.time_ms,
+                                                             table=self.table,
+                                                             ordering=self.ordering,
+                                                             cache=self.cache, stop=stop)
+                except SearchTimeout:
+                    # Stopped before the first iteration completed: nothing to keep
+                    return
+                pondered_ms = (time.perf_counter() - start) * 1000
+                key, index = canonical_key(state)
+                self.results[key] = (value, transform_move(move, symmetries(state.size)[index],
+                                                           state.size),
+                                     pondered_ms, not stop.is_set())
+            state.unmake(reply)
+            if stop.is_set():
+                return
+
 
 def human_vs_computer_game_loop():
     """Run the Human vs Computer loop for a tic-tac-toe game.
@@ -502,39 +3217,118 @@ def human_vs_computer_game_loop():
     Returns:
         None
     """
-    board_size = int(input("Enter the size of the board (3 to 9): "))
+    board_size = int(input("Enter the size of the board (3 to 15): "))
     board = intialize_board(board_size)
+    win_length = get_win_length(board_size)
 
     human_symbol = input("Choose you symbol (X or O): ").upper()
     computer_symbol = 'X' if human_symbol == 'O' else 'O'
 
+    # Monte Carlo tree search needs no evaluation heuristic, which suits large boards
+    engine = input("Choose the computer player: alpha-beta or Monte Carlo tree search "
+                   "(A or M, Enter for A): ").strip().upper()
+
     current_player = 'X'
 
     count = 0
 
+    # Positions searched for one move are likely to come up again in the next ones,
+    # and whole searches in the next games
+    table = TranspositionTable()
+    ordering = MoveOrdering()
+    cache = position_cache()
+    cache_path = default_cache_path()
+    if not len(cache) and os.path.exists(cache_path):
+        try:
+            cache.load(cache_path)
+        except ValueError:
+            pass
+
+    # Imported here since the opening book and tablebase modules build on this one
+    from openingbook import load_opening_book
+    from tablebase import load_tablebase
+    # The searches answer from the tablebase, which makes the book unneeded
+    book = None
+    solved = win_length == board_size and load_tablebase(board_size) is not None
+    if win_length == board_size and not solved:
+        book = load_opening_book(board_size)
+
+    mcts = None
+    if engine == 'M':
+        # The tree search keeps its tree from one move to the next
+        from mcts import MCTS
+        mcts = MCTS()
+
+    # Search the human's likely replies while they think, unless the
+    # tablebase answers every move
+    ponderer = Ponderer(MOVE_TIME_MS, table, ordering, cache)
+    pondering = mcts is None and not solved
+
+    # Keep a record of the game; the writer appends it to the file in the background
+    from gamerecord import RecordWriter, default_record_path
+    writer = RecordWriter(default_record_path())
+    record = {'size': board_size, 'win_length': win_length,
+              'x': 'human' if human_symbol == 'X' else 'computer',
+              'o': 'human' if human_symbol == 'O' else 'computer',
+              'moves': [], 'times_ms': [], 'stats': [], 'winner': None}
+
     while True:
         # print(f"Available Moves for {player(board)}: {actions(board, player(board))}")
         display_board(board)
 
+        start = time.perf_counter()
+        move_stats = None
         if current_player == human_symbol:
+            if pondering:
+                ponderer.start(to_bitboard(board, win_length))
             row, col = get_user_move(board)
+            ponderer.stop()
         else:
 
-            # Make some random moves to avoid evaluating an empty board at the start of the game.
-            # This is a temporary solution; ideally, replace this with an open game database.
-            if count < (board_size - 2) * 2:    
+            # Play the opening from the book; the search answers solved positions
+            # from the tablebase. Without either for this board size, make some
+            # random moves to avoid evaluating an empty board at the start of the
+            # game. With k-in-a-row rules the evaluation sees threats from the
+            # first moves on.
+            book_move = None
+            if book is not None:
+                book_move = book.lookup(board)
+
+            # Wins, forced blocks and forks need no search
+            forced = None
+            if book_move is None:
+                forced = forced_move(to_bitboard(board, win_length))
+
+            if book_move is not None:
+                row, col = book_move
+            elif forced is not None:
+                value, (row, col) = forced
+                move_stats = [0, 0, value]
+            elif mcts is not None:
+                value, (row, col) = mcts.search(to_bitboard(board, win_length), MOVE_TIME_MS)
+                move_stats = [mcts.playouts, 0, None]
+            elif book is None and not solved and win_length == board_size \
+                    and count < (board_size - 2) * 2:
                 row, col = get_random_computer_move(board)
             else:
-                value, (row, col) = alpha_beta_search(board)
+                stats = SearchStats()
+                value, (row, col) = ponderer.search(to_bitboard(board, win_length), stats)
+                depth = max((search['depth'] for search in stats.searches
+                             if search['completed']), default=0)
+                move_stats = [stats.nodes, depth, value]
             print(f"Computer played in cell ({row + 1}, {col + 1})")
 
         make_move(board, row, col, current_player)
+        record['moves'].append([row, col])
+        record['times_ms'].append(round((time.perf_counter() - start) * 1000, 3))
+        record['stats'].append(move_stats)
 
-        if check_win(board, current_player):
+        if check_win(board, current_player, win_length):
             display_board(board)
             print(f"Player {current_player} wins!")
+            record['winner'] = current_player
             break
-        elif check_draw(board):
+        elif check_draw(board, win_length):
             display_board(board)
             print("It is a draw!")
             break
@@ -543,11 +3337,21 @@ def human_vs_computer_game_loop():
 
         current_player = 'O' if current_player =='X' else 'X'
 
+    writer.write(record)
+    if pondering and ponderer.moves:
+        print(f"Pondering: {ponderer.hits + ponderer.partial_hits} of {ponderer.moves} "
+              f"searches pondered ({ponderer.hits} in full), "
+              f"{ponderer.saved_ms / 1000:.1f}s saved")
+
+    # Start the next run with the searches of this game
+    cache.save(cache_path)
+    writer.close()
+
 def human_vs_human_game_loop():
     """
     Run a game loop for a Tic-Tac-Toe game where two human players compete against each other.
 
-    This function initializes the game board based on user input for size (between 3x3 to 9x9),
+    This function initializes the game board based on user input for size (between 3x3 to 15x15),
     lets each player choose their symbol ('X' or 'O'), and alternates turns between the two
     players. The game continues until one player wins by aligning their symbols vertically,
     horizontally, or diagonally without any breaks, or until the game board is full and the game
@@ -561,8 +3365,9 @@ def human_vs_human_game_loop():
         None
     """
     
-    board_size = int(input("Enter the size of the board (3 to 9): "))
+    board_size = int(input("Enter the size of the board (3 to 15): "))
     board = intialize_board(board_size)
+    win_length = get_win_length(board_size)
 
     human_symbol1 = input("Choose you symbol for the first player (X or O): ").upper()
     # human_symbol2 = 'X' if human_symbol1 == 'O' else 'O'
@@ -572,6 +3377,11 @@ def human_vs_human_game_loop():
 
     current_player = 'X'
 
+    from gamerecord import RecordWriter, default_record_path
+    writer = RecordWriter(default_record_path())
+    names = {human_symbol1: human_name1, 'O' if human_symbol1 == 'X' else 'X': human_name2}
+    record = {'size': board_size, 'win_length': win_length, 'x': names.get('X'),
+              'o': names.get('O'), 'moves': [], 'times_ms': [], 'winner': None}
 
     count = 0
 
@@ -579,7 +3389,10 @@ def human_vs_human_game_loop():
         display_board(board)
 
         # get a move
+        start = time.perf_counter()
         row, col = get_user_move(board)
+        record['moves'].append([row, col])
+        record['times_ms'].append(round((time.perf_counter() - start) * 1000, 3))
 
         if current_player == human_symbol1:
             print(f"{human_name1} played in cell ({row+1}, {col+1})")
@@ -588,16 +3401,17 @@ def human_vs_human_game_loop():
 
         make_move(board, row, col, current_player)
 
-        if check_win(board, current_player):
+        if check_win(board, current_player, win_length):
             display_board(board)
 
             if current_player == human_symbol1:
                 print(f"{human_name1} wins!")
             else:
                 print(f"{human_name2} wins!")
+            record['winner'] = current_player
             break
 
-        elif check_draw(board):
+        elif check_draw(board, win_length):
             display_board(board)
             print("It is a draw!")
             break
@@ -606,6 +3420,9 @@ def human_vs_human_game_loop():
 
         current_player = 'O' if current_player =='X' else 'X'
 
+    writer.write(record)
+    writer.close()
+
 def test_eval_board():
 
      # Boards where 'X' has the advantage